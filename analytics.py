@@ -1,36 +1,164 @@
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import date, datetime
+from profiling import profiled
+from habit_manager import HabitCollection, add_change_hook, streak_deadline, extend_run, extend_current_run, period_index, period_ordinal, period_label, EPOCH_ORDINAL, MICROSECONDS_PER_DAY, PERIODS
 
+ANALYTICS_CACHE_SIZE = 4096 # Number of per-habit results kept before the least recently used are evicted
+
+class AnalyticsCache:
+    '''
+    Least-recently-used cache of per-habit analytics results, with hit and miss counters.
+
+    Results are keyed on the habit's version, periodicity, start date and completion count, and on the current
+    date, as streaks and rates depend on it. Every habit object has its own version, renewed by complete_habit
+    and edit_habit, so a changed habit never matches an old key; the change hooks of those functions also drop
+    the habit's old entries right away, so they do not take up room until they are evicted.
+
+    Versions only identify habits within a process, so entries saved next to a store (see
+    data_storage.load_analytics_cache) are keyed on the habit's name and the checksum of its completions
+    instead, and are adopted by the matching habit of that store on first lookup. Results computed from
+    completion counts alone, without the completions, are not saved, as they cannot be checked that way.
+    '''
+    def __init__(self, max_entries=ANALYTICS_CACHE_SIZE):
+        '''
+        Initialize an empty AnalyticsCache.
+
+        Args:
+            max_entries (int, optional): Number of results kept before the least recently used are evicted.
+        '''
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # (kind, version, periodicity, start date, completion count, date) -> (result, habit name, checksum)
+        self.keys_by_version = {}
+        self.saved_entries = {} # Entries loaded from a store, keyed on the habit name and checksum instead of its version
+        self.hits = 0
+        self.misses = 0
+        self.changed = False
+
+    def lookup(self, kind, habit, compute, completion_count=None):
+        '''
+        Return a cached result for a habit, computing and caching it on a miss.
+
+        Args:
+            kind (str): The kind of result, such as 'current_streak'.
+            habit (Habit): The habit the result is for.
+            compute (callable): Computes the result when it is not cached.
+            completion_count (int, optional): The habit's completion count, if its completions are not loaded.
+
+        Returns:
+            The cached or computed result.
+        '''
+        checksum = None # Completions not loaded: the result is neither adopted from nor saved next to the store
+        if completion_count is None:
+            completion_count = len(habit.completions)
+            checksum = habit.checksum
+        today = date.today()
+        key = (kind, habit.version, habit.periodicity, habit.start_date, completion_count, today)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.changed = True # The counters are saved too
+            self.entries.move_to_end(key)
+            return entry[0]
+
+        saved_key = (kind, habit.name, checksum, habit.periodicity, habit.start_date.isoformat(), completion_count, today.isoformat())
+        if checksum is not None and saved_key in self.saved_entries:
+            self.hits += 1
+            value = self.saved_entries.pop(saved_key)
+        else:
+            self.misses += 1
+            value = compute()
+        self._store(key, value, habit.name, checksum)
+        return value
+
+    def _store(self, key, value, name, checksum):
+        '''Add a result, evicting the least recently used one if the cache is full.'''
+        self.entries[key] = (value, name, checksum)
+        self.keys_by_version.setdefault(key[1], []).append(key)
+        self.changed = True
+        if len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            keys = self.keys_by_version[evicted[1]]
+            keys.remove(evicted)
+            if not keys:
+                del self.keys_by_version[evicted[1]]
+
+    def invalidate(self, habit, previous_version):
+        '''
+        Drop the cached results of a habit's previous version. Registered as a change hook, so it runs whenever a habit is completed or edited.
+
+        Args:
+            habit (Habit): The habit that changed.
+            previous_version (int): The version of the habit before the change.
+        '''
+        for key in self.keys_by_version.pop(previous_version, ()):
+            self.entries.pop(key, None)
+            self.changed = True
+
+    def clear(self):
+        '''Drop all cached results and reset the hit and miss counters.'''
+        self.entries.clear()
+        self.keys_by_version.clear()
+        self.saved_entries.clear()
+        self.hits = self.misses = 0
+        self.changed = True
+
+    def to_dictionary(self):
+        '''
+        Convert the cache to a dictionary, useful for saving it next to a store.
+
+        Returns:
+            dict: The hit and miss counters and today's entries, keyed on habit names and checksums, least recently used first.
+        '''
+        today = date.today().isoformat()
+        entries = [[list(key), value] for key, value in self.saved_entries.items() if key[-1] == today]
+        entries += [[list(key), value] for key, value in self._saved_form() if key[-1] == today]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries[-self.max_entries:]}
+
+    def _saved_form(self):
+        '''Yield the in-memory entries that can be saved, as (saved key, result) pairs.'''
+        for (kind, _, periodicity, start_date, completion_count, day), (value, name, checksum) in self.entries.items():
+            if checksum is not None:
+                yield (kind, name, checksum, periodicity, start_date.isoformat(), completion_count, day.isoformat()), value
+
+    def update_from_dictionary(self, cache_dict):
+        '''
+        Take over the counters and entries of a cache saved next to a store. They replace those loaded before,
+        as the saved counters already include the lookups of this process up to its last save; entries from
+        previous days, saved without a checksum by older versions, or already held in memory are skipped.
+
+        Args:
+            cache_dict (dict): A dictionary created by to_dictionary.
+        '''
+        today = date.today().isoformat()
+        held = {key for key, _ in self._saved_form()}
+        self.hits = cache_dict.get('hits', 0)
+        self.misses = cache_dict.get('misses', 0)
+        self.saved_entries = {}
+        for key, value in cache_dict.get('entries', []):
+            key = tuple(key)
+            if len(key) == 7 and key[-1] == today and key not in held:
+                self.saved_entries[key] = value
+        self.changed = False
+
+
+analytics_cache = AnalyticsCache()
+add_change_hook(analytics_cache.invalidate)
+
+@profiled
 def streak_calc(habit):
     '''
     Calculate the current streak of a habit.
 
+    The streak is maintained incrementally by the habit as completions are recorded, and the result is cached
+    in analytics_cache until the habit changes.
+
     Args:
         habit (object): Habit object containing habit information and completions.
 
     Returns:
         int: Current streak of the habit.
     '''
-    # If habit has no completions, return streak as 0
-    if len(habit.completions) == 0:
-        return 0
-
-    current_date = datetime.now().date()
-    current_streak = 0
-    streak_increment = 1 if habit.periodicity == 'daily' else 7
-
-    for completion_date in reversed(habit.completions): # Iterate through completions in reverse order
-        if isinstance(completion_date, str):
-            completion_date = datetime.strptime(completion_date, '%Y-%m-%dT%H:%M:%S').date()
-        else:
-            completion_date = completion_date.date()
-
-        if (current_date - completion_date).days > streak_increment: # If the habit was not completed the previous day or week, break
-            break
-
-        current_streak += 1 # Increment streak if habit was completed the previous day or week
-        current_date = completion_date
-
-    return current_streak
+    return analytics_cache.lookup('current_streak', habit, lambda: habit.current_streak(datetime.now().date()))
 
 def get_all_habits(habit_list):
     '''
@@ -50,49 +178,34 @@ def habits_filter(habit_list, periodicity):
     Filter habits by their periodicity.
 
     Args:
-        habit_list (list): List of all habits.
+        habit_list (list or HabitCollection): List of all habits.
         periodicity (str): The periodicity to filter habits by.
 
     Returns:
         list: Habits with the given periodicity.
     '''
+    if isinstance(habit_list, HabitCollection): # Use the periodicity index instead of scanning
+        return habit_list.with_periodicity(periodicity)
     return list(filter(lambda habit: habit.periodicity == periodicity, habit_list))
 
 
+@profiled
 def calculate_longest_streak(habit):
     '''
     Calculate the longest streak of a habit.
 
+    The streak is maintained incrementally by the habit as completions are recorded, and the result is cached
+    in analytics_cache until the habit changes.
+
     Args:
         habit (object): Habit object containing habit information and completions.
 
     Returns:
         int: Longest streak of the habit.
     '''
-    longest_streak = current_streak = 1
-
-    completions = sorted([datetime.fromisoformat(completion) if isinstance(completion, str) else completion for completion in habit.completions])
-
-    if habit.periodicity == 'daily': # If the habit is to be completed daily, increment current_streak if the habit was completed on consecutive days
-        for i in range(1, len(completions)):
-            if completions[i].date() - completions[i-1].date() == timedelta(days=1):
-                current_streak += 1
-            else:
-                current_streak = 1
-
-            longest_streak = max(longest_streak, current_streak)
-
-    elif habit.periodicity == 'weekly': # If the habit is to be completed weekly, increment current_streak if the habit was completed on consecutive weeks
-        for i in range(1, len(completions)):
-            if completions[i].date() - completions[i-1].date() == timedelta(days=7):
-                current_streak += 1
-            else:
-                current_streak = 1
-
-            longest_streak = max(longest_streak, current_streak)
-
-    return longest_streak
+    return analytics_cache.lookup('longest_streak', habit, habit.longest_streak)
 
+@profiled
 def longest_streak_all_habits(habit_list):
     '''
     Determine the habit with the longest streak.
@@ -107,12 +220,64 @@ def longest_streak_all_habits(habit_list):
     return max(streaks, key=lambda x: x[1])
 
 
-def calculate_completion_rates(habit_list):
+def completed_weeks(habit):
+    '''
+    List the ISO weeks in which a habit was completed, from its per-week rollup.
+
+    Args:
+        habit (object): Habit object containing habit information and completions.
+
+    Returns:
+        list: The numbers (see period_index) of the weeks with at least one completion, in order.
+    '''
+    start, counts = habit.rollups.counts('week')
+    return [start + offset for offset, count in enumerate(counts) if count]
+
+
+def completion_rate(habit, completion_count, weeks=None):
     '''
-    Calculate the completion rates for all habits.
+    Calculate the completion rate of a habit: the share of the periods since it started in which it was completed.
+
+    Daily habits count their completions against the days since the start date. Weekly habits count the
+    ISO weeks with a completion against the ISO weeks since the week of the start date, so extra
+    completions within a week do not raise the rate above 100%.
+
+    Args:
+        habit (object): Habit object containing habit information.
+        completion_count (int): Number of completions of the habit.
+        weeks (iterable, optional): The weeks with a completion, as returned by completed_weeks. Defaults to
+            reading them from the habit's rollups.
+
+    Returns:
+        float: Completion rate of the habit.
+    '''
+    today = datetime.now().date()
+    total_days = (today - habit.start_date.date()).days + 1
+
+    if habit.periodicity == 'daily':
+        return (completion_count / total_days) * 100
+
+    elif habit.periodicity == 'weekly':
+        first_week = period_index(habit.start_date.toordinal(), 'week')
+        last_week = period_index(today.toordinal(), 'week')
+        if last_week < first_week:
+            return 0
+        if weeks is None:
+            weeks = completed_weeks(habit)
+        return (sum(first_week <= week <= last_week for week in weeks) / (last_week - first_week + 1)) * 100
+
+    return 0 # If the habit is not daily or weekly, set the completion rate to 0
+
+@profiled
+def calculate_completion_rates(habit_list, completion_counts=None, weeks=None):
+    '''
+    Calculate the completion rates for all habits, using cached rates for habits that have not changed.
 
     Args:
         habit_list (list): List of Habit objects, each representing a habit.
+        completion_counts (dict, optional): Completion counts by habit name, used instead of counting each habit's completions.
+        weeks (dict, optional): The weeks with a completion (see completed_weeks) by habit name, used instead of
+            reading the rollups of weekly habits.
 
     Returns:
         list: A list of dictionaries, each containing a habit's name and its corresponding completion rate.
@@ -120,24 +285,238 @@ def calculate_completion_rates(habit_list):
     rates = []
 
     for habit in habit_list:
-        total_days = (datetime.now().date() - habit.start_date.date()).days + 1
+        completion_count = completion_counts[habit.name] if completion_counts is not None else len(habit.completions)
+        rates.append({
+            'habit_name': habit.name,
+            'completion_rate': analytics_cache.lookup(
+                'completion_rate', habit, lambda: completion_rate(habit, completion_count, None if weeks is None else weeks.get(habit.name, ())),
+                None if completion_counts is None else completion_count, # Only passed when the completions are not loaded
+            )
+        })
 
-        if habit.periodicity == 'daily':
-            completion_rate = (len(habit.completions) / total_days) * 100 
+    return rates
 
-        elif habit.periodicity == 'weekly':
-            total_weeks = total_days // 7
-            if total_days % 7 > 0:
-                total_weeks += 1
+def window_day_ordinals(habit, start, end):
+    '''
+    Find the completions of a habit dated within a date range, by binary search over its completions.
+
+    Takes O(log n + k) time for a habit with n completions, k of them in the range.
 
-            completion_rate = (len(habit.completions) / total_weeks) * 100 if total_weeks > 0 else 0
+    Args:
+        habit (object): Habit object containing habit information and completions.
+        start (date): The first day of the range.
+        end (date): The last day of the range, included.
 
+    Returns:
+        list: The day ordinals of the completions in the range, in chronological order.
+    '''
+    low, high = habit.completions.find(
+        (start.toordinal() - EPOCH_ORDINAL) * MICROSECONDS_PER_DAY,
+        (end.toordinal() + 1 - EPOCH_ORDINAL) * MICROSECONDS_PER_DAY,
+    )
+    return [EPOCH_ORDINAL + timestamp // MICROSECONDS_PER_DAY for timestamp in habit.completions.timestamps[low:high]]
+
+@profiled
+def windowed_statistics(habit, start, end):
+    '''
+    Calculate the completion count, completion rate and streaks of a habit within a date range.
+
+    The rate counts the periods of the range from the habit's start date on, like calculate_completion_rates.
+    The longest streak is the longest run (see extend_run) within the range, like calculate_longest_streak;
+    the current streak is the run (see extend_current_run) still going at the end of the range, like streak_calc.
+
+    Args:
+        habit (object): Habit object containing habit information and completions.
+        start (date): The first day of the range.
+        end (date): The last day of the range, included.
+
+    Returns:
+        dict: The habit's name, the range, and its completion count, completion rate, current streak and longest streak in the range.
+    '''
+    ordinals = window_day_ordinals(habit, start, end)
+
+    longest_streak = run = current_run = 0
+    for index, ordinal in enumerate(ordinals):
+        previous = ordinals[index - 1] if index else None
+        run = extend_run(run, previous, ordinal, habit.periodicity)
+        current_run = extend_current_run(current_run, previous, ordinal, habit.periodicity)
+        longest_streak = max(longest_streak, run)
+
+    current_streak = current_run if ordinals and end.toordinal() <= streak_deadline(ordinals[-1], habit.periodicity) else 0
+
+    first_day = max(start, habit.start_date.date())
+    total_days = (end - first_day).days + 1
+    if total_days <= 0:
+        rate = 0
+    elif habit.periodicity == 'daily':
+        rate = len(ordinals) / total_days * 100
+    elif habit.periodicity == 'weekly':
+        first_week = period_index(first_day.toordinal(), 'week')
+        weeks = {period_index(ordinal, 'week') for ordinal in ordinals}
+        rate = sum(week >= first_week for week in weeks) / (period_index(end.toordinal(), 'week') - first_week + 1) * 100
+    else:
+        rate = 0
+
+    return {
+        'habit_name': habit.name,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'completion_count': len(ordinals),
+        'completion_rate': rate,
+        'current_streak': current_streak,
+        'longest_streak': longest_streak,
+    }
+
+@profiled
+def completion_counts(habit, start, end, period='day'):
+    '''
+    Count the completions of a habit in each day, ISO week or month of a date range.
+
+    The counts are read from the habit's rollups; a week or month cut by either end of the range is summed
+    from the rollup's day counts instead, so only completions within the range are counted.
+
+    Args:
+        habit (object): Habit object containing habit information and completions.
+        start (date): The first day of the range.
+        end (date): The last day of the range, included.
+        period (str, optional): 'day', 'week' (ISO weeks, labelled like '2023-W05') or 'month'. Defaults to 'day'.
+
+    Returns:
+        list: (period label, completion count) tuples for every period overlapping the range, including empty ones.
+
+    Raises:
+        ValueError: If the period is not supported.
+    '''
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period '{period}'. Supported periods are: {', '.join(PERIODS)}.")
+
+    rollups = habit.rollups
+    first, last = start.toordinal(), end.toordinal()
+    buckets = []
+    for index in range(period_index(first, period), period_index(last, period) + 1):
+        bucket_first, bucket_last = period_ordinal(index, period), period_ordinal(index + 1, period) - 1
+        if first <= bucket_first and bucket_last <= last:
+            completion_count = rollups.count(period, index)
         else:
-            completion_rate = 0 # If the habit is not daily or weekly, set the completion rate to 0
+            completion_count = rollups.total(max(first, bucket_first), min(last, bucket_last))
+        buckets.append((period_label(index, period), completion_count))
+    return buckets
 
-        rates.append({
+@profiled
+def completion_heatmap(habit, end=None, weeks=12):
+    '''
+    Lay out the daily completion counts of a habit as a calendar of weeks, read from its rollups.
+
+    Args:
+        habit (object): Habit object containing habit information and completions.
+        end (date, optional): The last day shown. Defaults to today.
+        weeks (int, optional): Number of weeks shown, ending with the week of the end date. Defaults to 12.
+
+    Returns:
+        dict: The habit's name, the first Monday shown, the end date, and 'weeks': one list of seven daily counts
+            (Monday to Sunday) per week, with None for days after the end date.
+    '''
+    last = (end or datetime.now().date()).toordinal()
+    first = period_ordinal(period_index(last, 'week') - weeks + 1, 'week')
+    start, day_counts = habit.rollups.counts('day')
+    days = [day_counts[ordinal - start] if 0 <= ordinal - start < len(day_counts) else 0 for ordinal in range(first, last + 1)]
+    days += [None] * (weeks * 7 - len(days))
+    return {
+        'habit_name': habit.name,
+        'start': date.fromordinal(first).isoformat(),
+        'end': date.fromordinal(last).isoformat(),
+        'weeks': [days[offset:offset + 7] for offset in range(0, len(days), 7)],
+    }
+
+@profiled
+def period_report(habit_list, period='week', periods=8, today=None):
+    '''
+    Report the completion counts of every habit over its most recent days, ISO weeks or months, read from their rollups.
+
+    Args:
+        habit_list (list): List of all habits.
+        period (str, optional): 'day', 'week' or 'month'. Defaults to 'week'.
+        periods (int, optional): Number of periods reported, ending with the current one. Defaults to 8.
+        today (date, optional): The date the current period is taken from. Defaults to today.
+
+    Returns:
+        tuple: The labels of the reported periods, oldest first, and one dictionary per habit with its name and
+            a list of counts, one per period.
+
+    Raises:
+        ValueError: If the period is not supported.
+    '''
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period '{period}'. Supported periods are: {', '.join(PERIODS)}.")
+    current = period_index((today or datetime.now().date()).toordinal(), period)
+    indexes = range(current - periods + 1, current + 1)
+    rows = [
+        {'habit_name': habit.name, 'counts': [habit.rollups.count(period, index) for index in indexes]}
+        for habit in habit_list
+    ]
+    return [period_label(index, period) for index in indexes], rows
+
+@profiled
+def due_habits(habit_list, today=None, within=0):
+    '''
+    Find the habits that have missed their period, or must be completed soon to keep their streak going.
+
+    A habit is due on the last day it can be completed on without breaking its current streak: one day
+    (one week for weekly habits) after its latest completion, or its start date if it was never completed.
+    Habit collections keep a heap of due dates, so only the due habits are looked at.
+
+    Args:
+        habit_list (list): List of all habits.
+        today (date, optional): The current date. Defaults to today.
+        within (int, optional): Also include habits due up to this many days after today. Defaults to 0.
+
+    Returns:
+        list: One dictionary per due habit, from the most overdue, with its name, due date in ISO format, current
+            streak and status: 'overdue' if the due date has passed, 'at_risk' otherwise.
+    '''
+    today = today or datetime.now().date()
+    if isinstance(habit_list, HabitCollection):
+        due = habit_list.due(today, within)
+    else:
+        horizon = today.toordinal() + within
+        due = sorted(((habit, habit.due_ordinal()) for habit in habit_list), key=lambda entry: entry[1]) # Stable, so ties keep list order
+        due = [(habit, due_ordinal) for habit, due_ordinal in due if due_ordinal <= horizon]
+    return [
+        {
             'habit_name': habit.name,
-            'completion_rate': completion_rate
-        })
+            'due_date': date.fromordinal(due_ordinal).isoformat(),
+            'current_streak': habit.current_streak(today),
+            'status': 'overdue' if due_ordinal < today.toordinal() else 'at_risk',
+        }
+        for habit, due_ordinal in due
+    ]
+
+@profiled
+def habit_statistics(habit_list, engine='python'):
+    '''
+    Calculate the current streak, longest streak and completion rate of every habit.
 
-    return rates
\ No newline at end of file
+    Args:
+        habit_list (list): List of Habit objects, each representing a habit.
+        engine (str, optional): 'python' for the pure-Python functions in this module, or 'numpy'
+            for a batched pass over all habits at once (requires NumPy). Defaults to 'python'.
+
+    Returns:
+        list: A list of dictionaries, each containing a habit's name, current streak, longest streak and completion rate.
+
+    Raises:
+        ValueError: If the engine is not supported.
+    '''
+    if engine == 'numpy':
+        from numpy_analytics import habit_statistics as numpy_habit_statistics # NumPy is optional, so only import it when it is asked for
+        return numpy_habit_statistics(habit_list)
+    if engine != 'python':
+        raise ValueError(f"Unknown analytics engine '{engine}'. Supported engines are: 'python' and 'numpy'.")
+
+    rates = calculate_completion_rates(habit_list)
+    return [{
+        'habit_name': habit.name,
+        'current_streak': streak_calc(habit),
+        'longest_streak': calculate_longest_streak(habit),
+        'completion_rate': rate['completion_rate'],
+    } for habit, rate in zip(habit_list, rates)]
@@ -0,0 +1,697 @@
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from main import HabitTrackerCLI
+import data_storage
+from data_storage import load_info, save_info
+from habit_manager import Habit, HabitCollection, Completions, to_timestamp
+from shards import leaderboard
+from analytics import habit_statistics, streak_calc, calculate_longest_streak, calculate_completion_rates, windowed_statistics, completion_counts, period_report, due_habits
+
+PERIOD_DAYS = {'daily': 1, 'weekly': 7}
+
+def generate_store(file_path, completion_count, habit_count=None, periodicities=('daily', 'weekly'), density=1.0, gap_every=0, gap_length=0, seed=0):
+    '''
+    Write a JSON habit store with a configurable shape, for benchmarking the storage and analytics hot paths.
+
+    Completions are spread evenly over the habits. Each habit walks back from today one period at a time and is
+    completed in a period with probability `density`; after every `gap_every` periods it skips `gap_length` periods.
+    Habits are written one at a time, so stores with millions of completions can be generated without holding them in memory.
+
+    Args:
+        file_path (str): Path to the JSON file to write.
+        completion_count (int): Total number of completions in the store.
+        habit_count (int, optional): Number of habits. Defaults to one habit per ten years of daily completions.
+        periodicities (tuple, optional): Periodicities assigned to the habits in turn. Defaults to daily and weekly.
+        density (float, optional): Probability that a period has a completion, between 0 and 1. Defaults to 1.0.
+        gap_every (int, optional): Number of periods between gaps, or 0 for no gaps. Defaults to 0.
+        gap_length (int, optional): Number of periods skipped at each gap. Defaults to 0.
+        seed (int, optional): Seed for the random number generator, so stores can be regenerated. Defaults to 0.
+    '''
+    if not 0 < density <= 1:
+        raise ValueError('density must be greater than 0 and at most 1')
+    if habit_count is None:
+        habit_count = max(1, math.ceil(completion_count / 3650))
+    generator = random.Random(seed)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    with open(file_path, 'w') as file:
+        file.write('{"habits": [')
+        for index in range(habit_count):
+            periodicity = periodicities[index % len(periodicities)]
+            days = PERIOD_DAYS[periodicity]
+            count = completion_count // habit_count + (index < completion_count % habit_count)
+
+            completions = []
+            period = 0
+            while len(completions) < count:
+                if gap_every and period and period % gap_every == 0:
+                    period += gap_length
+                if generator.random() < density:
+                    completions.append(today - timedelta(days=period * days, seconds=generator.randrange(6 * 3600, 22 * 3600)))
+                period += 1
+            completions.reverse()
+
+            start_date = completions[0].replace(hour=0, minute=0, second=0) if completions else today
+            habit = {
+                'name': f'Habit {index}',
+                'description': f'synthetic {periodicity} habit',
+                'start_date': start_date.isoformat(),
+                'periodicity': periodicity,
+                'completions': [completion.isoformat() for completion in completions],
+            }
+            file.write((', ' if index else '') + json.dumps(habit))
+        file.write(']}')
+
+
+def measure(operation, setup=lambda: None, repeat=3):
+    '''
+    Measure the fastest wall time and the peak memory of an operation.
+
+    The setup runs before each measurement and is neither timed nor traced, so operations can be given freshly loaded data.
+
+    Args:
+        operation (callable): Called with the result of the setup.
+        setup (callable, optional): Prepares the operation's argument.
+        repeat (int, optional): Number of timed runs.
+
+    Returns:
+        tuple: The fastest run in milliseconds and the peak memory allocated during one run in bytes.
+    '''
+    timings = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        operation(argument)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    argument = setup()
+    tracemalloc.start()
+    try:
+        operation(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+
+def operations_benchmark(sizes=(1000, 100000), habit_count=None, periodicities=('daily', 'weekly'), density=1.0, gap_every=0, gap_length=0, repeat=3):
+    '''
+    Report the time and peak memory of the storage and analytics operations on generated stores of increasing size.
+
+    Streak operations run on freshly loaded habits, so their cost includes the first scan of every habit's completions.
+
+    Args:
+        sizes (tuple, optional): Total completion counts of the generated stores.
+        habit_count (int, optional): Number of habits in each store. Defaults to one habit per ten years of daily completions.
+        periodicities (tuple, optional): Periodicities assigned to the habits in turn.
+        density (float, optional): Probability that a period has a completion.
+        gap_every (int, optional): Number of periods between gaps, or 0 for no gaps.
+        gap_length (int, optional): Number of periods skipped at each gap.
+        repeat (int, optional): Number of timed runs per operation.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'habits.json')
+        target = os.path.join(directory, 'saved.json')
+        for size in sizes:
+            generate_store(source, size, habit_count, periodicities, density, gap_every, gap_length)
+
+            def loaded():
+                return load_info(source, verbose=False)
+
+            def decoded():
+                habit_list = loaded()
+                for habit in habit_list:
+                    habit.completions.timestamps
+                return habit_list
+
+            operations = [
+                ('load_info', lambda _: decoded(), lambda: None),
+                ('save_info', lambda habit_list: save_info(habit_list, target, verbose=False), loaded),
+                ('streak_calc', lambda habit_list: [streak_calc(habit) for habit in habit_list], decoded),
+                ('calculate_longest_streak', lambda habit_list: [calculate_longest_streak(habit) for habit in habit_list], decoded),
+                ('calculate_completion_rates', calculate_completion_rates, decoded),
+            ]
+
+            print(f'Store: {size} completions, {os.path.getsize(source) / 1024 / 1024:.1f} MiB')
+            for name, operation, setup in operations:
+                elapsed, peak = measure(operation, setup, repeat)
+                print(f'    {name:28} {elapsed:10.2f} ms {peak / 1024 / 1024:10.2f} MiB peak')
+
+
+def best_of(function, repeat):
+    '''
+    Run a function several times and return its fastest wall time.
+
+    Args:
+        function (callable): The function to time.
+        repeat (int): Number of runs.
+
+    Returns:
+        float: The fastest run, in milliseconds.
+    '''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()): # Keep the CLI's status messages out of the report
+            function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def startup_benchmark(habit_count=20, completions_per_habit=3650, repeat=5):
+    '''
+    Compare a listing command on a lazily decoded store with one that decodes every completion.
+
+    Args:
+        habit_count (int, optional): Number of habits in the synthetic store.
+        completions_per_habit (int, optional): Number of completions per habit; the default is ten years of daily check-ins.
+        repeat (int, optional): Number of runs per measurement.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'habits.json')
+        generate_store(file_path, habit_count * completions_per_habit, habit_count, periodicities=('daily',))
+
+        def lazy():
+            HabitTrackerCLI(file_path).all_habits()
+
+        def eager():
+            habit_tracker = HabitTrackerCLI(file_path)
+            for habit in habit_tracker.habit_list:
+                list(habit.completions) # Force decoding, as the store loader used to do
+            habit_tracker.all_habits()
+
+        print(f'Store: {habit_count} habits x {completions_per_habit} completions')
+        print(f'all_habits, lazy completions:  {best_of(lazy, repeat):8.2f} ms')
+        print(f'all_habits, eager completions: {best_of(eager, repeat):8.2f} ms')
+
+
+def allocated_bytes(function):
+    '''
+    Measure the memory still held by the object a function builds.
+
+    Args:
+        function (callable): Builds and returns the object to measure.
+
+    Returns:
+        int: Bytes allocated by the call and still alive afterwards.
+    '''
+    tracemalloc.start()
+    try:
+        result = function()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def memory_benchmark(completion_count=1000000):
+    '''
+    Compare the memory held per completion by a list of datetime objects and by a Completions array.
+
+    Args:
+        completion_count (int, optional): Number of synthetic completions.
+    '''
+    start_date = datetime(2000, 1, 1, 8, 30)
+    completions = [start_date + timedelta(hours=hour) for hour in range(completion_count)]
+    strings = [completion.isoformat() for completion in completions]
+    del completions
+
+    datetime_list = allocated_bytes(lambda: [datetime.fromisoformat(completion) for completion in strings])
+    compact = allocated_bytes(lambda: Completions.from_strings(strings).timestamps)
+
+    print(f'Store: {completion_count} completions')
+    print(f'list of datetime objects: {datetime_list / completion_count:8.2f} bytes per completion')
+    print(f'Completions array:        {compact / completion_count:8.2f} bytes per completion')
+
+
+def analytics_benchmark(habit_count=200, completions_per_habit=3650, repeat=5):
+    '''
+    Compare the pure-Python and NumPy analytics engines on a synthetic store.
+
+    Args:
+        habit_count (int, optional): Number of habits in the synthetic store.
+        completions_per_habit (int, optional): Number of completions per habit.
+        repeat (int, optional): Number of runs per measurement.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'habits.json')
+        generate_store(file_path, habit_count * completions_per_habit, habit_count, periodicities=('daily',))
+        with redirect_stdout(io.StringIO()):
+            habit_list = load_info(file_path)
+        for habit in habit_list:
+            habit.completions.timestamps # Decode up front so only the analytics are timed
+
+        print(f'Store: {habit_count} habits x {completions_per_habit} completions')
+        print(f'habit_statistics, python engine: {best_of(lambda: habit_statistics(habit_list), repeat):8.2f} ms')
+        try:
+            import numpy
+        except ImportError:
+            print('habit_statistics, numpy engine:  skipped, NumPy is not installed')
+            return
+        print(f'habit_statistics, numpy engine:  {best_of(lambda: habit_statistics(habit_list, engine="numpy"), repeat):8.2f} ms')
+
+
+def window_benchmark(completion_count=1000000, window_days=30, repeat=5):
+    '''
+    Compare a date-range query answered by binary search with a scan of the habit's whole history.
+
+    Args:
+        completion_count (int, optional): Number of completions of the habit.
+        window_days (int, optional): Length of the queried range in days.
+        repeat (int, optional): Number of runs per measurement.
+    '''
+    hour = 3600 * 10 ** 6
+    latest = to_timestamp(datetime.now().replace(minute=0, second=0, microsecond=0))
+    habit = Habit('Hourly', 'A completion every two hours', datetime.now() - timedelta(hours=2 * completion_count), 'daily')
+    habit.completions = Completions.from_timestamps(range(latest - 2 * hour * (completion_count - 1), latest + 1, 2 * hour))
+    end = datetime.now().date()
+    start = end - timedelta(days=window_days - 1)
+
+    def scan():
+        return sum(1 for completion in habit.completions if start <= completion.date() <= end)
+
+    print(f'Habit: {completion_count} completions, range of {window_days} days')
+    print(f'windowed_statistics:         {best_of(lambda: windowed_statistics(habit, start, end), repeat):10.3f} ms')
+    print(f'completion_counts per week:  {best_of(lambda: completion_counts(habit, start, end, "week"), repeat):10.3f} ms')
+    print(f'full scan (count only):      {best_of(scan, repeat):10.3f} ms')
+
+
+def due_benchmark(habit_count=100000, due_share=0.01, repeat=5):
+    '''
+    Compare finding the due habits with the collection's due queue and with a scan of every habit.
+
+    Args:
+        habit_count (int, optional): Number of habits.
+        due_share (float, optional): Share of the habits that are due today.
+        repeat (int, optional): Number of runs per measurement.
+    '''
+    generator = random.Random(0)
+    now = datetime.now()
+    habit_list = HabitCollection()
+    for index in range(habit_count):
+        habit = Habit(f'Habit {index}', 'Generated habit', now - timedelta(days=30), 'weekly')
+        days_ago = 8 if generator.random() < due_share else generator.randint(0, 5)
+        habit.completions = Completions.from_timestamps([to_timestamp(now - timedelta(days=days_ago))])
+        habit_list.append(habit)
+    today = now.date()
+    build = best_of(lambda: habit_list.due(today), 1)
+
+    def scan():
+        return sorted((habit.due_ordinal(), index, habit) for index, habit in enumerate(habit_list) if habit.due_ordinal() <= today.toordinal())
+
+    print(f'Habits: {habit_count}, {due_share:.0%} due')
+    print(f'due queue, first query:  {build:10.3f} ms')
+    print(f'due queue, later query:  {best_of(lambda: habit_list.due(today), repeat):10.3f} ms')
+    print(f'due_habits report:       {best_of(lambda: due_habits(habit_list, today), repeat):10.3f} ms')
+    print(f'full scan:               {best_of(scan, repeat):10.3f} ms')
+
+
+def report_benchmark(sizes=(100000, 1000000), periods=12, repeat=3):
+    '''
+    Compare a monthly report over a freshly loaded JSON store read from the persisted rollups with one counted from the completions.
+
+    Stores of at least EAGER_DECODE_THRESHOLD bytes decode their completions while loading, so the gap narrows for them.
+
+    Args:
+        sizes (tuple, optional): Numbers of completions of the generated stores.
+        periods (int, optional): Number of months reported.
+        repeat (int, optional): Number of runs per measurement.
+    '''
+    today = datetime.now().date()
+    first = today.replace(day=1) - timedelta(days=31 * (periods - 1))
+    for completion_count in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'habits.json')
+            generate_store(file_path, completion_count)
+            save_info(load_info(file_path, verbose=False), file_path, verbose=False) # Persist the rollups
+
+            def from_rollups():
+                period_report(load_info(file_path, verbose=False), 'month', periods)
+
+            def from_completions():
+                for habit in load_info(file_path, verbose=False):
+                    counts = {}
+                    for completion in habit.completions:
+                        if completion.date() >= first:
+                            counts[completion.strftime('%Y-%m')] = counts.get(completion.strftime('%Y-%m'), 0) + 1
+
+            print(f'Store: {completion_count} completions, report of {periods} months including the load')
+            print(f'from rollups:      {best_of(from_rollups, repeat):10.2f} ms')
+            print(f'from completions:  {best_of(from_completions, repeat):10.2f} ms')
+
+
+def snapshot_benchmark(completion_count=1000000, repeat=3):
+    '''
+    Compare the load time, save time and size of JSON and binary snapshots of the same generated store.
+
+    Loads are timed with every completion decoded, so both formats do the same work.
+
+    Args:
+        completion_count (int, optional): Number of completions in the generated store.
+        repeat (int, optional): Number of timed runs per measurement.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, 'habits.json')
+        binary_path = os.path.join(directory, 'habits.hbin')
+        generate_store(json_path, completion_count)
+        habit_list = load_info(json_path, verbose=False)
+        for habit in habit_list:
+            habit.completions.timestamps
+        save_info(habit_list, binary_path, verbose=False)
+
+        def load(file_path):
+            for habit in load_info(file_path, verbose=False):
+                habit.completions.timestamps
+
+        print(f'Store: {completion_count} completions')
+        threshold, data_storage.PARSED_CACHE_THRESHOLD = data_storage.PARSED_CACHE_THRESHOLD, math.inf # Parse the JSON snapshot on every load
+        try:
+            for name, file_path in (('JSON', json_path), ('binary', binary_path)):
+                load_ms = best_of(lambda: load(file_path), repeat)
+                save_ms = best_of(lambda: save_info(habit_list, file_path, verbose=False), repeat)
+                size = os.path.getsize(file_path)
+                print(f'{name:7} load {load_ms:9.2f} ms  save {save_ms:9.2f} ms  size {size / 1024 / 1024:7.2f} MiB ({size / completion_count:5.1f} bytes per completion)')
+        finally:
+            data_storage.PARSED_CACHE_THRESHOLD = threshold
+
+
+STARTUP_TARGET_MS = 50
+
+def batch_benchmark(command_count=100, completion_count=100000):
+    '''
+    Compare running many commands as separate `main.py` invocations with running them as one batch.
+
+    Args:
+        command_count (int, optional): Number of commands; completions and streak queries in turn.
+        completion_count (int, optional): Number of completions in the generated store.
+    '''
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'habits.json')
+        generate_store(file_path, completion_count)
+        habit_name = load_info(file_path, verbose=False)[0].name
+        commands = [['complete', habit_name] if index % 2 == 0 else ['streak', habit_name] for index in range(command_count)]
+
+        start = time.perf_counter()
+        for command in commands:
+            subprocess.run([sys.executable, script, '--quiet', '--file_path', file_path, *command], stdout=subprocess.DEVNULL, check=True)
+        separate = (time.perf_counter() - start) * 1000
+
+        batch = '\n'.join(json.dumps({'command': command, 'args': args}) for command, *args in commands)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, '--quiet', '--file_path', file_path, 'batch'], input=batch, stdout=subprocess.DEVNULL, text=True, check=True)
+        batched = (time.perf_counter() - start) * 1000
+
+    print(f'Store: {completion_count} completions, {command_count} commands')
+    print(f'separate invocations: {separate:10.2f} ms')
+    print(f'one batch:            {batched:10.2f} ms')
+
+
+def cli_startup_benchmark(repeat=15):
+    '''
+    Time complete `main.py` invocations in fresh interpreters and list the slowest imports.
+
+    Compares the direct dispatch used for simple command lines with the same command run through Fire,
+    and reports the cumulative `-X importtime` cost of the heaviest top-level imports. To show where the
+    time goes, the same command is also run from main's cached bytecode, as `python main.py` compiles the
+    script on every run, and `import main` is timed on its own.
+
+    Args:
+        repeat (int, optional): Number of invocations per measurement.
+    '''
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None) # Measure with cached bytecode, as in a normal installation
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'habits.json')
+        generate_store(file_path, 20 * 365, 20, periodicities=('daily',))
+
+        def command_ms(command):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run(command, stdout=subprocess.DEVNULL, env=env, cwd=os.path.dirname(script), check=True)
+                timings.append((time.perf_counter() - start) * 1000)
+            return statistics.median(timings)
+
+        def invocation_ms(*args):
+            return command_ms([sys.executable, script, *args])
+
+        invocation_ms('--quiet', '--file_path', file_path, 'all_habits') # Warm up the bytecode cache
+        fast = invocation_ms('--quiet', '--file_path', file_path, 'all_habits')
+        print(f'bare interpreter:           {command_ms([sys.executable, "-c", "pass"]):8.2f} ms')
+        print(f'import main:                {command_ms([sys.executable, "-c", "import main"]):8.2f} ms')
+        print(f'main.py --quiet all_habits: {fast:8.2f} ms (target {STARTUP_TARGET_MS} ms: {"met" if fast < STARTUP_TARGET_MS else "missed"})')
+        print(f'same, from cached bytecode: {command_ms([sys.executable, "-c", "import sys, main; main.main(sys.argv[1:])", "--quiet", "--file_path", file_path, "all_habits"]):8.2f} ms')
+        print(f'same command through Fire:  {invocation_ms("--quiet", "--file_path", file_path, "all_habits", "--"):8.2f} ms')
+
+        importtime = subprocess.run(
+            [sys.executable, '-X', 'importtime', script, '--quiet', '--file_path', file_path, 'all_habits'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env, text=True, check=True,
+        ).stderr
+        top_level = []
+        for line in importtime.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[1].strip().isdigit() and not fields[2].startswith('  '):
+                top_level.append((int(fields[1]), fields[2].strip()))
+        print('slowest top-level imports:')
+        for cumulative, module in sorted(top_level, reverse=True)[:5]:
+            print(f'    {module:24} {cumulative / 1000:8.2f} ms')
+
+
+def daemon_benchmark(completion_count=1000000, repeat=10):
+    '''
+    Time `main.py` invocations on a large store with and without a daemon serving it.
+
+    Args:
+        completion_count (int, optional): Number of completions in the generated store.
+        repeat (int, optional): Number of invocations per measurement.
+    '''
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'habits.json')
+        generate_store(file_path, completion_count)
+        command = [sys.executable, script, '--quiet', '--file_path', file_path, 'streak', 'Habit 0']
+
+        def invocation_ms():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run(command, stdout=subprocess.DEVNULL, env=env, check=True)
+                timings.append((time.perf_counter() - start) * 1000)
+            return statistics.median(timings)
+
+        print(f'Store: {completion_count} completions')
+        print(f'streak, no daemon:   {invocation_ms():10.2f} ms')
+        daemon = subprocess.Popen([sys.executable, script, '--quiet', '--file_path', file_path, 'serve'], stdout=subprocess.PIPE, env=env, text=True)
+        try:
+            daemon.stdout.readline() # Wait until the socket is bound
+            print(f'streak, with daemon: {invocation_ms():10.2f} ms')
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+
+async def http_request(reader, writer, method, path, body=b''):
+    '''
+    Send one request on a keep-alive HTTP connection and read the response.
+
+    Returns:
+        tuple: The status code and the response body.
+    '''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def load_test(port, habit_names, connections, duration, write_ratio):
+    '''
+    Drive a HabitServer from many concurrent keep-alive connections for a fixed time.
+
+    Each connection sends a random mix of analytics and habit reads, and completions with probability write_ratio.
+
+    Returns:
+        tuple: Number of reads and number of writes answered successfully.
+    '''
+    counts = {'reads': 0, 'writes': 0}
+    deadline = time.perf_counter() + duration
+    generator = random.Random(0)
+
+    async def client():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        while time.perf_counter() < deadline:
+            name = generator.choice(habit_names).replace(' ', '%20')
+            if generator.random() < write_ratio:
+                status, _ = await http_request(reader, writer, 'POST', f'/habits/{name}/completions')
+                counts['writes'] += status == 201
+            else:
+                path = generator.choice(['/analytics/summary', '/analytics/completion_rates', '/habits', f'/habits/{name}'])
+                status, _ = await http_request(reader, writer, 'GET', path)
+                counts['reads'] += status == 200
+        writer.close()
+
+    await asyncio.gather(*(client() for _ in range(connections)))
+    return counts['reads'], counts['writes']
+
+
+def server_benchmark(completion_count=100000, connections=50, duration=5, write_ratio=0.2):
+    '''
+    Load-test the HTTP API with many concurrent clients and report requests per second.
+
+    The server runs in its own process on a generated store; the clients share one event loop in this process.
+
+    Args:
+        completion_count (int, optional): Number of completions in the generated store.
+        connections (int, optional): Number of concurrent client connections.
+        duration (float, optional): Length of the test, in seconds.
+        write_ratio (float, optional): Share of requests that record a completion.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'habits.json')
+        generate_store(file_path, completion_count)
+        habit_names = [habit.name for habit in load_info(file_path, verbose=False)]
+        server = subprocess.Popen([sys.executable, 'main.py', '--quiet', '--file_path', file_path, 'serve_http', '--port', '0'],
+                                  cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, text=True)
+        try:
+            port = int(server.stdout.readline().rsplit(':', 1)[1])
+            reads, writes = asyncio.run(load_test(port, habit_names, connections, duration, write_ratio))
+
+            async def status():
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                _, body = await http_request(reader, writer, 'GET', '/status')
+                writer.close()
+                return json.loads(body)
+            counters = asyncio.run(status())
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f'Store: {completion_count} completions, {connections} connections, {duration} s, {write_ratio:.0%} writes')
+    print(f'requests per second: {(reads + writes) / duration:10.1f} ({reads} reads, {writes} completions)')
+    print(f'cache hit rate:      {counters["cache_hits"] / max(counters["cache_hits"] + counters["cache_misses"], 1):10.1%}')
+    print(f'completions per save: {counters["completions"] / max(counters["batches"], 1):9.1f} ({counters["batches"]} saves)')
+
+
+def parsed_cache_benchmark(sizes=(100000, 1000000), repeat=3):
+    '''
+    Compare loading a JSON store without a parsed copy, while writing its parsed copy (cold) and from an up-to-date parsed copy (warm).
+
+    Loads are timed with every completion decoded, so all three do the same work. The stores are saved once
+    before timing, so they hold the streak statistics and rollups like stores saved by the application.
+
+    Args:
+        sizes (tuple, optional): Total numbers of completions of the generated stores.
+        repeat (int, optional): Number of timed runs per measurement.
+    '''
+    threshold = data_storage.PARSED_CACHE_THRESHOLD
+    with tempfile.TemporaryDirectory() as directory:
+        for completion_count in sizes:
+            file_path = os.path.join(directory, f'habits{completion_count}.json')
+            cache_path = data_storage.parsed_cache_path(file_path)
+            generate_store(file_path, completion_count)
+            save_info(load_info(file_path, verbose=False), file_path, verbose=False)
+
+            def load(_):
+                for habit in load_info(file_path, verbose=False):
+                    habit.completions.timestamps
+
+            def remove_cache():
+                if os.path.exists(cache_path):
+                    os.remove(cache_path)
+
+            data_storage.PARSED_CACHE_THRESHOLD = math.inf
+            try:
+                uncached, _ = measure(load, remove_cache, repeat)
+            finally:
+                data_storage.PARSED_CACHE_THRESHOLD = threshold
+            cold, _ = measure(load, remove_cache, repeat)
+            warm, _ = measure(load, lambda: None, repeat)
+            print(f'{completion_count:>9} completions: no parsed copy {uncached:9.2f} ms  cold {cold:9.2f} ms  warm {warm:9.2f} ms ({uncached / warm:5.1f}x faster)')
+
+
+def shards_benchmark(user_count=200, completions_per_user=20000, repeat=3):
+    '''
+    Compare computing a leaderboard over many user shards in one process and in a process pool.
+
+    Args:
+        user_count (int, optional): Number of user shards.
+        completions_per_user (int, optional): Number of completions in each user's store.
+        repeat (int, optional): Number of timed runs per measurement.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        for user in range(user_count):
+            generate_store(os.path.join(directory, f'user{user}.json'), completions_per_user, density=0.9, seed=user)
+
+        print(f'Shards: {user_count} users x {completions_per_user} completions, {os.cpu_count()} CPUs')
+        print(f'leaderboard, 1 process:   {best_of(lambda: leaderboard(directory, workers=1), repeat):10.2f} ms')
+        print(f'leaderboard, 4 processes:  {best_of(lambda: leaderboard(directory, workers=4), repeat):10.2f} ms')
+
+
+BENCHMARKS = {
+    'analytics': analytics_benchmark,
+    'batch': batch_benchmark,
+    'cli_startup': cli_startup_benchmark,
+    'daemon': daemon_benchmark,
+    'due': due_benchmark,
+    'memory': memory_benchmark,
+    'operations': operations_benchmark,
+    'parsed_cache': parsed_cache_benchmark,
+    'report': report_benchmark,
+    'server': server_benchmark,
+    'shards': shards_benchmark,
+    'snapshot': snapshot_benchmark,
+    'startup': startup_benchmark,
+    'window': window_benchmark,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run HabitBuddy benchmarks.')
+    parser.add_argument('benchmarks', nargs='*', help=f'benchmarks to run, from: {", ".join(sorted(BENCHMARKS))} (default: all)')
+    store = parser.add_argument_group('generated stores', 'Shape of the stores used by the operations benchmark and --generate.')
+    store.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000], metavar='COMPLETIONS', help='total completions per store (default: 1000 100000)')
+    store.add_argument('--habits', type=int, help='number of habits (default: one per ten years of daily completions)')
+    store.add_argument('--periodicities', nargs='+', default=['daily', 'weekly'], choices=sorted(PERIOD_DAYS), help='periodicities assigned to habits in turn')
+    store.add_argument('--density', type=float, default=1.0, help='probability that a period has a completion (default: 1.0)')
+    store.add_argument('--gap-every', type=int, default=0, metavar='PERIODS', help='periods between gaps (default: no gaps)')
+    store.add_argument('--gap-length', type=int, default=0, metavar='PERIODS', help='periods skipped at each gap')
+    store.add_argument('--generate', metavar='PATH', help='write a store with the first of --sizes completions to PATH and exit')
+    options = parser.parse_args()
+    shape = dict(habit_count=options.habits, periodicities=tuple(options.periodicities), density=options.density, gap_every=options.gap_every, gap_length=options.gap_length)
+
+    if options.generate:
+        generate_store(options.generate, options.sizes[0], **shape)
+        sys.exit()
+
+    names = options.benchmarks or sorted(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'unknown benchmark: {", ".join(unknown)}')
+    for name in names:
+        print(f'== {name} ==')
+        if name == 'operations':
+            operations_benchmark(tuple(options.sizes), **shape)
+        else:
+            BENCHMARKS[name]()
@@ -0,0 +1,208 @@
+import mmap
+import struct
+import sys
+from array import array
+from datetime import datetime
+from itertools import accumulate
+from math import gcd
+from operator import sub
+from habit_manager import Habit, HabitCollection, Completions, STATISTICS_FORMAT
+
+MAGIC = b'HBSN'
+VERSION = 4
+READABLE_VERSIONS = (1, 2, 3, 4) # Version 1 snapshots have no habit flags; statistics before version 4 count weekly streaks in 7-day steps
+HEADER = struct.Struct('<4sHI') # Magic, format version, number of habits
+FLAGS = struct.Struct('<B') # Habit flags, since version 2
+DEDUPE_FLAG = 1
+STATISTICS = struct.Struct('<6q') # Completion count, last and latest completion day ordinals (0 for none), current run, latest run, longest streak
+COMPLETIONS = struct.Struct('<Icqq') # Number of completions, delta type code, first timestamp, delta scale
+LENGTH = struct.Struct('<I')
+DELTA_TYPECODES = 'bhiq' # Narrowest first; every habit uses the narrowest type its scaled deltas fit in
+BIG_ENDIAN = sys.byteorder == 'big' # Snapshots are always little-endian
+
+class SnapshotError(ValueError):
+    '''Raised when a file is not a habit snapshot or uses an unsupported format version.'''
+
+
+def _encode_string(value):
+    '''Encode a string as its UTF-8 byte length followed by its bytes.'''
+    encoded = value.encode('utf-8')
+    return LENGTH.pack(len(encoded)) + encoded
+
+
+def _encode_completions(timestamps):
+    '''
+    Delta-encode the completion timestamps of a habit.
+
+    Consecutive differences are divided by their greatest common divisor (completions recorded on whole
+    seconds or minutes have large common factors) and stored in the narrowest integer type they fit in,
+    typically 4 bytes per completion instead of a 26-character ISO 8601 string.
+    '''
+    if not timestamps:
+        return COMPLETIONS.pack(0, b'q', 0, 1)
+    deltas = list(map(sub, timestamps[1:], timestamps))
+    scale = gcd(*deltas) or 1
+    if scale > 1:
+        deltas = [delta // scale for delta in deltas]
+    low, high = min(deltas, default=0), max(deltas, default=0)
+    for typecode in DELTA_TYPECODES:
+        limit = 1 << (8 * array(typecode).itemsize - 1)
+        if -limit <= low and high < limit:
+            break
+    deltas = array(typecode, deltas)
+    if BIG_ENDIAN:
+        deltas.byteswap()
+    return COMPLETIONS.pack(len(timestamps), typecode.encode('ascii'), timestamps[0], scale) + deltas.tobytes()
+
+
+def _encode_fields(habit):
+    '''Encode the start of a habit record: the habit's fields and flags and its streak statistics.'''
+    statistics = habit.statistics
+    return b''.join([
+        _encode_string(habit.name),
+        _encode_string(habit.description),
+        _encode_string(habit.start_date.isoformat()),
+        _encode_string(habit.periodicity),
+        FLAGS.pack(DEDUPE_FLAG if habit.dedupe else 0),
+        STATISTICS.pack(
+            statistics['completion_count'],
+            statistics['last_completion_date'] or 0,
+            statistics['latest_completion_date'] or 0,
+            statistics['current_run'],
+            statistics['latest_run'],
+            statistics['longest_streak'],
+        ),
+    ])
+
+
+def _encode_habit(habit):
+    '''Encode one habit record: its fields and flags, its streak statistics and its delta-encoded completions.'''
+    return _encode_fields(habit) + _encode_completions(habit.completions.timestamps)
+
+
+def write_snapshot(file, habit_list, log_id):
+    '''
+    Write habits to a binary snapshot.
+
+    A snapshot starts with a versioned header followed by one record per habit, each holding the habit's
+    fields and flags, its streak statistics and its delta-encoded completion timestamps.
+
+    Args:
+        file (file): The snapshot, opened for writing in binary mode.
+        habit_list (list): List of Habit objects.
+        log_id (str): Id of the completion log that extends the snapshot.
+    '''
+    file.write(HEADER.pack(MAGIC, VERSION, len(habit_list)))
+    file.write(_encode_string(log_id))
+    for habit in habit_list:
+        file.write(_encode_habit(habit))
+
+
+class _Reader:
+    '''Sequential reader over the bytes of a snapshot.'''
+    def __init__(self, view):
+        self.view = view
+        self.offset = 0
+        self.version = VERSION
+
+    def unpack(self, layout):
+        try:
+            values = layout.unpack_from(self.view, self.offset)
+        except struct.error as error:
+            raise SnapshotError('Truncated habit snapshot') from error
+        self.offset += layout.size
+        return values
+
+    def bytes(self, size):
+        if self.offset + size > len(self.view):
+            raise SnapshotError('Truncated habit snapshot')
+        self.offset += size
+        return self.view[self.offset - size:self.offset]
+
+    def string(self):
+        (size,) = self.unpack(LENGTH)
+        return str(self.bytes(size), 'utf-8')
+
+    def completions(self):
+        count, typecode, first, scale = self.unpack(COMPLETIONS)
+        if count == 0:
+            return Completions()
+        typecode = typecode.decode('ascii')
+        if typecode not in DELTA_TYPECODES:
+            raise SnapshotError(f'Unknown delta type code {typecode!r}')
+        deltas = array(typecode)
+        deltas.frombytes(self.bytes((count - 1) * deltas.itemsize))
+        if BIG_ENDIAN:
+            deltas.byteswap()
+        if scale != 1:
+            deltas = map(scale.__mul__, deltas)
+        return Completions.from_timestamps(accumulate(deltas, initial=first))
+
+    def fields(self):
+        '''Read the start of a habit record; the statistics are returned apart, to be set once the completions are.'''
+        habit = Habit(self.string(), self.string(), datetime.fromisoformat(self.string()), self.string())
+        if self.version >= 2:
+            (flags,) = self.unpack(FLAGS)
+            habit.dedupe = bool(flags & DEDUPE_FLAG)
+        completion_count, last_date, latest_date, current_run, latest_run, longest_streak = self.unpack(STATISTICS)
+        return habit, { # Checked against the completions and periodicity before use, like statistics loaded from JSON
+            'format': STATISTICS_FORMAT if self.version >= 4 else None,
+            'periodicity': habit.periodicity,
+            'completion_count': completion_count,
+            'last_completion_date': last_date or None,
+            'current_run': current_run,
+            'latest_completion_date': latest_date or None,
+            'latest_run': latest_run,
+            'longest_streak': longest_streak,
+        }
+
+    def habit(self):
+        habit, statistics = self.fields()
+        habit.completions = self.completions()
+        habit.statistics = statistics
+        return habit
+
+
+def read_snapshot(file, use_mmap=True):
+    '''
+    Read habits from a binary snapshot.
+
+    By default the file is memory-mapped, so its contents are decoded straight from the page cache
+    instead of being copied into memory first.
+
+    Args:
+        file (file): The snapshot, opened for reading in binary mode.
+        use_mmap (bool, optional): Whether to memory-map the file. Defaults to True.
+
+    Returns:
+        tuple: The loaded HabitCollection and the id of the completion log that extends the snapshot.
+
+    Raises:
+        SnapshotError: If the file is not a habit snapshot, uses an unsupported version or is truncated.
+    '''
+    buffer = None
+    if use_mmap:
+        try:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError): # Empty files and some file systems cannot be mapped
+            pass
+    if buffer is None:
+        buffer = file.read()
+
+    try:
+        with memoryview(buffer) as view:
+            reader = _Reader(view)
+            magic, version, habit_count = reader.unpack(HEADER)
+            if magic != MAGIC:
+                raise SnapshotError('Not a habit snapshot')
+            if version not in READABLE_VERSIONS:
+                raise SnapshotError(f'Unsupported habit snapshot version {version}')
+            reader.version = version
+            log_id = reader.string()
+            habit_list = HabitCollection()
+            for _ in range(habit_count):
+                habit_list.append_loaded(reader.habit())
+    finally:
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+    return habit_list, log_id
@@ -0,0 +1,167 @@
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import traceback
+from contextlib import redirect_stdout
+from colorama import Fore, Style
+from data_storage import LOG_SUFFIX, is_directory, sqlite_path, log_path, socket_path, store_lock
+
+def store_signature(file_path):
+    '''
+    Return the modification times and sizes of a store's files, to detect changes made by other processes.
+
+    Args:
+        file_path (str): Path to the habit store.
+
+    Returns:
+        tuple: (mtime_ns, size) of the snapshot or database and of the completion log, or of every file of a directory store; None for a missing file.
+    '''
+    db_path = sqlite_path(file_path)
+    if db_path:
+        paths = (db_path, db_path + '-wal')
+    elif is_directory(file_path): # The manifest, and every habit file and completion log
+        paths = sorted(entry.path for entry in os.scandir(file_path) if entry.name.endswith(('.json', LOG_SUFFIX))) if os.path.isdir(file_path) else ()
+    else:
+        paths = (file_path, log_path(file_path))
+    signature = []
+    for path in paths:
+        try:
+            status = os.stat(path)
+            signature.append((status.st_mtime_ns, status.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    '''Serve one forwarded command: a JSON request line in, a JSON response out.'''
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        self.wfile.write(json.dumps(self.server.run(request['argv'])).encode('utf-8') + b'\n')
+
+
+class HabitDaemon(socketserver.UnixStreamServer):
+    '''
+    Serve CLI commands for one habit store over a Unix domain socket, keeping the store loaded in memory.
+
+    Commands are run one at a time by a resident HabitTrackerCLI, so its habit collection and the streak
+    statistics maintained by each habit survive between calls. Before each command, the store's files are
+    checked for changes made by other processes, and the store is reloaded if they changed. The --quiet and
+    --cache flags of each command line apply to that command only; profiled command lines are refused, as
+    the profiler measures the invocation that runs them, so main runs them itself.
+    '''
+    def __init__(self, file_path):
+        '''
+        Initialize a HabitDaemon and bind its socket next to the store.
+
+        Args:
+            file_path (str): Path to the habit store to serve.
+
+        Raises:
+            OSError: If another daemon is already serving the store.
+        '''
+        from main import HabitTrackerCLI
+        self.file_path = file_path
+        self.cli = HabitTrackerCLI(self.file_path, quiet=True)
+        self.signature = None
+        path = socket_path(file_path)
+        if os.path.exists(path):
+            if forward(file_path, None) is not None:
+                raise OSError(f'A daemon is already serving {file_path}')
+            os.remove(path) # Left behind by a daemon that did not shut down cleanly
+        super().__init__(path, CommandHandler)
+
+    def run(self, argv):
+        '''
+        Run a command line against the resident store and capture what it prints.
+
+        Args:
+            argv (list): The command-line arguments, as given to main.py, or None to check that the daemon is alive.
+
+        Returns:
+            dict: The command's 'output', and an 'error' message if it failed.
+        '''
+        from main import parse_command_line, print_result, PROFILE_FLAGS
+        if argv is None:
+            return {'output': '', 'error': None}
+        parsed = parse_command_line(argv)
+        if parsed is None:
+            return {'output': '', 'error': 'The daemon only serves simple command lines.'}
+        init_kwargs, command_name, positional, command_kwargs = parsed
+        if any(init_kwargs.get(name) for name in PROFILE_FLAGS):
+            return {'output': '', 'error': 'The daemon does not profile commands; run them without it.'}
+
+        self.cli.quiet = init_kwargs.get('quiet', False)
+        self.cli.cache = init_kwargs.get('cache', False)
+        output = io.StringIO()
+        error = None
+        with store_lock(self.file_path), redirect_stdout(output): # Locked so no other process changes the store between the check and the command
+            if store_signature(self.file_path) != self.signature:
+                self.cli._habit_list = None # Changed by another process since the last command; reload on first use
+            if not self.cli.quiet:
+                self.cli.welcome()
+            try:
+                print_result(getattr(self.cli, command_name)(*positional, **command_kwargs))
+            except Exception:
+                error = traceback.format_exc()
+                self.cli._habit_list = None # The command may have left the resident store half-changed
+            self.signature = store_signature(self.file_path)
+        return {'output': output.getvalue(), 'error': error}
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def forward(file_path, argv):
+    '''
+    Send a command line to the daemon serving a store.
+
+    Args:
+        file_path (str): Path to the habit store.
+        argv (list): The command-line arguments, or None to check that the daemon is alive.
+
+    Returns:
+        dict or None: The daemon's response, or None if no daemon accepted the connection.
+    '''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client:
+        try:
+            client.connect(socket_path(file_path))
+        except OSError: # No daemon, or a stale socket: the caller runs the command itself
+            return None
+        client.sendall(json.dumps({'argv': argv}).encode('utf-8') + b'\n')
+        with client.makefile('rb') as response:
+            return json.loads(response.readline())
+
+
+def serve(file_path):
+    '''
+    Run a daemon for a store until it is interrupted or terminated.
+
+    Args:
+        file_path (str): Path to the habit store to serve.
+    '''
+    try:
+        daemon = HabitDaemon(file_path)
+    except OSError as error:
+        print(f'{Fore.RED}Error: {Style.RESET_ALL} {error}')
+        return
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    print(f'{Fore.GREEN}Serving {Fore.YELLOW}{file_path}{Fore.GREEN} on {Fore.YELLOW}{daemon.server_address}{Style.RESET_ALL}', flush=True)
+    with daemon:
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    print(f'{Fore.GREEN}Daemon stopped{Style.RESET_ALL}')
@@ -1,47 +1,786 @@
 import json
-from habit_manager import Habit
+import os
+import re
+import stat
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from habit_manager import Habit, HabitCollection, get_habit_by_name
+from profiling import profiler
 from colorama import Fore, Style
 
-def load_info(file_path):
+try:
+    import fcntl
+except ImportError: # Windows has no fcntl; lock files with msvcrt instead
+    fcntl = None
+    import msvcrt
+
+LOG_SUFFIX = '.log'
+LOCK_SUFFIX = '.lock'
+SOCKET_SUFFIX = '.sock'
+CACHE_SUFFIX = '.cache'
+PARSED_CACHE_SUFFIX = '.parsed'
+COMPACTION_THRESHOLD = 64 * 1024 # Fold the completion log into the snapshot once it grows past this many bytes
+LOG_BATCH_SIZE = 256 # Number of buffered completion records written per fsync
+STREAM_CHUNK_SIZE = 64 * 1024 # Number of characters read from a snapshot at a time while streaming it
+EAGER_DECODE_THRESHOLD = 8 * 1024 * 1024 # Snapshots at least this large have their completions decoded while loading
+PARSED_CACHE_THRESHOLD = 1024 * 1024 # JSON snapshots at least this large keep a parsed copy next to them, which loads much faster
+SQLITE_SCHEME = 'sqlite:///'
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+BINARY_EXTENSIONS = ('.hbin',)
+
+def sqlite_path(file_path):
+    '''
+    Return the database path if a store path selects the SQLite backend.
+
+    A store is kept in SQLite when its path uses the 'sqlite:///' scheme or ends in '.db', '.sqlite' or '.sqlite3'.
+
+    Args:
+        file_path (str): Path to the habit store.
+
+    Returns:
+        str or None: Path to the SQLite database file, or None for a JSON store.
+    '''
+    if file_path.startswith(SQLITE_SCHEME):
+        return file_path[len(SQLITE_SCHEME):]
+    if file_path.lower().endswith(SQLITE_EXTENSIONS):
+        return file_path
+    return None
+
+
+def is_binary(file_path):
+    '''
+    Check whether a JSON-backend store keeps its snapshot in the compact binary format.
+
+    Args:
+        file_path (str): Path to the habit store.
+
+    Returns:
+        bool: True if the store path ends in '.hbin'.
+    '''
+    return file_path.lower().endswith(BINARY_EXTENSIONS)
+
+
+def is_directory(file_path):
+    '''
+    Check whether a store keeps a manifest and one file per habit in a directory.
+
+    Args:
+        file_path (str): Path to the habit store.
+
+    Returns:
+        bool: True if the path ends in a path separator or names an existing directory.
+    '''
+    return file_path.endswith(('/', os.sep)) or os.path.isdir(file_path)
+
+
+def supports_queries(file_path):
+    '''
+    Check whether a store can answer single-habit and summary queries without being loaded in full.
+
+    Args:
+        file_path (str): Path to the habit store.
+
+    Returns:
+        bool: True if load_habit and load_summaries can be used on the store.
+    '''
+    return sqlite_path(file_path) is not None
+
+
+def _lock_file(file):
+    '''Block until an exclusive advisory lock on an open file is acquired.'''
+    if fcntl:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(file):
+    '''Release the advisory lock on an open file.'''
+    if fcntl:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+_held_locks = {} # Lock file path -> [thread lock, open lock file, nesting depth]
+_held_locks_guard = threading.Lock()
+
+@contextmanager
+def store_lock(file_path):
+    '''
+    Hold an exclusive advisory lock on a habit store, so concurrent processes serialize their access to it.
+
+    The lock is taken on a '.lock' file next to the store. It is reentrant within a process, so functions
+    that take it can call each other, and it also serializes threads of the same process.
+
+    Args:
+        file_path (str): Path to the habit store.
+    '''
+    path = os.path.abspath(sqlite_path(file_path) or file_path) + LOCK_SUFFIX
+    with _held_locks_guard:
+        held_lock = _held_locks.setdefault(path, [threading.RLock(), None, 0])
+
+    with held_lock[0]:
+        if held_lock[2] == 0:
+            lock_file = open(path, 'a')
+            try:
+                _lock_file(lock_file)
+            except BaseException:
+                lock_file.close()
+                raise
+            held_lock[1] = lock_file
+        held_lock[2] += 1
+        try:
+            yield
+        finally:
+            held_lock[2] -= 1
+            if held_lock[2] == 0:
+                _unlock_file(held_lock[1])
+                held_lock[1].close()
+                held_lock[1] = None
+
+
+def write_atomically(file_path, write, mode='w'):
+    '''
+    Replace a file's contents without ever leaving it partially written.
+
+    The contents are written to a temporary file in the same directory, flushed to disk, and renamed over
+    the original, so a crash or interrupt leaves either the old or the new file in place.
+
+    Args:
+        file_path (str): Path to the file to replace.
+        write (callable): Called with the open temporary file to write the new contents.
+        mode (str, optional): Mode the temporary file is opened in; 'wb' for binary contents. Defaults to 'w'.
+    '''
+    import tempfile # Only needed when saving, so keep it off the startup path
+    directory = os.path.dirname(os.path.abspath(file_path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(file_path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, mode) as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(file_path): # Keep the permissions of the file being replaced
+            os.chmod(temp_path, stat.S_IMODE(os.stat(file_path).st_mode))
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    if fcntl: # Make the rename itself durable; directories cannot be opened this way on Windows
+        directory_descriptor = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_descriptor)
+        finally:
+            os.close(directory_descriptor)
+
+
+def log_path(file_path):
+    '''
+    Return the path of the completion log that belongs to a snapshot file.
+
+    Args:
+        file_path (str): Path to the JSON snapshot file.
+
+    Returns:
+        str: Path to the append-only completion log.
+    '''
+    return file_path + LOG_SUFFIX
+
+
+def socket_path(file_path):
+    '''
+    Return the path of the Unix socket a daemon serving the store listens on.
+
+    Args:
+        file_path (str): Path to the habit store.
+
+    Returns:
+        str: Absolute path to the daemon's socket, next to the store.
+    '''
+    return os.path.abspath(sqlite_path(file_path) or file_path) + SOCKET_SUFFIX
+
+
+class CompletionLog:
+    '''
+    Append-only log of completion events recorded since the last snapshot.
+
+    Each event is written as one compact JSON line. Records are buffered and flushed in batches,
+    with a single fsync per batch, so recording a completion does not depend on the size of the history.
+    '''
+    def __init__(self, file_path, batch_size=LOG_BATCH_SIZE, store_path=None):
+        '''
+        Initialize a CompletionLog for the given snapshot file.
+
+        Args:
+            file_path (str): Path to the JSON snapshot file the log belongs to.
+            batch_size (int, optional): Number of records buffered before they are flushed to disk.
+            store_path (str, optional): Path to the store whose lock is held while writing. Defaults to file_path.
+        '''
+        self.file_path = file_path
+        self.store_path = store_path or file_path
+        self.path = log_path(file_path)
+        self.batch_size = batch_size
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def append(self, habit_name, completion_datetime):
+        '''
+        Buffer a completion event, flushing the buffer once it reaches the batch size.
+
+        Args:
+            habit_name (str): The name of the completed habit.
+            completion_datetime (datetime): The completion date and time.
+        '''
+        record = {'habit': habit_name, 'completion': completion_datetime.isoformat()}
+        self.pending.append(json.dumps(record, separators=(',', ':')) + '\n')
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        '''Write all buffered records to the end of the log and fsync them.'''
+        if not self.pending:
+            return
+        records = ''.join(self.pending)
+        with store_lock(self.store_path), open(self.path, 'a') as file:
+            file.write(records)
+            file.flush()
+            os.fsync(file.fileno())
+        profiler.count('bytes_written', len(records.encode('utf-8')) if profiler.enabled else 0)
+        self.pending = []
+
+
+def reset_log(file_path, log_id):
+    '''
+    Start a new, empty completion log tagged with the id of the snapshot it extends.
+
+    Args:
+        file_path (str): Path to the JSON snapshot file.
+        log_id (str): Id stored in the snapshot the new log belongs to.
+    '''
+    write_atomically(log_path(file_path), lambda file: file.write(json.dumps({'log_id': log_id}, separators=(',', ':')) + '\n'))
+
+
+def read_log(file_path, log_id=None):
+    '''
+    Read the completion events recorded in the log since the last snapshot.
+
+    A log whose header names a different snapshot is stale (left behind by an interrupted compaction)
+    and is ignored. A torn trailing record from an interrupted write is skipped.
+
+    Args:
+        file_path (str): Path to the JSON snapshot file.
+        log_id (str, optional): Id stored in the loaded snapshot.
+
+    Returns:
+        list: (habit name, completion datetime) tuples in the order they were recorded.
+    '''
+    events = []
+    try:
+        with open(log_path(file_path), 'r') as file:
+            profiler.count('bytes_read', os.fstat(file.fileno()).st_size)
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    if 'log_id' in record:
+                        if record['log_id'] != log_id:
+                            return []
+                        continue
+                    events.append((record['habit'], datetime.fromisoformat(record['completion'])))
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return events
+
+
+def replay_log(habit_list, events):
+    '''
+    Apply logged completion events on top of habits loaded from a snapshot.
+
+    Args:
+        habit_list (list): List of Habit objects loaded from the snapshot.
+        events (list): (habit name, completion datetime) tuples from the completion log.
+    '''
+    profiler.count('log_events_replayed', len(events))
+    for habit_name, completion_datetime in events:
+        habit = get_habit_by_name(habit_list, habit_name)
+        if habit: # Events for habits that no longer exist are dropped
+            habit.complete_habit(completion_datetime)
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+class HabitStream:
+    '''
+    Incremental reader for the habits of a JSON snapshot.
+
+    Iterating over the stream yields the dictionary of one habit at a time from the snapshot's 'habits' array,
+    reading the file in chunks, so only the habit being decoded and a small read buffer are held in memory
+    instead of the parsed tree of the whole file. The other top-level values (such as the log id) are
+    collected in `metadata` as they are encountered.
+    '''
+    def __init__(self, file, chunk_size=STREAM_CHUNK_SIZE):
+        '''
+        Initialize a HabitStream over an open snapshot file.
+
+        Args:
+            file (file): The snapshot, opened for reading in text mode.
+            chunk_size (int, optional): Number of characters read at a time.
+        '''
+        self.file = file
+        self.chunk_size = chunk_size
+        self.metadata = {}
+        self._buffer = ''
+        self._position = 0
+
+    def _read(self, size):
+        '''Append up to size characters to the buffer, dropping what has been consumed. Returns False at the end of the file.'''
+        chunk = self.file.read(size)
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def _peek(self):
+        '''Skip whitespace and return the next character, or an empty string at the end of the file.'''
+        while True:
+            self._position = _WHITESPACE.match(self._buffer, self._position).end()
+            if self._position < len(self._buffer) or not self._read(self.chunk_size):
+                return self._buffer[self._position:self._position + 1]
+
+    def _expect(self, character):
+        '''Consume the given structural character, or raise JSONDecodeError.'''
+        if self._peek() != character:
+            raise json.JSONDecodeError(f'Expecting {character!r}', self._buffer, self._position)
+        self._position += 1
+
+    def _value(self):
+        '''Decode and consume the next JSON value, reading more of the file until it is complete.'''
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._read(max(self.chunk_size, len(self._buffer) - self._position)): # Double the buffer, so large habits are retried only a few times
+                    raise
+                continue
+            if end == len(self._buffer) and self._read(self.chunk_size): # A number may continue in the next chunk
+                continue
+            self._position = end
+            return value
+
+    def __iter__(self):
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError('Expecting property name', self._buffer, self._position)
+            self._expect(':')
+            if key == 'habits':
+                self._expect('[')
+                if self._peek() == ']':
+                    self._position += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._peek() != ',':
+                            break
+                        self._position += 1
+                    self._expect(']')
+            else:
+                self.metadata[key] = self._value()
+            if self._peek() != ',':
+                break
+            self._position += 1
+        self._expect('}')
+
+
+def read_json_snapshot(file):
+    '''
+    Read habits from a JSON snapshot, one habit at a time.
+
+    The file is parsed with HabitStream, so loading does not build the parsed tree of the whole store.
+    Completions of snapshots of at least EAGER_DECODE_THRESHOLD bytes are converted to their compact form as
+    each habit is read, bounding peak memory by the largest single habit; smaller snapshots keep them as
+    strings until they are first used.
+
+    Args:
+        file (file): The snapshot, opened for reading in text mode.
+
+    Returns:
+        tuple: The loaded HabitCollection and the id of the completion log that extends the snapshot.
+    '''
+    stream = HabitStream(file)
+    decode = os.fstat(file.fileno()).st_size >= EAGER_DECODE_THRESHOLD
+    habit_list = HabitCollection()
+    habit_dicts = iter(stream)
+    while True:
+        with profiler.phase('json_decode'):
+            habit_dict = next(habit_dicts, None)
+        if habit_dict is None:
+            break
+        with profiler.phase('from_dictionary'):
+            habit = Habit.from_dictionary(habit_dict) # Create a Habit object from each dictionary, dropping the dictionary before the next is read
+        if decode:
+            habit.completions.timestamps
+        habit_list.append_loaded(habit)
+    return habit_list, stream.metadata.get('log_id')
+
+
+def parsed_cache_path(file_path):
+    '''
+    Return the path of the parsed copy kept next to a large JSON snapshot.
+
+    Args:
+        file_path (str): Path to the JSON snapshot.
+
+    Returns:
+        str: Path to the parsed copy.
+    '''
+    return file_path + PARSED_CACHE_SUFFIX
+
+
+def read_cached_json_snapshot(file, file_path):
+    '''
+    Read habits from a JSON snapshot, or from the parsed copy kept next to it if the copy is up to date.
+
+    The parsed copy holds the habits as they were decoded from the snapshot, in a binary format that loads
+    without parsing, along with the snapshot's modification time, size and SHA-256 hash. It is only used if
+    all three still match the snapshot, and is rewritten from the snapshot otherwise, so saves and edits
+    by hand are always picked up.
+
+    Args:
+        file (file): The snapshot, opened for reading in text mode.
+        file_path (str): Path to the snapshot.
+
+    Returns:
+        tuple: The loaded HabitCollection and the id of the completion log that extends the snapshot.
+    '''
+    import snapshot_cache
+    path = parsed_cache_path(file_path)
+    with profiler.phase('hash_snapshot'):
+        signature = snapshot_cache.snapshot_signature(file_path)
+    try:
+        with open(path, 'rb') as cache_file, profiler.phase('read_parsed_cache'):
+            cached = snapshot_cache.read_cache(cache_file, signature)
+    except OSError:
+        cached = None
+    if cached is not None:
+        profiler.count('parsed_cache_hits')
+        return cached
+
+    habit_list, log_id = read_json_snapshot(file)
+    try:
+        with profiler.phase('write_parsed_cache'):
+            write_atomically(path, lambda cache_file: snapshot_cache.write_cache(cache_file, signature, habit_list, log_id), 'wb')
+    except OSError: # The parsed copy is only an optimization
+        pass
+    return habit_list, log_id
+
+
+def load_info(file_path, verbose=True):
     '''
-    Load habit data from a JSON file.
+    Load habit data from a JSON or binary snapshot and replay the completion log on top of it.
 
     Args:
-        file_path (str): Path to the JSON file.
+        file_path (str): Path to the JSON file, to a '.hbin' binary snapshot, to a SQLite store, or to a directory store.
+        verbose (bool, optional): Whether to print status messages. Errors are always printed. Defaults to True.
 
     Returns:
-        list: List of Habit objects.
+        HabitCollection: The loaded habits, indexed by name and periodicity.
     '''
-    print(f'{Fore.YELLOW}{Style.BRIGHT}Loading data from file: {file_path}{Style.RESET_ALL}')
-    
+    with profiler.phase('load'):
+        habit_list = _load_info(file_path, verbose)
+    for name, new_name in habit_list.renamed:
+        print(f'{Fore.YELLOW}Warning: {Style.RESET_ALL} Several habits are named {name}; one of them was renamed to {new_name}.')
+    if not is_directory(file_path): # Directory stores count habits as they are read from their files
+        profiler.count('habits_loaded', len(habit_list))
+        profiler.count('completions_loaded', sum(len(habit.completions) for habit in habit_list) if profiler.enabled else 0)
+    return habit_list
+
+
+def _load_info(file_path, verbose):
+    '''Load habit data from any kind of store; see load_info.'''
+    db_path = sqlite_path(file_path)
+    if db_path:
+        import sqlite_storage # Only imported for SQLite stores, so JSON stores start faster
+        return sqlite_storage.load_info(db_path, verbose)
+    if is_directory(file_path):
+        import directory_storage
+        return directory_storage.load_info(file_path, verbose)
+
+    if verbose:
+        print(f'{Fore.YELLOW}{Style.BRIGHT}Loading data from file: {file_path}{Style.RESET_ALL}')
+
+    binary = is_binary(file_path)
+    if binary:
+        import binary_storage
+        format_error = binary_storage.SnapshotError
+    else:
+        format_error = json.JSONDecodeError
+
     try:
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-            habit_list = [Habit.from_dictionary(habit_dict) for habit_dict in data['habits']] # Create a Habit object from each dictionary in the list of dictionaries
-            
-            print(f'{Fore.GREEN}Data loaded successfully{Style.RESET_ALL}')
+        with store_lock(file_path), open(file_path, 'rb' if binary else 'r') as file: # Locked so the snapshot and log are read as a consistent pair
+            profiler.count('bytes_read', os.fstat(file.fileno()).st_size)
+            with profiler.phase('read_snapshot'):
+                if binary:
+                    habit_list, log_id = binary_storage.read_snapshot(file)
+                elif os.fstat(file.fileno()).st_size >= PARSED_CACHE_THRESHOLD:
+                    habit_list, log_id = read_cached_json_snapshot(file, file_path)
+                else:
+                    habit_list, log_id = read_json_snapshot(file)
+            with profiler.phase('replay_log'):
+                replay_log(habit_list, read_log(file_path, log_id))
+
+            if verbose:
+                print(f'{Fore.GREEN}Data loaded successfully{Style.RESET_ALL}')
             return habit_list
-    except (FileNotFoundError, json.JSONDecodeError): 
-        print(f'{Fore.RED}Error: {Style.RESET_ALL} File not found or failed to decode JSON data.')
-        return []
+    except (FileNotFoundError, format_error):
+        print(f'{Fore.RED}Error: {Style.RESET_ALL} File not found or failed to decode {"the binary snapshot" if binary else "JSON data"}.')
+        return HabitCollection()
 
 
-def save_info(habit_list, file_path):
+def save_info(habit_list, file_path, verbose=True):
     '''
-    Save habit data to a JSON file.
+    Save habit data to a JSON or binary snapshot and start a new, empty completion log.
 
     Args:
         habit_list (list): List of Habit objects.
-        file_path (str): Path to the JSON file where data will be saved.
+        file_path (str): Path to the JSON file where data will be saved, to a '.hbin' binary snapshot, to a SQLite store, or to a directory store.
+        verbose (bool, optional): Whether to print status messages. Errors are always printed. Defaults to True.
+
+    Returns:
+        bool: True if the data was saved.
     '''
-    print(f'{Fore.GREEN}Saving data to file: {file_path}{Style.RESET_ALL}')
+    with profiler.phase('save'):
+        return _save_info(habit_list, file_path, verbose)
+
+
+def _save_info(habit_list, file_path, verbose):
+    '''Save habit data to any kind of store; see save_info.'''
+    db_path = sqlite_path(file_path)
+    if db_path:
+        import sqlite_storage
+        return sqlite_storage.save_info(habit_list, db_path, verbose)
+    if is_directory(file_path):
+        import directory_storage
+        return directory_storage.save_info(habit_list, file_path, verbose)
+
+    if verbose:
+        print(f'{Fore.GREEN}Saving data to file: {file_path}{Style.RESET_ALL}')
+
+    log_id = os.urandom(16).hex()
+    if is_binary(file_path):
+        import binary_storage
+        write_snapshot, mode = lambda file: binary_storage.write_snapshot(file, habit_list, log_id), 'wb'
+    else:
+        data = {'log_id': log_id, 'habits': [habit.to_dictionary() for habit in habit_list]}
+        write_snapshot, mode = lambda file: json.dump(data, file, indent=4), 'w' # Indent the data for readability
 
-    data = {'habits': [habit.to_dictionary() for habit in habit_list]}
-    
     try:
-        with open(file_path, 'w') as file:
-            json.dump(data, file, indent=4) # Indent the data for readability
-            
+        with store_lock(file_path):
+            write_atomically(file_path, write_snapshot, mode)
+            reset_log(file_path, log_id) # The snapshot now holds every logged event, so the old log is obsolete
+            profiler.count('bytes_written', os.path.getsize(file_path) + os.path.getsize(log_path(file_path)) if profiler.enabled else 0)
+
+        if verbose:
             print(f'{Fore.GREEN}Data saved successfully{Style.RESET_ALL}')
+        return True
     except IOError:
-        print(f'{Fore.RED}Error: {Style.RESET_ALL} Failed to save data.')
\ No newline at end of file
+        print(f'{Fore.RED}Error: {Style.RESET_ALL} Failed to save data.')
+        return False
+
+
+def append_completion(habit_list, habit_name, completion_datetime, file_path, verbose=True):
+    '''
+    Persist a single completion by appending it to the completion log.
+
+    The log is compacted into the snapshot once it grows past COMPACTION_THRESHOLD bytes,
+    so the cost of recording a completion does not grow with the size of the history.
+
+    Args:
+        habit_list (list): List of Habit objects, already containing the new completion.
+        habit_name (str): The name of the completed habit.
+        completion_datetime (datetime): The completion date and time.
+        file_path (str): Path to the JSON snapshot file, or to a SQLite store.
+        verbose (bool, optional): Whether to print status messages when the log is compacted. Defaults to True.
+
+    Returns:
+        bool: True if the completion was saved.
+    '''
+    return append_completions(habit_list, [(habit_name, completion_datetime)], file_path, verbose)
+
+
+def append_completions(habit_list, completions, file_path, verbose=True):
+    '''
+    Persist a batch of completions with one append to the completion log, or one SQLite transaction.
+
+    Args:
+        habit_list (list): List of Habit objects, already containing the new completions.
+        completions (list): (habit name, completion datetime) tuples, in the order they were recorded.
+        file_path (str): Path to the JSON snapshot file, to a SQLite store, or to a directory store.
+        verbose (bool, optional): Whether to print status messages when the log is compacted. Defaults to True.
+
+    Returns:
+        bool: True if the completions were saved.
+    '''
+    profiler.count('completions_appended', len(completions))
+    with profiler.phase('append'):
+        return _append_completions(habit_list, completions, file_path, verbose)
+
+
+def _append_completions(habit_list, completions, file_path, verbose):
+    '''Persist a batch of completions to any kind of store; see append_completions.'''
+    db_path = sqlite_path(file_path)
+    if db_path:
+        import sqlite_storage
+        return sqlite_storage.append_completions(completions, db_path)
+    if is_directory(file_path):
+        import directory_storage
+        return directory_storage.append_completions(habit_list, completions, file_path, verbose)
+
+    with store_lock(file_path):
+        try:
+            with CompletionLog(file_path, batch_size=max(len(completions), 1)) as log:
+                for habit_name, completion_datetime in completions:
+                    log.append(habit_name, completion_datetime)
+        except IOError:
+            print(f'{Fore.RED}Error: {Style.RESET_ALL} Failed to save data.')
+            return False
+
+        if os.path.getsize(log_path(file_path)) >= COMPACTION_THRESHOLD:
+            save_info(habit_list, file_path, verbose)
+    return True
+
+
+def cache_path(file_path):
+    '''
+    Return the path of the analytics cache saved next to a store.
+
+    Args:
+        file_path (str): Path to the habit store.
+
+    Returns:
+        str: Path to the analytics cache file.
+    '''
+    return (sqlite_path(file_path) or file_path) + CACHE_SUFFIX
+
+
+def load_analytics_cache(cache, file_path):
+    '''
+    Load the analytics results and counters saved next to a store into a cache, replacing those it loaded before.
+    A missing or unreadable cache file is ignored.
+
+    Args:
+        cache (AnalyticsCache): The cache to load the saved results into.
+        file_path (str): Path to the habit store.
+    '''
+    try:
+        with open(cache_path(file_path), 'r') as file:
+            cache.update_from_dictionary(json.load(file))
+    except (OSError, ValueError):
+        pass
+
+
+def save_analytics_cache(cache, file_path):
+    '''
+    Save an analytics cache next to a store, if it changed since it was loaded. Failures are ignored, as the cache is only an optimization.
+
+    Args:
+        cache (AnalyticsCache): The cache to save.
+        file_path (str): Path to the habit store.
+    '''
+    if not cache.changed:
+        return
+    data = cache.to_dictionary()
+    try:
+        write_atomically(cache_path(file_path), lambda file: json.dump(data, file, separators=(',', ':')))
+        cache.changed = False
+    except OSError:
+        pass
+
+
+def load_habit(file_path, name):
+    '''
+    Load a single habit from a store that supports queries, reading only that habit's rows.
+
+    Args:
+        file_path (str): Path to the habit store.
+        name (str): The name of the habit to retrieve.
+
+    Returns:
+        Habit or None: The Habit instance with the matching name, if it exists; None otherwise.
+    '''
+    import sqlite_storage
+    return sqlite_storage.load_habit(sqlite_path(file_path), name)
+
+
+def load_summaries(file_path):
+    '''
+    Load all habits without their completions, along with their completion counts, from a store that supports queries.
+
+    Args:
+        file_path (str): Path to the habit store.
+
+    Returns:
+        tuple: List of Habit objects with empty completions, a dictionary mapping habit names to completion counts,
+            and a dictionary mapping the names of weekly habits to the ISO weeks they were completed in.
+    '''
+    import sqlite_storage
+    return sqlite_storage.load_summaries(sqlite_path(file_path))
+
+
+def read_completions(source):
+    '''
+    Read (habit name, completion datetime) pairs from a CSV file or standard input.
+
+    Each line holds a habit name and, optionally, an ISO formatted completion datetime.
+    Blank lines and lines starting with '#' are skipped.
+
+    Args:
+        source (str): Path to the CSV file, or '-' to read from standard input.
+
+    Returns:
+        list: (habit name, completion datetime or None) tuples, in input order.
+
+    Raises:
+        ValueError: If a line has too many fields or an invalid datetime.
+    '''
+    import csv # Only needed for bulk input, so keep it off the startup path
+    file = sys.stdin if source == '-' else open(source, 'r', newline='')
+    try:
+        completions = []
+        for line_number, row in enumerate(csv.reader(file), start=1):
+            if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+                continue
+            if len(row) > 2:
+                raise ValueError(f'line {line_number}: expected a habit name and an optional completion datetime')
+            habit_name = row[0].strip()
+            try:
+                completion_datetime = datetime.fromisoformat(row[1].strip()) if len(row) == 2 and row[1].strip() else None
+            except ValueError:
+                raise ValueError(f'line {line_number}: invalid completion datetime {row[1].strip()!r}')
+            if completion_datetime is not None and completion_datetime.tzinfo is not None:
+                raise ValueError(f'line {line_number}: completion datetime {row[1].strip()!r} must be a local time without a UTC offset')
+            completions.append((habit_name, completion_datetime))
+        return completions
+    finally:
+        if file is not sys.stdin:
+            file.close()
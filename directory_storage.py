@@ -0,0 +1,328 @@
+import json
+import os
+from operator import itemgetter
+from habit_manager import Habit, HabitCollection, get_habit_by_name, unique_name
+from profiling import profiler
+from data_storage import COMPACTION_THRESHOLD, CompletionLog, log_path, read_log, reset_log, store_lock, write_atomically
+from colorama import Fore, Style
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+def manifest_path(directory):
+    '''Return the path of the manifest of a directory store.'''
+    return os.path.join(directory, MANIFEST_NAME)
+
+
+def read_manifest(directory):
+    '''
+    Read the manifest of a directory store: the names of its habits, in order, and the files holding them.
+
+    Args:
+        directory (str): Path to the store's directory.
+
+    Returns:
+        dict: The manifest, with its 'version', the 'next_id' used to name new habit files, and one
+            {'name', 'file'} entry per habit. An empty manifest if the store does not exist yet.
+
+    Raises:
+        ValueError: If the manifest is not valid JSON or uses an unsupported version.
+    '''
+    try:
+        with open(manifest_path(directory), 'r') as file:
+            profiler.count('bytes_read', os.fstat(file.fileno()).st_size)
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return {'version': MANIFEST_VERSION, 'next_id': 1, 'habits': []}
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version {manifest.get('version')}")
+    return manifest
+
+
+def read_habit(directory, file_name):
+    '''
+    Read one habit from its file and replay the completions logged for it since the file was written.
+
+    Args:
+        directory (str): Path to the store's directory.
+        file_name (str): Name of the habit's file, as listed in the manifest.
+
+    Returns:
+        Habit: The loaded habit.
+    '''
+    path = os.path.join(directory, file_name)
+    with profiler.phase('read_habit'):
+        with open(path, 'r') as file:
+            profiler.count('bytes_read', os.fstat(file.fileno()).st_size)
+            data = json.load(file)
+        habit = Habit.from_dictionary(data['habit'])
+        events = read_log(path, data['log_id'])
+        profiler.count('log_events_replayed', len(events))
+        for _, completion_datetime in events: # The log only holds this habit's completions
+            habit.complete_habit(completion_datetime)
+    profiler.count('habits_loaded')
+    profiler.count('completions_loaded', len(habit.completions))
+    return habit
+
+
+def write_habit(directory, file_name, habit):
+    '''
+    Write one habit to its file and start a new, empty completion log for it.
+
+    Args:
+        directory (str): Path to the store's directory.
+        file_name (str): Name of the habit's file.
+        habit (Habit): The habit to write.
+    '''
+    path = os.path.join(directory, file_name)
+    log_id = os.urandom(16).hex()
+    data = {'log_id': log_id, 'habit': habit.to_dictionary()}
+    write_atomically(path, lambda file: json.dump(data, file, indent=4))
+    reset_log(path, log_id)
+    profiler.count('bytes_written', os.path.getsize(path) + os.path.getsize(log_path(path)) if profiler.enabled else 0)
+
+
+def remove_habit_files(directory, file_name):
+    '''Remove a habit's file and completion log, if they exist.'''
+    path = os.path.join(directory, file_name)
+    for stale_path in (path, log_path(path)):
+        try:
+            os.remove(stale_path)
+        except FileNotFoundError:
+            pass
+
+
+class DirectoryHabitCollection(HabitCollection):
+    '''
+    The habits of a directory store, each read from its own file the first time it is needed.
+
+    Looking a habit up by name reads only that habit's file; iterating, indexing or filtering reads the
+    habits not read yet. The collection remembers which file each habit came from and the version it had
+    when it was read or last written, so save_info only rewrites the habits that changed since. A habit
+    whose file is missing or corrupt is reported and left out, but stays in the manifest with its file.
+    '''
+    def __init__(self, directory, entries):
+        '''
+        Initialize a DirectoryHabitCollection from the entries of a store's manifest.
+
+        Args:
+            directory (str): Path to the store's directory.
+            entries (list): The manifest's {'name', 'file'} entries, in collection order.
+        '''
+        super().__init__()
+        self.directory = directory
+        self.files = {} # Habit -> [file name, version when last read or written]
+        self._unread = {}
+        self._unreadable = {} # Habits whose file could not be read, kept in the manifest as they are
+        for position, entry in enumerate(entries):
+            name = unique_name(entry['name'], self._unread) # Renamed like habits of other stores, see HabitCollection.append_loaded
+            if name != entry['name']:
+                self.renamed.append((entry['name'], name))
+            self._unread[name] = (position, entry['file'])
+        self._next_position = len(entries)
+        self._ordered = True # Whether the indexes are in collection order; habits read by name are added out of order
+
+    def _read(self, name):
+        '''Read the habit with the given name from its file and add it to the indexes at its position; None if the file cannot be read.'''
+        position, file_name = self._unread.pop(name)
+        try:
+            habit = read_habit(self.directory, file_name)
+        except (OSError, ValueError, KeyError):
+            print(f'{Fore.RED}Error: {Style.RESET_ALL} File {file_name} of habit {name} not found or failed to decode JSON data.')
+            self._unreadable[name] = (position, file_name)
+            return None
+        self._positions[habit] = position
+        self._by_name[name] = habit
+        self._by_periodicity.setdefault(habit.periodicity, {})[habit] = None
+        self.files[habit] = [file_name, habit.version]
+        if habit.name != name: # Renamed on load; written with its new name on the next save
+            habit.name = name
+            self.files[habit][1] = None
+        self._ordered = False
+        return habit
+
+    def _read_all(self):
+        '''Read every habit not read yet, and restore collection order in the indexes.'''
+        for name in list(self._unread):
+            self._read(name)
+        if self._ordered:
+            return
+        self._ordered = True
+        self._positions = dict(sorted(self._positions.items(), key=itemgetter(1)))
+        for periodicity, habits in self._by_periodicity.items():
+            self._by_periodicity[periodicity] = dict.fromkeys(sorted(habits, key=self._positions.__getitem__))
+
+    def entries(self):
+        '''
+        Return the habits in collection order, without reading any.
+
+        Returns:
+            list: (name, habit, file name) tuples; the habit is None if it has not been read or could not be, and the
+                file name is None for habits added since the store was loaded.
+        '''
+        entries = [(position, name, None, file_name) for unread in (self._unread, self._unreadable) for name, (position, file_name) in unread.items()]
+        entries.extend((position, habit.name, habit, self.files.get(habit, [None])[0]) for habit, position in self._positions.items())
+        entries.sort(key=itemgetter(0))
+        return [entry[1:] for entry in entries]
+
+    def __len__(self):
+        return len(self._positions) + len(self._unread)
+
+    def __iter__(self):
+        self._read_all()
+        return super().__iter__()
+
+    def __getitem__(self, index):
+        self._read_all()
+        return super().__getitem__(index)
+
+    def __repr__(self):
+        self._read_all()
+        return super().__repr__()
+
+    def get(self, name):
+        if name in self._unread:
+            return self._read(name)
+        return super().get(name)
+
+    def with_periodicity(self, periodicity):
+        self._read_all()
+        return super().with_periodicity(periodicity)
+
+    def append(self, habit):
+        if habit.name in self._unread or habit.name in self._unreadable:
+            raise ValueError(f'A habit with the name {habit.name} already exists')
+        super().append(habit)
+
+    def clear(self):
+        self._unread.clear()
+        self._unreadable.clear()
+        super().clear()
+
+    def rename(self, habit, name):
+        if name in self._unread or name in self._unreadable:
+            raise ValueError(f'A habit with the name {name} already exists')
+        super().rename(habit, name)
+
+
+def load_info(directory, verbose=True):
+    '''
+    Load the manifest of a directory store; habits are read from their files when they are first needed.
+
+    Args:
+        directory (str): Path to the store's directory.
+        verbose (bool, optional): Whether to print status messages. Errors are always printed. Defaults to True.
+
+    Returns:
+        DirectoryHabitCollection: The store's habits, indexed by name and periodicity as they are read.
+    '''
+    if verbose:
+        print(f'{Fore.YELLOW}{Style.BRIGHT}Loading data from directory: {directory}{Style.RESET_ALL}')
+    try:
+        manifest = read_manifest(directory)
+    except ValueError:
+        print(f'{Fore.RED}Error: {Style.RESET_ALL} Failed to decode the manifest.')
+        return DirectoryHabitCollection(directory, [])
+    if verbose:
+        print(f'{Fore.GREEN}Data loaded successfully{Style.RESET_ALL}')
+    return DirectoryHabitCollection(directory, manifest['habits'])
+
+
+def save_info(habit_list, directory, verbose=True):
+    '''
+    Save habits to a directory store, rewriting only the files of habits that changed.
+
+    Habits of a DirectoryHabitCollection loaded from the same directory are written only if their version
+    changed since they were read or last written, and habits that were never read are left untouched.
+    Other habits, for example when exporting from another store, are all written. The manifest is only
+    rewritten when habits were added, removed, renamed or reordered, after the habit files, so an
+    interrupted save never lists a file that was not written.
+
+    Args:
+        habit_list (list): List of Habit objects.
+        directory (str): Path to the store's directory.
+        verbose (bool, optional): Whether to print status messages. Errors are always printed. Defaults to True.
+
+    Returns:
+        bool: True if the data was saved.
+    '''
+    if verbose:
+        print(f'{Fore.GREEN}Saving data to directory: {directory}{Style.RESET_ALL}')
+
+    tracked = isinstance(habit_list, DirectoryHabitCollection) and os.path.abspath(habit_list.directory) == os.path.abspath(directory)
+    entries = habit_list.entries() if tracked else [(habit.name, habit, None) for habit in habit_list]
+    files = habit_list.files if tracked else {}
+    try:
+        with store_lock(directory):
+            os.makedirs(directory, exist_ok=True)
+            manifest = read_manifest(directory)
+            previous_files = {entry['name']: entry['file'] for entry in manifest['habits']}
+            claimed = {file_name for _, _, file_name in entries if file_name}
+            next_id = manifest['next_id']
+            habits, written = [], 0
+            for name, habit, file_name in entries:
+                if file_name is None: # A new habit; reuse the file of a habit with the same name, if no other habit holds it
+                    file_name = previous_files.get(name)
+                    if file_name is None or file_name in claimed:
+                        file_name, next_id = f'{next_id}.json', next_id + 1
+                    claimed.add(file_name)
+                if habit is not None and files.get(habit) != [file_name, habit.version]:
+                    write_habit(directory, file_name, habit)
+                    files[habit] = [file_name, habit.version]
+                    written += 1
+                habits.append({'name': name, 'file': file_name})
+
+            updated_manifest = {'version': MANIFEST_VERSION, 'next_id': next_id, 'habits': habits}
+            if updated_manifest != manifest:
+                write_atomically(manifest_path(directory), lambda file: json.dump(updated_manifest, file, indent=4))
+                profiler.count('bytes_written', os.path.getsize(manifest_path(directory)) if profiler.enabled else 0)
+                for file_name in set(previous_files.values()) - claimed: # Removed habits, once the manifest no longer lists them
+                    remove_habit_files(directory, file_name)
+
+        if verbose:
+            print(f'{Fore.GREEN}Data saved successfully ({written} changed habits written){Style.RESET_ALL}')
+        return True
+    except (IOError, ValueError):
+        print(f'{Fore.RED}Error: {Style.RESET_ALL} Failed to save data.')
+        return False
+
+
+def append_completions(habit_list, completions, directory, verbose=True):
+    '''
+    Persist a batch of completions by appending them to the completion logs of the completed habits.
+
+    A habit's log is compacted into its file once it grows past COMPACTION_THRESHOLD bytes, so recording
+    a completion never rewrites other habits.
+
+    Args:
+        habit_list (list): List of Habit objects, already containing the new completions.
+        completions (list): (habit name, completion datetime) tuples, in the order they were recorded.
+        directory (str): Path to the store's directory.
+        verbose (bool, optional): Unused; compaction rewrites a single habit without status messages.
+
+    Returns:
+        bool: True if the completions were saved.
+    '''
+    tracked = isinstance(habit_list, DirectoryHabitCollection) and os.path.abspath(habit_list.directory) == os.path.abspath(directory)
+    with store_lock(directory):
+        try:
+            manifest_files = None if tracked else {entry['name']: entry['file'] for entry in read_manifest(directory)['habits']}
+            by_file = {}
+            for habit_name, completion_datetime in completions:
+                habit = get_habit_by_name(habit_list, habit_name)
+                file_name = habit_list.files[habit][0] if tracked else manifest_files[habit_name]
+                by_file.setdefault(file_name, (habit, []))[1].append(completion_datetime)
+
+            for file_name, (habit, completion_datetimes) in by_file.items():
+                path = os.path.join(directory, file_name)
+                with CompletionLog(path, batch_size=len(completion_datetimes), store_path=directory) as log:
+                    for completion_datetime in completion_datetimes:
+                        log.append(habit.name, completion_datetime)
+                if os.path.getsize(log_path(path)) >= COMPACTION_THRESHOLD:
+                    write_habit(directory, file_name, habit)
+                if tracked: # The habit's file and log now hold its current state
+                    habit_list.files[habit] = [file_name, habit.version]
+        except (IOError, ValueError, KeyError):
+            print(f'{Fore.RED}Error: {Style.RESET_ALL} Failed to save data.')
+            return False
+    return True
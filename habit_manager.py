@@ -1,7 +1,570 @@
-from datetime import datetime, timedelta
+from array import array
+from bisect import bisect_left, insort
+from heapq import heapify, heappop, heappush
+import weakref
+from collections import Counter
+from collections.abc import MutableSequence
+from datetime import date, datetime, timedelta
+from itertools import count, islice, repeat
+from operator import le
+from zlib import crc32
+from profiling import profiler
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+ONE_MICROSECOND = timedelta(microseconds=1)
+MICROSECONDS_PER_DAY = 86400 * 1000000
+PERIODS = ('day', 'week', 'month')
+
+def to_timestamp(completion_datetime):
+    '''
+    Convert a completion datetime to whole microseconds since 1970-01-01, in the habit's local time.
+
+    Completions are stored as naive local times, so a timezone-aware value loses its offset: it is converted
+    to the local time of this machine. The CLI and the HTTP API reject completion datetimes with an offset.
+
+    Args:
+        completion_datetime (datetime): The completion date and time. Timezone-aware values are converted to local time.
+
+    Returns:
+        int: Microseconds since the epoch.
+    '''
+    if completion_datetime.tzinfo is not None:
+        completion_datetime = completion_datetime.astimezone().replace(tzinfo=None)
+    return (completion_datetime - EPOCH) // ONE_MICROSECOND
+
+
+def from_timestamp(timestamp):
+    '''
+    Convert microseconds since 1970-01-01 back to a completion datetime.
+
+    Args:
+        timestamp (int): Microseconds since the epoch.
+
+    Returns:
+        datetime: The completion date and time.
+    '''
+    return EPOCH + timedelta(microseconds=timestamp)
+
+
+def streak_deadline(ordinal, periodicity):
+    '''
+    Return the last day on which a completion keeps going a current streak that ends with a completion on a given day.
+
+    Args:
+        ordinal (int): The day ordinal of the latest completion.
+        periodicity (str): The periodicity of the habit.
+
+    Returns:
+        int: The day ordinal of the next day for daily habits, of the Sunday of the next ISO week for weekly
+            habits, and of the day a week later otherwise.
+    '''
+    if periodicity == 'daily':
+        return ordinal + 1
+    if periodicity == 'weekly':
+        return period_ordinal(period_index(ordinal, 'week') + 2, 'week') - 1
+    return ordinal + 7
+
+
+def extend_current_run(run, previous, ordinal, periodicity):
+    '''
+    Return the length of the current-streak run that ends at a completion.
+
+    Weekly runs are consecutive ISO weeks with a completion, as in extend_run. Other runs are completions
+    made by the streak_deadline of the previous one, so several completions in a day each count.
+
+    Args:
+        run (int): The length of the run that ends at the previous completion.
+        previous (int or None): The day ordinal of the previous completion, or None for the first one.
+        ordinal (int): The day ordinal of the completion, not before the previous one.
+        periodicity (str): The periodicity of the habit.
+
+    Returns:
+        int: The length of the run that ends at the completion.
+    '''
+    if periodicity == 'weekly':
+        return extend_run(run, previous, ordinal, periodicity)
+    return run + 1 if previous is not None and ordinal <= streak_deadline(previous, periodicity) else 1
+
+
+def extend_run(run, previous, ordinal, periodicity):
+    '''
+    Return the length of the longest-streak run that ends at a completion.
+
+    Daily runs are completion dates exactly one day apart. Weekly runs are consecutive ISO weeks with a
+    completion, so further completions within a week neither extend nor break the run. Other periodicities
+    have no runs: every completion starts a run of its own.
+
+    Args:
+        run (int): The length of the run that ends at the previous completion.
+        previous (int or None): The day ordinal of the previous completion, or None for the first one.
+        ordinal (int): The day ordinal of the completion, not before the previous one.
+        periodicity (str): The periodicity of the habit.
+
+    Returns:
+        int: The length of the run that ends at the completion.
+    '''
+    if previous is None:
+        return 1
+    if periodicity == 'weekly':
+        gap = period_index(ordinal, 'week') - period_index(previous, 'week')
+        return run if gap == 0 else run + 1 if gap == 1 else 1
+    return run + 1 if periodicity == 'daily' and ordinal - previous == 1 else 1
+
+
+def dedupe_period(periodicity):
+    '''
+    Return the period in which a habit that deduplicates its completions records at most one completion.
+
+    Args:
+        periodicity (str): The periodicity of the habit.
+
+    Returns:
+        str: 'week' (an ISO week) for weekly habits, 'day' otherwise.
+    '''
+    return 'week' if periodicity == 'weekly' else 'day'
+
+
+def period_index(ordinal, period):
+    '''
+    Number the day, ISO week or month containing a day, so consecutive periods have consecutive numbers.
+
+    Args:
+        ordinal (int): The proleptic Gregorian ordinal of the day.
+        period (str): 'day', 'week' or 'month'.
+
+    Returns:
+        int: The number of the period.
+    '''
+    if period == 'day':
+        return ordinal
+    if period == 'week':
+        return (ordinal - 1) // 7 # Day 1 (0001-01-01) is a Monday, so weeks run from Monday to Sunday like ISO weeks
+    day = date.fromordinal(ordinal)
+    return day.year * 12 + day.month - 1
+
+
+def period_ordinal(index, period):
+    '''
+    Return the first day of a period numbered by period_index.
+
+    Args:
+        index (int): The number of the period.
+        period (str): 'day', 'week' or 'month'.
+
+    Returns:
+        int: The proleptic Gregorian ordinal of the period's first day.
+    '''
+    if period == 'day':
+        return index
+    if period == 'week':
+        return index * 7 + 1
+    return date(index // 12, index % 12 + 1, 1).toordinal()
+
+
+def period_label(index, period):
+    '''
+    Label a period numbered by period_index, like '2024-01-31', '2024-W05' or '2024-01'.
+
+    Args:
+        index (int): The number of the period.
+        period (str): 'day', 'week' or 'month'.
+
+    Returns:
+        str: The ISO date, ISO week or year and month of the period.
+    '''
+    if period == 'day':
+        return date.fromordinal(index).isoformat()
+    if period == 'week':
+        return '{}-W{:02d}'.format(*date.fromordinal(period_ordinal(index, period)).isocalendar()[:2])
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+STATISTICS_FORMAT = 3 # Streak statistics of other formats, such as those saved before weekly streaks counted ISO weeks, are recomputed
+_versions = count(1) # Habit versions are unique within a process, across all habits
+_change_hooks = []
+
+def add_change_hook(hook):
+    '''
+    Register a function to be called whenever a habit is completed or edited, for example to invalidate cached analytics.
+
+    Args:
+        hook (callable): Called with the changed habit and the version it had before the change.
+    '''
+    _change_hooks.append(hook)
+
+
+def notify_change(habit):
+    '''
+    Give a changed habit a new version and call the registered change hooks.
+
+    Args:
+        habit (Habit): The habit that changed.
+    '''
+    previous_version = habit.version
+    habit.version = next(_versions)
+    for hook in _change_hooks:
+        hook(habit, previous_version)
+
+
+def _sorted_array(timestamps):
+    '''Return timestamps as an array in chronological order, sorting them only if they are out of order.'''
+    timestamps = timestamps if isinstance(timestamps, array) else array('q', timestamps)
+    if all(map(le, timestamps, islice(timestamps, 1, None))): # Linear check; histories are almost always recorded in order
+        return timestamps
+    return array('q', sorted(timestamps))
+
+
+class Completions(MutableSequence):
+    '''
+    The completion datetimes of a habit, stored compactly as an array of microsecond timestamps.
+
+    Each completion takes 8 bytes instead of a datetime object plus a list slot; datetime objects are only
+    created when completions are read. Loading a habit keeps the raw ISO 8601 strings until the completions
+    are first accessed, so commands that never look at completions (listing, filtering) do not parse the
+    whole history. Counting, appending and serializing work on the raw strings without decoding them.
+
+    Completions are always in chronological order: new completions are inserted at their position by binary
+    search, so backfilled completions do not need a sort later and analytics can rely on binary searches.
+
+    As the order is fixed, only part of the MutableSequence interface is positional: completions can be read
+    and deleted by index, but insert and reverse raise TypeError, and values assigned by index or slice are
+    moved to their chronological position (a linear check, plus a sort if they are out of order). Replacing
+    or deleting completions by index counts as an edit (see edits), so that the habit holding them drops the
+    statistics and rollups it maintains as completions are appended.
+    '''
+    __slots__ = ('_timestamps', '_raw', 'edits')
+
+    def __init__(self, completions=()):
+        '''
+        Initialize a Completions sequence from datetime objects.
+
+        Args:
+            completions (iterable, optional): The completion datetimes, in any order. Defaults to no completions.
+        '''
+        self._timestamps = _sorted_array(map(to_timestamp, completions))
+        self._raw = None
+        self.edits = 0 # Number of completions replaced or deleted by index
+
+    @classmethod
+    def from_strings(cls, strings):
+        '''
+        Create a Completions sequence that decodes the given ISO 8601 strings on first access.
+
+        Args:
+            strings (list): Completion datetimes as ISO 8601 strings, in any order.
+
+        Returns:
+            Completions: A new, not yet decoded Completions sequence.
+        '''
+        completions = cls()
+        completions._timestamps = None
+        completions._raw = list(strings)
+        return completions
+
+    @classmethod
+    def from_timestamps(cls, timestamps, ordered=False):
+        '''
+        Create a Completions sequence from microsecond timestamps.
+
+        Args:
+            timestamps (iterable): Completion times as microseconds since 1970-01-01, in any order.
+            ordered (bool, optional): Whether timestamps is an array('q') known to be in chronological order,
+                such as one read back from a cache of a store; it is then used as is. Defaults to False.
+
+        Returns:
+            Completions: A new Completions sequence.
+        '''
+        completions = cls()
+        completions._timestamps = timestamps if ordered else _sorted_array(timestamps)
+        return completions
+
+    @property
+    def is_decoded(self):
+        '''Whether the completion strings have been converted to timestamps.'''
+        return self._timestamps is not None
+
+    @property
+    def timestamps(self):
+        '''The completions as an array of microseconds since 1970-01-01, in chronological order. It must not be modified.'''
+        if self._timestamps is None:
+            with profiler.phase('decode_completions'):
+                self._timestamps = _sorted_array(to_timestamp(datetime.fromisoformat(completion)) for completion in self._raw)
+            profiler.count('completions_decoded', len(self._raw))
+            self._raw = None
+        return self._timestamps
+
+    def day_ordinals(self):
+        '''
+        Return the proleptic Gregorian ordinal of each completion's date, without creating datetime objects.
+
+        Returns:
+            list: Day ordinals, in chronological order.
+        '''
+        return [EPOCH_ORDINAL + timestamp // MICROSECONDS_PER_DAY for timestamp in self.timestamps]
+
+    def find(self, start, end):
+        '''
+        Find the completions within a time range by binary search.
+
+        Args:
+            start (int): The start of the range, in microseconds since 1970-01-01.
+            end (int): The end of the range, excluded.
+
+        Returns:
+            tuple: The index of the first completion in the range and the index after the last one.
+        '''
+        timestamps = self.timestamps
+        low = bisect_left(timestamps, start)
+        return low, bisect_left(timestamps, end, low)
+
+    def __len__(self):
+        return len(self._raw) if self._timestamps is None else len(self._timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [from_timestamp(timestamp) for timestamp in self.timestamps[index]]
+        return from_timestamp(self.timestamps[index])
+
+    def __setitem__(self, index, value):
+        timestamps = self.timestamps
+        if isinstance(index, slice):
+            timestamps[index] = array('q', map(to_timestamp, value))
+        else:
+            timestamps[index] = to_timestamp(value)
+        self._timestamps = _sorted_array(timestamps) # Replaced values may be out of order
+        self.edits += 1
+
+    def __delitem__(self, index):
+        del self.timestamps[index]
+        self.edits += 1
+
+    def __iter__(self):
+        return map(from_timestamp, self.timestamps)
+
+    def __reversed__(self):
+        return map(from_timestamp, reversed(self.timestamps))
+
+    def __eq__(self, other):
+        if isinstance(other, Completions):
+            return self.timestamps == other.timestamps
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def insert(self, index, value):
+        '''Not supported, as completions are kept in chronological order; use append.'''
+        raise TypeError('Completions are kept in chronological order; use append instead of insert')
+
+    def reverse(self):
+        '''Not supported, as completions are kept in chronological order; use reversed to iterate from the latest.'''
+        raise TypeError('Completions are kept in chronological order and cannot be reversed')
+
+    def append(self, value):
+        '''Add a completion at its chronological position, found by binary search.'''
+        if self._timestamps is None:
+            self._raw.append(value.isoformat()) # Keep the sequence undecoded; it is sorted when decoded
+            return
+        timestamp = to_timestamp(value)
+        if not self._timestamps or timestamp >= self._timestamps[-1]:
+            self._timestamps.append(timestamp) # The common case: recorded in order
+        else:
+            insort(self._timestamps, timestamp)
+
+    def to_strings(self):
+        '''
+        Return the completions as ISO 8601 strings, without decoding them if they have not been decoded yet.
+
+        Returns:
+            list: Completion datetimes as ISO 8601 strings.
+        '''
+        if self._timestamps is None:
+            return list(self._raw)
+        return [from_timestamp(timestamp).isoformat() for timestamp in self._timestamps]
+
+    def checksum(self):
+        '''
+        Return a checksum identifying the completions, computed on the raw strings if they have not been
+        decoded yet (see completions_checksum) and on the timestamps otherwise.
+
+        Returns:
+            int: A CRC-32 of the completions.
+        '''
+        if self._timestamps is None:
+            return completions_checksum(self._raw)
+        return crc32(self._timestamps.tobytes())
+
+
+class Rollups:
+    '''
+    The completion counts of a habit per day, ISO week and month.
+
+    Each period is kept as a dense array of counts, from the first to the last period with a completion,
+    so reports over whole periods read a few counters instead of the completions. Counts are updated as
+    completions are recorded and persisted with the habit, as the counts of the periods with completions
+    keyed by their labels; like completions, persisted counts are only decoded when first used.
+    '''
+    __slots__ = ('completion_count', '_starts', '_counts')
+
+    def __init__(self, ordinals=()):
+        '''
+        Initialize Rollups by counting completions.
+
+        Args:
+            ordinals (iterable, optional): The day ordinals of the completions. Defaults to no completions.
+        '''
+        days = Counter(ordinals)
+        self.completion_count = sum(days.values())
+        self._starts = dict.fromkeys(PERIODS, 0)
+        self._counts = {period: array('I') for period in PERIODS}
+        if not days:
+            return
+
+        first, last = min(days), max(days)
+        day_counts = array('I', bytes(4 * (last - first + 1)))
+        for ordinal, completion_count in days.items():
+            day_counts[ordinal - first] = completion_count
+        self._starts['day'], self._counts['day'] = first, day_counts
+        for period in PERIODS[1:]: # Summed from the day counts, one slice per week or month
+            start = period_index(first, period)
+            bounds = [max(period_ordinal(index, period), first) - first for index in range(start, period_index(last, period) + 1)]
+            bounds.append(last + 1 - first)
+            self._starts[period] = start
+            self._counts[period] = array('I', (sum(day_counts[low:high]) for low, high in zip(bounds, bounds[1:])))
+
+    @classmethod
+    def from_buckets(cls, buckets):
+        '''
+        Create Rollups from the counts of the periods with completions.
+
+        Args:
+            buckets (dict): Maps each period to a dictionary of period numbers (see period_index) and their counts.
+
+        Returns:
+            Rollups: The restored rollups.
+        '''
+        rollups = cls()
+        for period, counts in buckets.items():
+            if counts:
+                start = min(counts)
+                rollups._starts[period] = start
+                rollups._counts[period] = array('I', map(counts.get, range(start, max(counts) + 1), repeat(0)))
+        rollups.completion_count = sum(rollups._counts['day'])
+        return rollups
+
+    def _array(self, period):
+        '''Return the counts of one period as an array, parsing them if they were read from a store.'''
+        counts = self._counts[period]
+        if isinstance(counts, str):
+            counts = self._counts[period] = array('I', map(int, counts.split()))
+        return counts
+
+    def counts(self, period):
+        '''
+        Return the counts of one period.
+
+        Args:
+            period (str): 'day', 'week' or 'month'.
+
+        Returns:
+            tuple: The number of the first period (see period_index) and an array with the count of each period from it on.
+        '''
+        return self._starts[period], self._array(period)
+
+    def count(self, period, index):
+        '''
+        Return the number of completions in one period.
+
+        Args:
+            period (str): 'day', 'week' or 'month'.
+            index (int): The number of the period, as returned by period_index.
+
+        Returns:
+            int: The number of completions.
+        '''
+        start, counts = self.counts(period)
+        return counts[index - start] if 0 <= index - start < len(counts) else 0
+
+    def total(self, first, last):
+        '''
+        Return the number of completions dated within a range of days.
+
+        Args:
+            first (int): The day ordinal of the first day of the range.
+            last (int): The day ordinal of the last day of the range, included.
+
+        Returns:
+            int: The number of completions.
+        '''
+        start, counts = self.counts('day')
+        return sum(counts[max(first - start, 0):max(last + 1 - start, 0)])
+
+    def add(self, ordinal):
+        '''
+        Count one more completion.
+
+        Args:
+            ordinal (int): The day ordinal of the completion.
+        '''
+        for period in PERIODS:
+            index = period_index(ordinal, period)
+            counts = self._array(period)
+            if not counts:
+                self._starts[period] = index
+                counts.append(0)
+            elif index < self._starts[period]: # Backfilled before the first period; rare, so the counts are copied
+                counts = self._counts[period] = array('I', bytes(4 * (self._starts[period] - index))) + counts
+                self._starts[period] = index
+            elif index - self._starts[period] >= len(counts):
+                counts.frombytes(bytes(4 * (index - self._starts[period] - len(counts) + 1)))
+            counts[index - self._starts[period]] += 1
+        self.completion_count += 1
+
+    def to_dictionary(self):
+        '''
+        Convert the Rollups to a dictionary, useful for serialization.
+
+        Returns:
+            dict: The number of completions counted and, for each period, its first day as an ISO date and its
+                counts as a space-separated string.
+        '''
+        rollups_dict = {'completion_count': self.completion_count}
+        for period in PERIODS:
+            counts = self._counts[period]
+            rollups_dict[period] = {
+                'start': date.fromordinal(period_ordinal(self._starts[period], period)).isoformat() if counts else None,
+                'counts': counts if isinstance(counts, str) else ' '.join(map(str, counts)), # One line per habit instead of one per day
+            }
+        return rollups_dict
+
+    @classmethod
+    def from_dictionary(cls, rollups_dict):
+        '''
+        Create Rollups from a dictionary, useful for deserialization.
+
+        Args:
+            rollups_dict (dict): A dictionary representation of Rollups.
+
+        Returns:
+            Rollups: The restored rollups.
+        '''
+        rollups = cls()
+        for period in PERIODS:
+            counts = rollups_dict[period]
+            if counts['start']:
+                rollups._starts[period] = period_index(date.fromisoformat(counts['start']).toordinal(), period)
+                rollups._counts[period] = counts['counts'] # Parsed on first use
+        rollups.completion_count = rollups_dict['completion_count']
+        return rollups
+
 
 class Habit:
-    def __init__(self, name, description, start_date, periodicity):
+    __slots__ = ('name', 'description', 'start_date', 'periodicity', 'dedupe', '_version', '_completions', '_edits', '_statistics', '_rollups', '_checksum')
+
+    def __init__(self, name, description, start_date, periodicity, dedupe=False):
         '''
         Initialize a Habit object with name, description, start_date, and periodicity.
 
@@ -10,12 +573,188 @@ class Habit:
             description (str): A brief description of the habit.
             start_date (datetime): The date when the habit was started.
             periodicity (str): How often the habit occurs; 'daily' or 'weekly'.
+            dedupe (bool, optional): Record at most one completion per day (per ISO week for weekly habits). Defaults to False.
         '''
         self.name = name
         self.description = description
         self.start_date = start_date
         self.periodicity = periodicity
-        self.completions = []
+        self.dedupe = dedupe
+        self.completions = Completions()
+
+    @property
+    def completions(self):
+        '''The completion datetimes of the habit.'''
+        return self._completions
+
+    @completions.setter
+    def completions(self, completions):
+        self._completions = completions if isinstance(completions, Completions) else Completions(completions)
+        self._edits = self._completions.edits
+        self._statistics = None # Recomputed from the new completions on first use
+        self._rollups = None
+        self._checksum = None
+        self._version = next(_versions)
+
+    @property
+    def version(self):
+        '''Identifies this state of the habit, e.g. for cached analytics; completions edited by index give it a new version.'''
+        self._check_edits()
+        return self._version
+
+    @version.setter
+    def version(self, version):
+        self._version = version
+
+    @property
+    def checksum(self):
+        '''A checksum of the completions (see Completions.checksum), identifying this state of the habit across processes, e.g. for analytics saved next to a store.'''
+        version = self.version
+        if self._checksum is None or self._checksum[0] != version:
+            self._checksum = (version, self.completions.checksum())
+        return self._checksum[1]
+
+    @checksum.setter
+    def checksum(self, checksum):
+        self._checksum = (self.version, checksum) # Restored with completions decoded from a store's strings, so it matches other loads of that store
+
+    def _check_edits(self):
+        '''Drop the statistics and rollups if completions were replaced or deleted by index since they were maintained.'''
+        if self._completions.edits != self._edits:
+            self._edits = self._completions.edits
+            self._statistics = None
+            self._rollups = None
+            self._version = next(_versions)
+
+    def _compute_statistics(self):
+        '''
+        Compute the streak statistics of the habit by scanning all of its completions.
+
+        Returns:
+            dict: The streak statistics, as maintained by _update_statistics.
+        '''
+        ordinals = self.completions.day_ordinals() # In chronological order, so no sort is needed
+
+        current_run = 0 # Run ending at the latest completion, see extend_current_run
+        latest_run = 0 # Run ending at the latest completion, see extend_run
+        longest_streak = 1
+        for index, ordinal in enumerate(ordinals):
+            previous = ordinals[index - 1] if index else None
+            current_run = extend_current_run(current_run, previous, ordinal, self.periodicity)
+            latest_run = extend_run(latest_run, previous, ordinal, self.periodicity)
+            longest_streak = max(longest_streak, latest_run)
+
+        return {
+            'format': STATISTICS_FORMAT,
+            'periodicity': self.periodicity,
+            'completion_count': len(ordinals),
+            'last_completion_date': ordinals[-1] if ordinals else None,
+            'current_run': current_run,
+            'latest_completion_date': ordinals[-1] if ordinals else None,
+            'latest_run': latest_run,
+            'longest_streak': longest_streak,
+        }
+
+    def _update_statistics(self, ordinal):
+        '''
+        Update the streak statistics for one newly recorded completion in constant time.
+
+        A completion dated before the latest completion is inserted within the history and can join or split
+        the runs after it, so the statistics are dropped and recomputed from scratch on next use instead.
+
+        Args:
+            ordinal (int): The day ordinal of the new completion.
+        '''
+        statistics = self._statistics
+        if not self._statistics_match(statistics, len(self.completions) - 1):
+            self._statistics = None
+            return
+
+        latest = statistics['latest_completion_date']
+        if latest is not None and ordinal < latest:
+            self._statistics = None # Backfilled completion: fall back to recomputation
+            return
+
+        last = statistics['last_completion_date']
+        statistics['current_run'] = extend_current_run(statistics['current_run'], last, ordinal, self.periodicity)
+        statistics['latest_run'] = extend_run(statistics['latest_run'], latest, ordinal, self.periodicity)
+        statistics['longest_streak'] = max(statistics['longest_streak'], statistics['latest_run'])
+        statistics['last_completion_date'] = statistics['latest_completion_date'] = ordinal
+        statistics['completion_count'] += 1
+
+    @property
+    def statistics(self):
+        '''The streak statistics of the habit, maintained incrementally and recomputed only when they are out of date.'''
+        self._check_edits()
+        statistics = self._statistics
+        if not self._statistics_match(statistics, len(self.completions)):
+            statistics = self._statistics = self._compute_statistics()
+        return statistics
+
+    def _statistics_match(self, statistics, completion_count):
+        '''Check that statistics, such as those restored from a store, were computed for the given completion count and the current periodicity.'''
+        return (
+            statistics is not None and statistics.get('format') == STATISTICS_FORMAT
+            and statistics['completion_count'] == completion_count and statistics['periodicity'] == self.periodicity
+        )
+
+    @statistics.setter
+    def statistics(self, statistics):
+        self._statistics = statistics # Restored from a store; checked against the completions and periodicity before use
+
+    @property
+    def rollups(self):
+        '''The completion counts of the habit per day, ISO week and month, maintained as completions are recorded.'''
+        self._check_edits()
+        rollups = self._rollups
+        if rollups is None or rollups.completion_count != len(self.completions):
+            rollups = self._rollups = Rollups(self.completions.day_ordinals())
+        return rollups
+
+    @rollups.setter
+    def rollups(self, rollups):
+        self._rollups = rollups # Restored from a store; checked against the completions before use
+
+    def current_streak(self, today=None):
+        '''
+        Return the current streak of the habit in constant time.
+
+        Args:
+            today (date, optional): The date the streak is measured at. Defaults to the current date.
+
+        Returns:
+            int: Length of the run of completions that ends at the latest one (see extend_current_run), or 0 if
+                the streak_deadline of the latest one has passed.
+        '''
+        statistics = self.statistics
+        if statistics['completion_count'] == 0:
+            return 0
+        today = (today or datetime.now().date()).toordinal()
+        if today > streak_deadline(statistics['last_completion_date'], self.periodicity):
+            return 0
+        return statistics['current_run']
+
+    def due_ordinal(self):
+        '''
+        Return the last day the habit can be completed on without breaking its current streak, in constant time.
+
+        Returns:
+            int: The streak_deadline of the latest completion, or the day ordinal of the start date if the habit was never completed.
+        '''
+        statistics = self.statistics
+        if statistics['completion_count'] == 0:
+            return self.start_date.toordinal()
+        return streak_deadline(statistics['last_completion_date'], self.periodicity)
+
+    def longest_streak(self):
+        '''
+        Return the longest streak of the habit in constant time.
+
+        Returns:
+            int: Length of the longest run of completion days exactly one day apart for daily habits, or of
+                consecutive ISO weeks with a completion for weekly habits (see extend_run); at least 1.
+        '''
+        return self.statistics['longest_streak']
 
     def __str__(self):
         '''Return a string representation of the Habit object, showing name and description.'''
@@ -25,16 +764,67 @@ class Habit:
         '''Return a formal string representation of the Habit object, which can be used to reproduce the object.'''
         return self.__str__()
 
+    def completed_in_period(self, ordinal):
+        '''
+        Check by binary search whether the habit has a completion in the day or ISO week (see dedupe_period) containing a day.
+
+        Args:
+            ordinal (int): The day ordinal of a day in the period.
+
+        Returns:
+            bool: True if a completion is dated within the period.
+        '''
+        period = dedupe_period(self.periodicity)
+        index = period_index(ordinal, period)
+        low, high = self.completions.find(
+            (period_ordinal(index, period) - EPOCH_ORDINAL) * MICROSECONDS_PER_DAY,
+            (period_ordinal(index + 1, period) - EPOCH_ORDINAL) * MICROSECONDS_PER_DAY,
+        )
+        return high > low
+
+    def remove_duplicates(self):
+        '''
+        Keep only the earliest completion of each day (each ISO week for weekly habits), as recorded when dedupe is set.
+
+        Returns:
+            int: The number of completions removed.
+        '''
+        period = dedupe_period(self.periodicity)
+        timestamps = self.completions.timestamps
+        kept = {}
+        for timestamp in timestamps:
+            kept.setdefault(period_index(EPOCH_ORDINAL + timestamp // MICROSECONDS_PER_DAY, period), timestamp)
+        removed = len(timestamps) - len(kept)
+        if removed:
+            self.completions = Completions.from_timestamps(kept.values())
+            notify_change(self)
+        return removed
+
     def complete_habit(self, completion_datetime=None):
         '''
-        Record a habit as completed by appending the completion datetime to the completions list.
+        Record a habit as completed by inserting the completion datetime at its chronological position.
 
         Args:
             completion_datetime (datetime, optional): The completion date and time. Defaults to the current datetime.
+
+        Returns:
+            bool: True if the completion was recorded; False if the habit deduplicates completions and
+                already has one in the same day (or ISO week for weekly habits).
         '''
         if completion_datetime is None:
             completion_datetime = datetime.now()
+        ordinal = EPOCH_ORDINAL + to_timestamp(completion_datetime) // MICROSECONDS_PER_DAY
+        if self.dedupe and self.completed_in_period(ordinal):
+            return False
+        self._check_edits()
         self.completions.append(completion_datetime)
+        self._update_statistics(ordinal)
+        if self._rollups is not None and self._rollups.completion_count == len(self.completions) - 1:
+            self._rollups.add(ordinal)
+        else:
+            self._rollups = None
+        notify_change(self)
+        return True
 
     def to_dictionary(self):
         '''
@@ -43,13 +833,23 @@ class Habit:
         Returns:
             dict: A dictionary representation of the Habit object.
         '''
-        return {
+        completions = self.completions.to_strings()  # Convert datetime objects to strings
+        habit_dict = {
             'name': self.name,
             'description': self.description,
             'start_date': self.start_date.isoformat(),  # Convert datetime to string in ISO 8601 format
             'periodicity': self.periodicity,
-            'completions': [completion.isoformat() for completion in self.completions],  # Convert datetime objects to strings
+            'completions': completions,
+            'checksum': completions_checksum(completions),  # Identifies the completions the statistics and rollups were computed for
+            'statistics': {
+                key: date.fromordinal(value).isoformat() if key.endswith('_date') and value is not None else value
+                for key, value in self.statistics.items()
+            },  # Persist the streak statistics so loading the habit does not require recomputing them
+            'rollups': self.rollups.to_dictionary(),  # Persist the completion counts per period for reports
         }
+        if self.dedupe: # Only written when set, so stores without deduplicating habits are unchanged
+            habit_dict['dedupe'] = True
+        return habit_dict
 
     @classmethod
     def from_dictionary(cls, habit_dict):
@@ -67,11 +867,303 @@ class Habit:
             habit_dict['description'],
             datetime.fromisoformat(habit_dict['start_date']),  # Convert string in ISO 8601 format to datetime
             habit_dict['periodicity'],
+            habit_dict.get('dedupe', False),
         )
-        habit.completions = [datetime.fromisoformat(completion) for completion in habit_dict['completions']]  # Convert strings to datetime objects
+        habit.completions = Completions.from_strings(habit_dict['completions'])  # Strings are converted to datetime objects on first access
+        habit.checksum = completions_checksum(habit_dict['completions'])
+        if habit_dict.get('checksum') != habit.checksum:
+            return habit # Completions edited since the statistics and rollups were saved (or saved without a checksum): recompute them
+        if 'statistics' in habit_dict: # Statistics are checked against the completions and periodicity before use
+            habit._statistics = {
+                key: date.fromisoformat(value).toordinal() if key.endswith('_date') and value is not None else value
+                for key, value in habit_dict['statistics'].items()
+            }
+        if 'rollups' in habit_dict: # Also checked against the completions before use
+            habit._rollups = Rollups.from_dictionary(habit_dict['rollups'])
         return habit
 
-def create_habit(name, description, start_date, periodicity):
+def completions_checksum(strings):
+    '''
+    Return a checksum of completion strings, saved with a habit so that the statistics and rollups persisted
+    with it are only trusted if its completions were not edited by hand since.
+
+    Args:
+        strings (list): Completion datetimes as ISO 8601 strings.
+
+    Returns:
+        int: A CRC-32 of the strings.
+    '''
+    return crc32('\n'.join(strings).encode())
+
+
+def unique_name(name, taken):
+    '''
+    Return a habit name that is not taken yet, by numbering it like 'Read (2)' if needed.
+
+    Args:
+        name (str): The wanted name.
+        taken (container): The names already in use.
+
+    Returns:
+        str: The name itself if it is free; otherwise the first of 'name (2)', 'name (3)', ... that is.
+    '''
+    suffix = 2
+    unique = name
+    while unique in taken:
+        unique, suffix = f'{name} ({suffix})', suffix + 1
+    return unique
+
+
+_scheduled_collections = weakref.WeakSet() # Collections whose due queue has been built, kept up to date as habits change
+
+def _reschedule(habit, previous_version):
+    '''Queue a changed habit again in every due queue that holds it, as its due date may have moved.'''
+    for habit_list in _scheduled_collections:
+        if habit in habit_list:
+            habit_list._schedule(habit)
+
+add_change_hook(_reschedule)
+
+
+class HabitCollection:
+    '''
+    An ordered collection of habits, indexed by name and by periodicity.
+
+    Lookups by name, removals and periodicity filters take constant time instead of scanning the list.
+    Renames and periodicity changes must go through rename and set_periodicity (edit_habit does this
+    when given the collection) so the indexes stay consistent.
+
+    The first call to due builds a heap of the habits' due dates, which is then kept up to date as habits
+    are added, completed and edited, so later calls only look at the habits that are due.
+    '''
+    def __init__(self, habits=()):
+        '''
+        Initialize a HabitCollection.
+
+        Args:
+            habits (iterable, optional): The habits to add, in order. Defaults to no habits.
+
+        Raises:
+            ValueError: If two habits share a name.
+        '''
+        self._positions = {} # Habit -> insertion position; dicts keep insertion order, so this also orders iteration
+        self._by_name = {}
+        self._by_periodicity = {}
+        self._next_position = 0
+        self._due = None # Heap of (due ordinal, position, version, habit), built on first use; superseded entries are dropped lazily
+        self._due_versions = {} # Habit -> the version of its latest heap entry
+        self.renamed = [] # (name in the store, new name) of habits renamed by append_loaded
+        for habit in habits:
+            self.append(habit)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __iter__(self):
+        return iter(self._positions)
+
+    def __contains__(self, habit):
+        return habit in self._positions
+
+    def __getitem__(self, index):
+        return list(self._positions)[index]
+
+    def __repr__(self):
+        return repr(list(self._positions))
+
+    def get(self, name):
+        '''
+        Return the habit with the given name.
+
+        Args:
+            name (str): The name of the habit to retrieve.
+
+        Returns:
+            Habit or None: The Habit instance with the matching name, if it exists; None otherwise.
+        '''
+        return self._by_name.get(name)
+
+    def with_periodicity(self, periodicity):
+        '''
+        Return the habits with the given periodicity, in collection order.
+
+        Args:
+            periodicity (str): The periodicity to filter habits by.
+
+        Returns:
+            list: Habits with the given periodicity.
+        '''
+        return list(self._by_periodicity.get(periodicity, ()))
+
+    def append(self, habit):
+        '''
+        Add a habit to the end of the collection.
+
+        Args:
+            habit (Habit): The habit to add.
+
+        Raises:
+            ValueError: If a habit with the same name already exists.
+        '''
+        if habit.name in self._by_name:
+            raise ValueError(f'A habit with the name {habit.name} already exists')
+        self._positions[habit] = self._next_position
+        self._next_position += 1
+        self._by_name[habit.name] = habit
+        self._by_periodicity.setdefault(habit.periodicity, {})[habit] = None
+        if self._due is not None:
+            self._schedule(habit)
+
+    def append_loaded(self, habit):
+        '''
+        Add a habit read from a store to the end of the collection, renaming it if its name is taken.
+
+        Stores saved before habit names had to be unique, or edited by hand, may hold several habits with
+        one name. The first keeps the name and the others are renamed by unique_name, so none of their
+        completions are lost; the renames are listed in renamed for the loader to report.
+
+        Args:
+            habit (Habit): The habit to add.
+        '''
+        name = unique_name(habit.name, self._by_name)
+        if name != habit.name:
+            self.renamed.append((habit.name, name))
+            habit.name = name
+        self.append(habit)
+
+    def extend(self, habits):
+        '''
+        Add several habits to the end of the collection.
+
+        Args:
+            habits (iterable): The habits to add, in order.
+        '''
+        for habit in habits:
+            self.append(habit)
+
+    def remove(self, habit):
+        '''
+        Remove a habit from the collection.
+
+        Args:
+            habit (Habit): The habit to remove.
+
+        Raises:
+            ValueError: If the habit is not in the collection.
+        '''
+        if habit not in self._positions:
+            raise ValueError(f'Habit {habit.name} is not in the collection')
+        del self._positions[habit]
+        del self._by_name[habit.name]
+        del self._by_periodicity[habit.periodicity][habit]
+        if self._due_versions.pop(habit, None) is not None: # Drop its heap entries, so the queue does not keep it alive
+            self._due = [entry for entry in self._due if entry[3] is not habit]
+            heapify(self._due)
+
+    def clear(self):
+        '''Remove all habits from the collection.'''
+        self._positions.clear()
+        self._by_name.clear()
+        self._by_periodicity.clear()
+        self._due = None # Built again on the next call to due
+        self._due_versions.clear()
+        _scheduled_collections.discard(self)
+
+    def _build_due(self):
+        '''Build the due queue from scratch, with one entry per habit.'''
+        self._due_versions = {habit: habit.version for habit in self}
+        self._due = [(habit.due_ordinal(), position, habit.version, habit) for habit, position in self._positions.items()]
+        heapify(self._due)
+
+    def _schedule(self, habit):
+        '''
+        Push a habit's current due date onto the due queue, superseding its earlier entries.
+
+        Superseded entries are only dropped when they reach the top, so the queue is rebuilt once it holds
+        more than twice as many entries as there are habits.
+        '''
+        if len(self._due) >= 2 * len(self):
+            self._build_due()
+        else:
+            self._push(habit)
+
+    def _push(self, habit):
+        '''Push a habit's current due date onto the due queue.'''
+        self._due_versions[habit] = habit.version
+        heappush(self._due, (habit.due_ordinal(), self._positions[habit], habit.version, habit))
+
+    def due(self, today=None, within=0):
+        '''
+        Return the habits due by a given day, from the most overdue.
+
+        After the due queue is built, this takes O(k log n) time for k due habits out of n, plus the
+        time to drop the entries superseded since the last call.
+
+        Args:
+            today (date, optional): The current date. Defaults to today.
+            within (int, optional): Also return habits due up to this many days after today. Defaults to 0.
+
+        Returns:
+            list: (habit, due ordinal) tuples for the habits whose due date (see Habit.due_ordinal) is at
+                most today plus within, in order of due date and then collection order.
+        '''
+        if self._due is None:
+            self._build_due()
+            _scheduled_collections.add(self)
+
+        horizon = (today or date.today()).toordinal() + within
+        due_entries = []
+        while self._due and self._due[0][0] <= horizon:
+            entry = heappop(self._due)
+            habit = entry[3]
+            if self._due_versions.get(habit) != entry[2]:
+                continue # Superseded by a newer entry, or removed from the collection
+            if habit.version != entry[2]:
+                self._push(habit) # Changed without notifying the change hooks, e.g. by assigning its completions; replaces the popped entry, so the queue does not grow
+                continue
+            due_entries.append(entry)
+        for entry in due_entries: # Still due until they are completed
+            heappush(self._due, entry)
+        return [(habit, due_ordinal) for due_ordinal, _, _, habit in due_entries]
+
+    def rename(self, habit, name):
+        '''
+        Rename a habit and update the name index.
+
+        Args:
+            habit (Habit): The habit to rename.
+            name (str): The new name of the habit.
+
+        Raises:
+            ValueError: If another habit already has the new name.
+        '''
+        if name == habit.name:
+            return
+        if name in self._by_name:
+            raise ValueError(f'A habit with the name {name} already exists')
+        del self._by_name[habit.name]
+        habit.name = name
+        self._by_name[name] = habit
+
+    def set_periodicity(self, habit, periodicity):
+        '''
+        Change the periodicity of a habit and update the periodicity index.
+
+        Args:
+            habit (Habit): The habit to change.
+            periodicity (str): The new periodicity of the habit.
+        '''
+        if periodicity == habit.periodicity:
+            return
+        del self._by_periodicity[habit.periodicity][habit]
+        habit.periodicity = periodicity
+        habits = self._by_periodicity.setdefault(periodicity, {})
+        habits[habit] = None
+        if len(habits) > 1: # The habit was added at the end of the index, so restore collection order
+            self._by_periodicity[periodicity] = dict.fromkeys(sorted(habits, key=self._positions.__getitem__))
+
+
+def create_habit(name, description, start_date, periodicity, dedupe=False):
     '''
     Create a new Habit object and return it.
 
@@ -80,13 +1172,14 @@ def create_habit(name, description, start_date, periodicity):
         description (str): A brief description of the habit.
         start_date (datetime): The date when the habit was started.
         periodicity (str): How often the habit occurs; 'daily' or 'weekly'.
+        dedupe (bool, optional): Record at most one completion per day (per ISO week for weekly habits). Defaults to False.
 
     Returns:
         Habit: A new instance of the Habit class.
     '''
-    return Habit(name, description, start_date, periodicity)
+    return Habit(name, description, start_date, periodicity, dedupe)
 
-def edit_habit(habit, name=None, description=None, start_date=None, periodicity=None):
+def edit_habit(habit, name=None, description=None, start_date=None, periodicity=None, habit_list=None, dedupe=None):
     '''
     Update the attributes of an existing Habit instance.
 
@@ -96,23 +1189,41 @@ def edit_habit(habit, name=None, description=None, start_date=None, periodicity=
         description (str, optional): A new description for the habit. Defaults to None.
         start_date (datetime, optional): A new start date for the habit. Defaults to None.
         periodicity (str, optional): A new periodicity for the habit; either 'daily' or 'weekly'. Defaults to None.
+        habit_list (HabitCollection, optional): The collection holding the habit, whose indexes are kept up to date. Defaults to None.
+        dedupe (bool, optional): Whether the habit records at most one completion per period. Turning it on, or changing
+            the periodicity of a deduplicating habit, removes the completions it would not have recorded. Defaults to None.
+
+    Raises:
+        ValueError: If the new name is already used by another habit in the collection. The habit is left unchanged.
     '''
+    indexed = isinstance(habit_list, HabitCollection)
     # Update the habit attributes only if a new value has been provided
     if name:
-        habit.name = name
+        if indexed:
+            habit_list.rename(habit, name) # Checked first, so a name collision leaves the habit unchanged
+        else:
+            habit.name = name
     if description:
         habit.description = description
     if start_date:
         habit.start_date = start_date
     if periodicity:
-        habit.periodicity = periodicity
+        if indexed:
+            habit_list.set_periodicity(habit, periodicity)
+        else:
+            habit.periodicity = periodicity
+    if dedupe is not None:
+        habit.dedupe = dedupe
+    if habit.dedupe and (dedupe or periodicity):
+        habit.remove_duplicates()
+    notify_change(habit)
 
 def delete_habit(habit_list, habit):
     '''
     Remove a Habit instance from the habit list.
 
     Args:
-        habit_list (list): The list of habits.
+        habit_list (list or HabitCollection): The list of habits.
         habit (Habit): The habit to delete.
     '''
     habit_list.remove(habit)
@@ -122,12 +1233,15 @@ def get_habit_by_name(habit_list, name):
     Find and return a Habit instance from a list of habits, based on its name.
 
     Args:
-        habit_list (list): A list of Habit instances.
+        habit_list (list or HabitCollection): A list of Habit instances.
         name (str): The name of the habit to retrieve.
 
     Returns:
         Habit or None: The Habit instance with the matching name, if it exists; None otherwise.
     '''
+    if isinstance(habit_list, HabitCollection): # Use the name index instead of scanning
+        return habit_list.get(name)
+
     # Loop through each habit in the list and return the one with the matching name
     for habit in habit_list:
         if habit.name == name:
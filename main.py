@@ -1,22 +1,181 @@
-import fire
+import os
+import re
+import sys
+from functools import wraps
 from colorama import Fore, Style
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from habit_manager import create_habit, edit_habit, delete_habit, get_habit_by_name
-from analytics import streak_calc, habits_filter, calculate_completion_rates, get_all_habits, calculate_longest_streak, longest_streak_all_habits
-from data_storage import load_info, save_info
+from analytics import analytics_cache, streak_calc, habits_filter, calculate_completion_rates, get_all_habits, calculate_longest_streak, longest_streak_all_habits, habit_statistics, windowed_statistics, completion_counts, completion_heatmap, period_report, due_habits, PERIODS
+from profiling import profiler
+from data_storage import load_info, save_info, append_completion, append_completions, supports_queries, load_habit, load_summaries, read_completions, store_lock, socket_path, load_analytics_cache, save_analytics_cache
+
+def writes_store(command):
+    '''
+    Run a command that changes the store while holding the store's lock.
+
+    Because the habit list is loaded on first use, a command run in a fresh CLI loads, changes and
+    saves the store under one lock, so concurrent invocations cannot overwrite each other's changes.
+    '''
+    @wraps(command)
+    def locked_command(self, *args, **kwargs):
+        with store_lock(self.file_path):
+            return command(self, *args, **kwargs)
+    return locked_command
+
+
+def resolve_store(file_path='habits.json', user=None, shards_dir='shards'):
+    '''
+    Return the path of the store a command works on.
+
+    Args:
+        file_path (str, optional): Path to the habit store, used when no user is given.
+        user (str, optional): In multi-tenant mode, the user whose shard is used.
+        shards_dir (str, optional): The directory holding one store per user.
+
+    Returns:
+        str: The user's shard in shards_dir if a user is given, file_path otherwise.
+    '''
+    if not user:
+        return file_path
+    from shards import shard_path # Only imported in multi-tenant mode, so single-user invocations start faster
+    return shard_path(shards_dir, user)
+
+
+class InvalidUserError(ValueError):
+    '''Raised by HabitTrackerCLI for a user name that cannot name a store in the shards directory.'''
+
+
+def valid_user(user):
+    '''
+    Check a user name given with --user, printing an error if it cannot name a store in the shards directory.
+
+    Args:
+        user (str): The user name.
+
+    Returns:
+        bool: True if the user name is valid.
+    '''
+    from shards import is_valid_user
+    if is_valid_user(str(user)):
+        return True
+    print(f'{Fore.RED}Invalid user name {Fore.YELLOW}{user}{Fore.RED}: it must not be empty, start with a dot or contain a path separator.{Style.RESET_ALL}')
+    return False
+
+
+def uses_analytics_cache(command):
+    '''
+    Run an analytics command with the analytics cache saved next to the store, if the CLI was asked to persist it.
+
+    The saved results are loaded before the command runs, and the cache is saved afterwards if it changed,
+    so successive invocations reuse each other's results.
+    '''
+    @wraps(command)
+    def cached_command(self, *args, **kwargs):
+        if not self.cache:
+            return command(self, *args, **kwargs)
+        load_analytics_cache(analytics_cache, self.file_path)
+        try:
+            return command(self, *args, **kwargs)
+        finally:
+            save_analytics_cache(analytics_cache, self.file_path)
+    return cached_command
+
 
 class HabitTrackerCLI:
-    def __init__(self, file_path='habits.json'):
+    def __init__(self, file_path='habits.json', quiet=False, user=None, shards_dir='shards', cache=False, profile=False, profile_trace=None, profile_dump=None):
         '''
         Initialize HabitTrackerCLI object.
         Args:
-            file_path (str): Path to the habit storage file.
+            file_path (str): Path to the habit storage file; use a 'sqlite:///' path or a '.db' file for a SQLite store.
+            quiet (bool): Machine mode; skip the welcome banner and the loading and saving messages.
+            user (str): Multi-tenant mode; work on this user's store in shards_dir instead of file_path.
+            shards_dir (str): The directory holding one store per user. Defaults to 'shards'.
+            cache (bool): Save analytics results next to the store ('<store>.cache') and reuse them in later invocations.
+            profile (bool): Print the time spent in each phase of the command (loading, decoding, analytics, saving) to standard error.
+            profile_trace (str): Append a JSON line with the phases and counters of the command to this file ('-' for standard error).
+            profile_dump (str): Write a cProfile dump of the command to this file.
+
+        The profile options are read by main, which enables the profiler for the whole invocation and writes
+        its outputs at the end; they have no effect on a HabitTrackerCLI created by other code.
+
+        Raises:
+            InvalidUserError: If the user name is empty, starts with a dot or contains a path separator; the error is printed too.
+        '''
+        if user is not None:
+            user = str(user) # Fire passes numeric user names as numbers
+            if not valid_user(user):
+                raise InvalidUserError(f'Invalid user name {user}')
+        self.file_path = resolve_store(file_path, user, shards_dir)
+        if user:
+            os.makedirs(shards_dir, exist_ok=True) # So a new user's first command can create their store
+        self.shards_dir = shards_dir
+        self.quiet = quiet
+        self.cache = cache
+        self._habit_list = None
+        self._pending = None # While running a batch, the changes not saved yet: whether to save the store, and completions to append
+        if not quiet:
+            self.welcome()
+
+    @property
+    def habit_list(self):
+        '''The full list of habits, loaded from the store on first use.'''
+        if self._habit_list is None:
+            self._habit_list = load_info(self.file_path, verbose=not self.quiet)
+        return self._habit_list
+
+    def _find_habit(self, habit_name):
+        '''
+        Find a habit by name, reading only that habit from the store if it has not been loaded in full.
+
+        Args:
+            habit_name (str): The name of the habit to retrieve.
+
+        Returns:
+            Habit or None: The matching habit, if it exists; None otherwise.
+        '''
+        if self._habit_list is None and supports_queries(self.file_path):
+            return load_habit(self.file_path, habit_name)
+        return get_habit_by_name(self.habit_list, habit_name)
+
+    def _save(self):
+        '''Save the store, or, while running a batch, save it at the next checkpoint.'''
+        if self._pending is not None:
+            self._pending['save'] = True
+            return
+        save_info(self.habit_list, self.file_path, verbose=not self.quiet)
+
+    def _append_completion(self, habit_name, completion_datetime):
+        '''Append a completion to the store, or, while running a batch, at the next checkpoint.'''
+        if self._pending is not None:
+            self._pending['completions'].append((habit_name, completion_datetime))
+            return
+        append_completion(self._habit_list, habit_name, completion_datetime, self.file_path, verbose=not self.quiet) # Append to the completion log instead of rewriting the whole file
+
+    def _checkpoint(self):
+        '''
+        Save the changes made by the commands of a batch since the last checkpoint.
+
+        A single save of the store covers all changes; if the commands only recorded completions,
+        they are appended to the completion log in one write instead.
+
+        Returns:
+            dict: Whether the store was saved and the number of completions appended.
+
+        Raises:
+            IOError: If the changes could not be written; they are kept, to be written at the next checkpoint.
         '''
-        self.file_path = file_path
-        self.habit_list = load_info(file_path)
-        self.welcome()
+        saved, completions = self._pending['save'], self._pending['completions']
+        if saved:
+            written = save_info(self.habit_list, self.file_path, verbose=not self.quiet)
+        else:
+            written = not completions or append_completions(self.habit_list, completions, self.file_path, verbose=not self.quiet)
+        if not written:
+            raise IOError(f'Failed to save the changes to {self.file_path}')
+        self._pending = {'save': False, 'completions': []}
+        return {'saved': saved, 'completions_appended': 0 if saved else len(completions)}
 
-    def create(self, name, description, start_date, periodicity):
+    @writes_store
+    def create(self, name, description, start_date, periodicity, dedupe=False):
         '''
         Create a new habit with the given name, description, start date, and periodicity.
 
@@ -25,6 +184,7 @@ class HabitTrackerCLI:
             description (str): A brief description of the habit.
             start_date (str): The date when the habit started, in ISO format or 'now'.
             periodicity (str): The frequency of the habit, either 'daily' or 'weekly'.
+            dedupe (bool, optional): Record at most one completion per day (per week for weekly habits). Defaults to False.
         '''
         if not name or not description:
             print(f'{Fore.RED}Habit name and description cannot be empty.{Style.RESET_ALL}')
@@ -52,12 +212,13 @@ class HabitTrackerCLI:
             print(f'{Fore.RED}Invalid start date. Valid date format: \'YYYY-MM-DD\' or \'YYYY-MM-DDTHH:MM:SS\'. Use \'now\' for current date and time.{Style.RESET_ALL}') # Check if the date is invalid
             return
 
-        habit = create_habit(name, description, start_date, periodicity)
+        habit = create_habit(name, description, start_date, periodicity, bool(dedupe))
         self.habit_list.append(habit)
-        save_info(self.habit_list, self.file_path)
+        self._save()
         print(f'{Fore.GREEN}Habit {Fore.YELLOW}{name}{Fore.GREEN} created successfully{Style.RESET_ALL}')
 
-    def edit(self, habit_name, name=None, description=None, start_date=None, periodicity=None):
+    @writes_store
+    def edit(self, habit_name, name=None, description=None, start_date=None, periodicity=None, dedupe=None):
         '''
         Edit an existing habit.
 
@@ -67,21 +228,34 @@ class HabitTrackerCLI:
             description (str, optional): The new description of the habit.
             start_date (str, optional): The new start date of the habit in ISO format.
             periodicity (str, optional): The new frequency of the habit, either 'daily' or 'weekly'.
+            dedupe (bool, optional): Whether to record at most one completion per day (per week for weekly habits).
+                Turning it on removes all but the earliest completion of each day or week.
         '''
         habit = get_habit_by_name(self.habit_list, habit_name)
         if habit:
             if start_date:
                 start_date = datetime.fromisoformat(start_date)
-            edit_habit(habit, name=name, description=description, start_date=start_date, periodicity=periodicity)
-            save_info(self.habit_list, self.file_path)
+            if name and name != habit_name and get_habit_by_name(self.habit_list, name): # Check if the new name is already taken
+                print(f'{Fore.RED}A habit with the name {Fore.YELLOW}{name}{Fore.RED} already exists. Choose a different name.{Style.RESET_ALL}')
+                return
+            completion_count = len(habit.completions)
+            edit_habit(habit, name=name, description=description, start_date=start_date, periodicity=periodicity, habit_list=self.habit_list,
+                       dedupe=None if dedupe is None else bool(dedupe))
+            if len(habit.completions) < completion_count:
+                print(f'{Fore.GREEN}Removed {Fore.WHITE}{completion_count - len(habit.completions)}{Fore.GREEN} duplicate completions{Style.RESET_ALL}')
+            self._save()
             print(f'{Fore.GREEN}Habit {Fore.YELLOW}{habit_name}{Fore.GREEN} edited successfully{Style.RESET_ALL}')
         else:
             raise Exception(f'{Fore.RED}Habit {Fore.YELLOW}{habit_name}{Fore.RED} not found{Style.RESET_ALL}')
 
+    @writes_store
     def delete(self, *habit_names): 
         '''
         Delete one or more habits.
 
+        All habits are checked before any is deleted, so either all of them are deleted or none are,
+        and the store is saved once.
+
         Args:
             *habit_names (str): The name(s) of the habit(s) to be deleted.
         '''
@@ -89,15 +263,20 @@ class HabitTrackerCLI:
             print(f'{Fore.RED}Provide at least one habit name to delete{Style.RESET_ALL}')
             return
 
-        for habit_name in habit_names:
+        habits = []
+        for habit_name in dict.fromkeys(habit_names): # Ignore repeated names
             habit = get_habit_by_name(self.habit_list, habit_name)
-            if habit:
-                delete_habit(self.habit_list, habit)
-                save_info(self.habit_list, self.file_path)
-                print(f'{Fore.GREEN}Habit {Fore.YELLOW}{habit_name}{Fore.GREEN} deleted successfully{Style.RESET_ALL}')
-            else:
+            if not habit:
                 raise ValueError(f'{Fore.RED}Habit {Fore.YELLOW}{habit_name}{Fore.RED} not found{Style.RESET_ALL}')
+            habits.append(habit)
 
+        for habit in habits:
+            delete_habit(self.habit_list, habit)
+        self._save()
+        for habit in habits:
+            print(f'{Fore.GREEN}Habit {Fore.YELLOW}{habit.name}{Fore.GREEN} deleted successfully{Style.RESET_ALL}')
+
+    @uses_analytics_cache
     def streak(self, habit_name):
         '''
         Calculate and return the current streak for a specific habit.
@@ -111,7 +290,7 @@ class HabitTrackerCLI:
         Raises:
         Exception: If the specified habit does not exist in the habit list.
         '''
-        habit = get_habit_by_name(self.habit_list, habit_name)
+        habit = self._find_habit(habit_name)
         if habit:
             # Calculate current streak
             current_streak = streak_calc(habit)
@@ -123,6 +302,7 @@ class HabitTrackerCLI:
             # Raise an exception if the habit was not found
             raise Exception(f'{Fore.RED}Habit not found{Style.RESET_ALL}')
 
+    @uses_analytics_cache
     def longest_streak(self, habit_name):
         '''
         Calculate and return the longest streak for a specific habit.
@@ -136,7 +316,7 @@ class HabitTrackerCLI:
         Raises:
         Exception: If the specified habit does not exist in the habit list.
         '''
-        habit = get_habit_by_name(self.habit_list, habit_name)
+        habit = self._find_habit(habit_name)
         if habit:
             # Calculate the longest streak
             longest_streak = calculate_longest_streak(habit)
@@ -151,6 +331,7 @@ class HabitTrackerCLI:
             # Raise an exception if the habit was not found
             raise Exception(f'{Fore.RED}Habit {Fore.YELLOW}{habit_name}{Fore.RED} not found{Style.RESET_ALL}')
 
+    @uses_analytics_cache
     def longest_streak_all(self):
         '''Returns the longest streak for all habits.
 
@@ -191,6 +372,7 @@ class HabitTrackerCLI:
             formatted_filters.append(formatted_filter)
         return formatted_filters
 
+    @uses_analytics_cache
     def completion_rates(self):
         '''
         Calculate and return the completion rates for all habits.
@@ -198,11 +380,16 @@ class HabitTrackerCLI:
         Returns:
         list: A list of formatted strings for each habit's completion rate, or None if no habits are present.
         '''
-        if not self.habit_list:
+        if self._habit_list is None and supports_queries(self.file_path):
+            habit_list, completion_counts, weeks = load_summaries(self.file_path) # Only the completion counts are needed, not the completions themselves
+        else:
+            habit_list, completion_counts, weeks = self.habit_list, None, None
+
+        if not habit_list:
             print(Fore.RED + 'File not found or empty' + Style.RESET_ALL)
             return None
         else:
-            rates = calculate_completion_rates(self.habit_list)
+            rates = calculate_completion_rates(habit_list, completion_counts, weeks)
             formatted_rates = []
             for rate in rates:
                 completion_rate = round(rate['completion_rate'], 2)
@@ -211,6 +398,170 @@ class HabitTrackerCLI:
                 formatted_rates.append(formatted_rate)
             return formatted_rates
 
+    @uses_analytics_cache
+    def summary(self, engine='python'):
+        '''
+        Generate a summary report with the current streak, longest streak and completion rate of every habit.
+
+        Parameters:
+        engine (str, optional): The analytics engine, 'python' or 'numpy' (requires NumPy). Defaults to 'python'.
+
+        Returns:
+        list: A list of formatted strings, one per habit.
+        '''
+        statistics = habit_statistics(self.habit_list, engine=engine)
+        print(f'{Fore.YELLOW}Total habits: {Fore.WHITE}{len(statistics)}{Style.RESET_ALL}')
+        formatted_statistics = []
+        for habit_statistic in statistics:
+            formatted_statistic = (
+                f"{Fore.YELLOW}{habit_statistic['habit_name']}{Fore.WHITE}: "
+                f"{Fore.GREEN}current streak {Fore.WHITE}{habit_statistic['current_streak']}{Fore.GREEN}, "
+                f"longest streak {Fore.WHITE}{habit_statistic['longest_streak']}{Fore.GREEN}, "
+                f"completion rate {Fore.WHITE}{habit_statistic['completion_rate']:.2f}%{Style.RESET_ALL}"
+            )
+            formatted_statistics.append(formatted_statistic)
+        return formatted_statistics
+
+    def window(self, habit_name, start=None, end=None, period=None):
+        '''
+        Show a habit's completion count, completion rate and streaks within a date range, without scanning its whole history.
+
+        Parameters:
+        habit_name (str): The name of the habit.
+        start (str, optional): The first day of the range, in ISO format (YYYY-MM-DD). Defaults to 29 days before the end.
+        end (str, optional): The last day of the range, in ISO format (YYYY-MM-DD). Defaults to today.
+        period (str, optional): Also count the completions per 'day', 'week' or 'month' of the range.
+
+        Returns:
+        list: A list of formatted strings with the statistics, followed by one line per period.
+        '''
+        try:
+            end_date = date.fromisoformat(str(end)) if end else date.today()
+            start_date = date.fromisoformat(str(start)) if start else end_date - timedelta(days=29)
+        except ValueError:
+            print(f'{Fore.RED}Invalid date. Please use the format YYYY-MM-DD.{Style.RESET_ALL}')
+            return None
+        if start_date > end_date:
+            print(f'{Fore.RED}The start date must not be after the end date.{Style.RESET_ALL}')
+            return None
+        if period is not None and period not in PERIODS:
+            print(f'{Fore.RED}Invalid period. Supported values are: {", ".join(PERIODS)}.{Style.RESET_ALL}')
+            return None
+
+        habit = self._find_habit(habit_name)
+        if not habit:
+            print(f'{Fore.RED}Habit {Fore.YELLOW}{habit_name}{Fore.RED} not found{Style.RESET_ALL}')
+            return None
+
+        statistics = windowed_statistics(habit, start_date, end_date)
+        formatted_window = [
+            f"{Fore.YELLOW}{habit.name}{Fore.GREEN} from {Fore.WHITE}{statistics['start']}{Fore.GREEN} to {Fore.WHITE}{statistics['end']}{Fore.GREEN}: "
+            f"{Fore.WHITE}{statistics['completion_count']}{Fore.GREEN} completions, "
+            f"completion rate {Fore.WHITE}{statistics['completion_rate']:.2f}%{Fore.GREEN}, "
+            f"current streak {Fore.WHITE}{statistics['current_streak']}{Fore.GREEN}, "
+            f"longest streak {Fore.WHITE}{statistics['longest_streak']}{Style.RESET_ALL}"
+        ]
+        if period:
+            for label, count in completion_counts(habit, start_date, end_date, period):
+                formatted_window.append(f'{Fore.CYAN}{label}{Fore.WHITE}: {count}{Style.RESET_ALL}')
+        return formatted_window
+
+    def heatmap(self, habit_name, weeks=12, end=None):
+        '''
+        Show a habit's completions per day as a calendar, one column per week, read from its rollups.
+
+        Parameters:
+        habit_name (str): The name of the habit.
+        weeks (int, optional): Number of weeks shown. Defaults to 12.
+        end (str, optional): The last day shown, in ISO format (YYYY-MM-DD). Defaults to today.
+
+        Returns:
+        list: A list of formatted strings: a header, then one row per weekday, where '·' marks a day without completions.
+        '''
+        try:
+            end_date = date.fromisoformat(str(end)) if end else None
+            weeks = int(weeks)
+        except ValueError:
+            print(f'{Fore.RED}Invalid date or number of weeks.{Style.RESET_ALL}')
+            return None
+        if weeks < 1:
+            print(f'{Fore.RED}The number of weeks must be at least 1.{Style.RESET_ALL}')
+            return None
+        habit = self._find_habit(habit_name)
+        if not habit:
+            print(f'{Fore.RED}Habit {Fore.YELLOW}{habit_name}{Fore.RED} not found{Style.RESET_ALL}')
+            return None
+
+        heatmap = completion_heatmap(habit, end_date, weeks)
+        cells = {None: ' ', 0: f'{Fore.WHITE}·'}
+        formatted_heatmap = [f"{Fore.YELLOW}{habit.name}{Fore.GREEN} from {Fore.WHITE}{heatmap['start']}{Fore.GREEN} to {Fore.WHITE}{heatmap['end']}{Style.RESET_ALL}"]
+        for weekday, name in enumerate(('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')):
+            row = ''.join(cells.get(week[weekday], f'{Fore.GREEN}■') for week in heatmap['weeks'])
+            formatted_heatmap.append(f'{Fore.CYAN}{name} {row}{Style.RESET_ALL}')
+        return formatted_heatmap
+
+    def report(self, period='week', periods=8):
+        '''
+        Show the completion counts of every habit over the most recent days, weeks or months, read from their rollups.
+
+        Parameters:
+        period (str, optional): 'day', 'week' or 'month'. Defaults to 'week'.
+        periods (int, optional): Number of periods shown, ending with the current one. Defaults to 8.
+
+        Returns:
+        list: A list of formatted strings: a header with the period labels, then one row per habit.
+        '''
+        if period not in PERIODS:
+            print(f'{Fore.RED}Invalid period. Supported values are: {", ".join(PERIODS)}.{Style.RESET_ALL}')
+            return None
+        try:
+            periods = int(periods)
+        except ValueError:
+            periods = 0
+        if periods < 1:
+            print(f'{Fore.RED}The number of periods must be a positive integer.{Style.RESET_ALL}')
+            return None
+
+        labels, rows = period_report(self.habit_list, period, periods)
+        width = max(len(label) for label in labels)
+        name_width = max((len(row['habit_name']) for row in rows), default=0)
+        formatted_report = [f"{Fore.CYAN}{'':{name_width}}  {' '.join(f'{label:>{width}}' for label in labels)}{Style.RESET_ALL}"]
+        for row in rows:
+            counts = ' '.join(f'{count:>{width}}' for count in row['counts'])
+            formatted_report.append(f"{Fore.YELLOW}{row['habit_name']:{name_width}}{Fore.WHITE}  {counts}{Style.RESET_ALL}")
+        return formatted_report
+
+    def due(self, within=0):
+        '''
+        Show the habits that have missed their period or must be completed soon to keep their streak, most overdue first.
+
+        Parameters:
+        within (int, optional): Also show habits due up to this many days from today. Defaults to 0 (due today).
+
+        Returns:
+        list: A list of formatted strings, one per due habit.
+        '''
+        try:
+            within = int(within)
+        except ValueError:
+            within = -1
+        if within < 0:
+            print(f'{Fore.RED}The number of days must be a non-negative integer.{Style.RESET_ALL}')
+            return None
+
+        rows = due_habits(self.habit_list, within=within)
+        if not rows:
+            print(f'{Fore.GREEN}No habits are due{Style.RESET_ALL}')
+        formatted_due = []
+        for row in rows:
+            if row['status'] == 'overdue':
+                status = f"{Fore.RED}overdue since {Fore.WHITE}{row['due_date']}"
+            else:
+                status = f"{Fore.YELLOW}due by {Fore.WHITE}{row['due_date']}{Fore.YELLOW} to keep a streak of {Fore.WHITE}{row['current_streak']}"
+            formatted_due.append(f"{Fore.CYAN}{row['habit_name']}{Fore.WHITE}: {status}{Style.RESET_ALL}")
+        return formatted_due
+
+    @writes_store
     def complete(self, habit_name, completion_datetime=None):
         '''
         Mark a habit as complete at a specified datetime.
@@ -222,23 +573,446 @@ class HabitTrackerCLI:
         Raises:
         Exception: If the specified habit does not exist in the habit list.
         '''
-        habit = get_habit_by_name(self.habit_list, habit_name)
+        habit = self._find_habit(habit_name)
         if habit:
             if completion_datetime:
                 completion_datetime = datetime.fromisoformat(completion_datetime) # If a completion datetime is provided, use it
+                if completion_datetime.tzinfo is not None:
+                    print(f'{Fore.RED}Completion datetimes must be local times without a UTC offset, such as 2023-01-01T12:00:00.{Style.RESET_ALL}')
+                    return
             else:
                 completion_datetime = datetime.now() # If no completion datetime is provided, use the current datetime
-            habit.complete_habit(completion_datetime)
-            save_info(self.habit_list, self.file_path)
+            if not habit.complete_habit(completion_datetime):
+                print(f'{Fore.YELLOW}Habit {habit_name} was already completed {"in that week" if habit.periodicity == "weekly" else "on that day"}; the completion was not recorded{Style.RESET_ALL}')
+                return
+            self._append_completion(habit_name, completion_datetime)
             print(f'{Fore.GREEN}Habit {Fore.YELLOW}{habit_name}{Fore.GREEN} marked as complete{Style.RESET_ALL}')
         else:
             print(f'{Fore.RED}Habit {Fore.CYAN}{habit_name}{Fore.RED} not found{Style.RESET_ALL}')
 
+    @writes_store
+    def complete_many(self, source='-'):
+        '''
+        Mark habits as complete in bulk, from a CSV file or standard input, and save the store once.
+
+        Each line holds a habit name and, optionally, an ISO formatted completion datetime:
+        'habit name,2023-01-01T12:00:00'. Blank lines and lines starting with '#' are skipped.
+        Every line is checked before any completion is recorded, so an invalid line leaves the store unchanged.
+
+        Parameters:
+        source (str, optional): Path to the CSV file, or '-' to read from standard input. Defaults to '-'.
+
+        Returns:
+        int: The number of completions recorded, or None if the input was invalid.
+        '''
+        try:
+            completions = read_completions(source)
+        except (OSError, ValueError) as error:
+            print(f'{Fore.RED}Invalid completions input: {error}{Style.RESET_ALL}')
+            return None
+
+        habits = []
+        for habit_name, completion_datetime in completions:
+            habit = get_habit_by_name(self.habit_list, habit_name)
+            if not habit:
+                print(f'{Fore.RED}Habit {Fore.CYAN}{habit_name}{Fore.RED} not found. No completions were recorded.{Style.RESET_ALL}')
+                return None
+            habits.append(habit)
+
+        recorded = 0
+        for habit, (_, completion_datetime) in zip(habits, completions):
+            recorded += habit.complete_habit(completion_datetime or datetime.now())
+        self._save()
+        print(f'{Fore.GREEN}Recorded {Fore.WHITE}{recorded}{Fore.GREEN} completions for {Fore.WHITE}{len(set(habits))}{Fore.GREEN} habits{Style.RESET_ALL}')
+        return recorded
+
+    @writes_store
+    def import_habits(self, source):
+        '''
+        Import habits and completions from another store, and save the store once.
+
+        Habits that do not exist yet are added. For habits that already exist, completions that are
+        not recorded yet are added, so importing the same store twice changes nothing.
+
+        Parameters:
+        source (str): Path to the store to import; a JSON file, or a 'sqlite:///' path or '.db' file.
+
+        Returns:
+        int: The number of habits added.
+        '''
+        imported_habits = load_info(source, verbose=not self.quiet)
+        added_habits = added_completions = 0
+        for imported_habit in imported_habits:
+            habit = get_habit_by_name(self.habit_list, imported_habit.name)
+            if not habit:
+                self.habit_list.append(imported_habit)
+                added_habits += 1
+                continue
+            recorded = set(habit.completions.timestamps)
+            for completion_datetime, timestamp in zip(imported_habit.completions, imported_habit.completions.timestamps):
+                if timestamp not in recorded and habit.complete_habit(completion_datetime):
+                    recorded.add(timestamp)
+                    added_completions += 1
+
+        self._save()
+        print(f'{Fore.GREEN}Imported {Fore.WHITE}{added_habits}{Fore.GREEN} new habits and {Fore.WHITE}{added_completions}{Fore.GREEN} completions for existing habits{Style.RESET_ALL}')
+        return added_habits
+
+    def export(self, destination):
+        '''
+        Write all habits to another store, converting between the JSON, binary and SQLite formats.
+
+        Parameters:
+        destination (str): Path to the store to write; a 'sqlite:///' path or a '.db' file selects SQLite, a '.hbin' file the binary format, anything else JSON.
+        '''
+        save_info(self.habit_list, destination, verbose=not self.quiet)
+        print(f'{Fore.GREEN}Exported {Fore.WHITE}{len(self.habit_list)}{Fore.GREEN} habits to {Fore.YELLOW}{destination}{Style.RESET_ALL}')
+
+    @writes_store
+    def batch(self, source='-'):
+        '''
+        Run a script of commands against the store, loading it once and saving it once at the end.
+
+        Each line holds a command line as given to main.py, without flags of the whole invocation such as --file_path
+        ('complete "Drink water" --completion_datetime 2023-01-01T12:00:00'), or a JSON object such as
+        {"command": "complete", "args": ["Drink water"], "kwargs": {"completion_datetime": "2023-01-01T12:00:00"}}.
+        Blank lines and lines starting with '#' are skipped, and a 'checkpoint' line saves the changes made so far.
+        The store stays locked until the batch ends, so other processes see the changes at checkpoints only.
+
+        When the script is read from standard input, commands cannot read their own input from it ('complete_many -').
+        One JSON line is printed per command, with its 'line' number, 'command', 'result', captured 'output'
+        and 'error' (null if it succeeded), followed by one for the final checkpoint with the number of 'errors'.
+        A failing command does not stop the batch; if a checkpoint fails to save, its changes are kept for the next one.
+
+        Parameters:
+        source (str, optional): Path to the script, or '-' to read it from standard input. Defaults to '-'.
+        '''
+        import io, json # Only needed for batches, so keep them off the startup path
+        from contextlib import redirect_stdout
+        quiet, self.quiet = self.quiet, True # Results are reported as JSON, without status messages
+        self._pending = {'save': False, 'completions': []}
+        file = sys.stdin if source == '-' else open(source, 'r')
+        errors = 0
+        try:
+            self.habit_list # Loaded once, so commands that read single habits see the changes of earlier commands
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                record = {'line': line_number, 'command': None, 'result': None, 'output': '', 'error': None}
+                output = io.StringIO()
+                try:
+                    command_name, positional, command_kwargs = parse_batch_line(line)
+                    record['command'] = command_name
+                    if file is sys.stdin and command_name in STDIN_COMMANDS and (positional or [command_kwargs.get('source', '-')])[0] == '-':
+                        raise ValueError(f'The {command_name} command cannot read standard input, which holds the batch script')
+                    with redirect_stdout(output):
+                        if command_name == 'checkpoint':
+                            record['result'] = self._checkpoint()
+                        else:
+                            record['result'] = strip_colors(getattr(self, command_name)(*positional, **command_kwargs))
+                except Exception as error:
+                    record['error'] = strip_colors(str(error))
+                    errors += 1
+                record['output'] = strip_colors(output.getvalue())
+                print(json.dumps(record, default=str), flush=True)
+        finally:
+            if file is not sys.stdin:
+                file.close()
+            record = {'line': None, 'command': 'checkpoint', 'result': None, 'output': '', 'error': None}
+            output = io.StringIO()
+            try:
+                with redirect_stdout(output):
+                    record['result'] = self._checkpoint()
+            except IOError as error:
+                record['error'] = str(error)
+                errors += 1
+            record['output'] = strip_colors(output.getvalue())
+            record['errors'] = errors
+            self._pending = None
+            self.quiet = quiet
+        print(json.dumps(record))
+
+    @uses_analytics_cache
+    def cache_stats(self):
+        '''
+        Show the hit and miss counters of the analytics cache; with --cache, counted over all invocations that used the saved cache.
+
+        Returns:
+        str: A formatted string with the counters and the number of cached results.
+        '''
+        lookups = analytics_cache.hits + analytics_cache.misses
+        hit_rate = analytics_cache.hits / lookups * 100 if lookups else 0
+        cached_results = len(analytics_cache.entries) + len(analytics_cache.saved_entries)
+        return (
+            f'{Fore.GREEN}Analytics cache: {Fore.WHITE}{analytics_cache.hits}{Fore.GREEN} hits, {Fore.WHITE}{analytics_cache.misses}{Fore.GREEN} misses '
+            f'({Fore.WHITE}{hit_rate:.2f}%{Fore.GREEN}), {Fore.WHITE}{cached_results}{Fore.GREEN} cached results{Style.RESET_ALL}'
+        )
+
+    def leaderboard(self, sort_by='completion_rate', workers=None):
+        '''
+        Rank all users in the shards directory by their completion rates and streaks.
+
+        The statistics of each user's store are computed in parallel in a pool of worker processes.
+
+        Parameters:
+        sort_by (str, optional): 'completion_rate' (average over the user's habits), 'current_streak' (best current streak)
+            or 'longest_streak' (longest streak of any habit). Defaults to 'completion_rate'.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+
+        Returns:
+        list: A list of formatted strings, one per user, best first.
+        '''
+        from shards import leaderboard, LEADERBOARD_KEYS # Pulls in multiprocessing, which only this command needs
+        if sort_by not in LEADERBOARD_KEYS:
+            print(f'{Fore.RED}Invalid statistic. Supported values are: {", ".join(LEADERBOARD_KEYS)}.{Style.RESET_ALL}')
+            return None
+        try:
+            rows = leaderboard(self.shards_dir, sort_by, int(workers) if workers else None)
+        except FileNotFoundError:
+            print(f'{Fore.RED}Shards directory {Fore.YELLOW}{self.shards_dir}{Fore.RED} not found{Style.RESET_ALL}')
+            return None
+
+        print(f'{Fore.YELLOW}Total users: {Fore.WHITE}{len(rows)}{Style.RESET_ALL}')
+        formatted_rows = []
+        for rank, row in enumerate(rows, start=1):
+            formatted_row = (
+                f"{Fore.WHITE}{rank:>3}. {Fore.YELLOW}{row['user']}{Fore.WHITE} ({row['habit_count']} habits): "
+                f"{Fore.GREEN}completion rate {Fore.WHITE}{row['completion_rate']:.2f}%{Fore.GREEN}, "
+                f"current streak {Fore.WHITE}{row['current_streak']}{Fore.GREEN}, "
+                f"longest streak {Fore.WHITE}{row['longest_streak']}{Style.RESET_ALL}"
+            )
+            if row['longest_streak_habit']:
+                formatted_row += f" ({row['longest_streak_habit']})"
+            formatted_rows.append(formatted_row)
+        return formatted_rows
+
+    def serve(self):
+        '''
+        Run a daemon that keeps the store loaded and serves commands for it over a Unix domain socket.
+
+        While the daemon runs, invocations of main.py for the same store are forwarded to it instead of loading the store themselves.
+        Stop it with Ctrl-C or SIGTERM.
+        '''
+        import daemon
+        daemon.serve(self.file_path)
+
+    def serve_http(self, host='127.0.0.1', port=8000):
+        '''
+        Serve the store over a local HTTP/JSON API for dashboards and other clients.
+
+        Parameters:
+        host (str, optional): The address to listen on. Defaults to '127.0.0.1'.
+        port (int, optional): The port to listen on. Defaults to 8000.
+        '''
+        import server
+        server.run(self.file_path, host, port)
+
     def welcome(self):
         '''
         Display a welcome message.
         '''
         print(f'{Fore.CYAN}\nWelcome to HabitBuddy!\n{Style.RESET_ALL}')
 
+INIT_FLAGS = ('file_path', 'quiet', 'user', 'shards_dir', 'cache', 'profile', 'profile_trace', 'profile_dump')
+BOOLEAN_FLAGS = ('quiet', 'cache', 'profile', 'dedupe') # Switched on by the bare flag
+PROFILE_FLAGS = ('profile', 'profile_trace', 'profile_dump') # Profiled commands are run by main itself, not forwarded to a daemon
+LOCAL_COMMANDS = ('serve', 'serve_http', 'leaderboard', 'export', 'import_habits', 'complete_many', 'batch') # Read or write other files or standard input, relative to the caller
+BATCH_EXCLUDED = ('serve', 'serve_http', 'batch') # Commands that cannot run inside a batch
+STDIN_COMMANDS = ('complete_many',) # Read standard input when their source is '-', the default
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*m')
+
+def parse_command_line(argv):
+    '''
+    Parse a simple command line without Fire.
+
+    Handles a single command with positional arguments and '--name value' or '--name=value' flags,
+    where flags are constructor arguments (--file_path, --quiet, ...) or parameters of the command.
+
+    Args:
+        argv (list): The command-line arguments, without the program name.
+
+    Returns:
+        tuple or None: The constructor keyword arguments, the command name, its positional arguments
+            and its keyword arguments; or None if the command line needs Fire (help, chained calls, unknown flags).
+    '''
+    init_kwargs, command_kwargs, positional = {}, {}, []
+    command_name = None
+    args = iter(argv)
+    for arg in args:
+        if arg in ('--', '-h', '--help') or (arg.startswith('-') and not arg.startswith('--') and len(arg) > 1):
+            return None
+        if not arg.startswith('--'):
+            if command_name is None:
+                command_name = arg
+            else:
+                positional.append(arg)
+            continue
+
+        name, has_value, value = arg[2:].partition('=')
+        name = name.replace('-', '_')
+        if name in BOOLEAN_FLAGS:
+            if has_value and value not in ('True', 'False'):
+                return None
+            value = value != 'False' # A bare --quiet or --cache switches the option on
+        elif not has_value:
+            value = next(args, None)
+            if value is None:
+                return None
+        (init_kwargs if name in INIT_FLAGS else command_kwargs)[name] = value
+
+    command = getattr(HabitTrackerCLI, command_name or '', None)
+    if command_name is None or command_name.startswith('_') or not callable(command) or isinstance(command, type):
+        return None
+    function = getattr(command, '__wrapped__', command)
+    code = function.__code__
+    parameters = code.co_varnames[1:code.co_argcount + code.co_kwonlyargcount]
+    required = parameters[:code.co_argcount - 1 - len(function.__defaults__ or ())]
+    accepts_varargs = bool(code.co_flags & 0x04) # CO_VARARGS
+    if any(name not in parameters for name in command_kwargs):
+        return None
+    if len(positional) > code.co_argcount - 1 and not accepts_varargs:
+        return None
+    if any(name not in command_kwargs for name in required[len(positional):]): # Let Fire report missing arguments
+        return None
+    return init_kwargs, command_name, positional, command_kwargs
+
+
+def parse_batch_line(line):
+    '''
+    Parse one line of a batch script; see HabitTrackerCLI.batch.
+
+    Args:
+        line (str): A command line, or a JSON object with a 'command' and optional 'args' and 'kwargs'.
+
+    Returns:
+        tuple: The command name, its positional arguments and its keyword arguments, as strings like on the command line.
+
+    Raises:
+        ValueError: If the line is not valid, uses flags of the whole invocation or names a command that cannot run in a batch.
+    '''
+    import json, shlex
+    if line.lstrip().startswith('{'):
+        request = json.loads(line)
+        args, kwargs = request.get('args', []), request.get('kwargs', {})
+        if not isinstance(request.get('command'), str) or not isinstance(args, list) or not isinstance(kwargs, dict):
+            raise ValueError('A JSON command needs a "command" string, and its "args" must be a list and its "kwargs" an object')
+        argv = [request['command'], *map(str, args), *(f'--{name}={value}' for name, value in kwargs.items() if value is not None)]
+    else:
+        argv = shlex.split(line)
+    if argv == ['checkpoint']:
+        return 'checkpoint', [], {}
+    parsed = parse_command_line(argv)
+    if parsed is None:
+        raise ValueError(f'Invalid command: {line.strip()}')
+    init_kwargs, command_name, positional, command_kwargs = parsed
+    if init_kwargs:
+        raise ValueError(f'Flags of the whole invocation ({", ".join("--" + name for name in init_kwargs)}) cannot be used in a batch')
+    if command_name in BATCH_EXCLUDED:
+        raise ValueError(f'The {command_name} command cannot be used in a batch')
+    return command_name, positional, command_kwargs
+
+
+def strip_colors(result):
+    '''Remove the terminal color codes from a command's result or output, for machine-readable output.'''
+    if isinstance(result, str):
+        return ANSI_ESCAPE.sub('', result)
+    if isinstance(result, (list, tuple)):
+        return [strip_colors(item) for item in result]
+    return result
+
+
+def profile_options(argv):
+    '''
+    Find the profile options in a command line that is run through Fire.
+
+    Args:
+        argv (list): The command-line arguments, without the program name.
+
+    Returns:
+        dict: The summary, trace_path and dump_path arguments of Profiler.configure.
+    '''
+    options = {}
+    args = iter(argv)
+    for arg in args:
+        name, has_value, value = arg[2:].partition('=') if arg.startswith('--') else ('', False, '')
+        name = name.replace('-', '_')
+        if name == 'profile':
+            options['summary'] = value != 'False'
+        elif name in ('profile_trace', 'profile_dump'):
+            options[name.replace('profile_', '') + '_path'] = value if has_value else next(args, None)
+    return options
+
+
+def print_result(result):
+    '''Print a command's return value the way Fire does: one line per list item, nothing for None.'''
+    if result is None:
+        return
+    if isinstance(result, (list, tuple)):
+        for item in result:
+            print(item)
+    else:
+        print(result)
+
+
+def main(argv=None):
+    '''
+    Run the command line interface.
+
+    Simple command lines are dispatched directly, so a typical invocation does not pay for importing Fire.
+    Anything else (help, chained calls, Fire flags) falls back to Fire. If a daemon is serving the store,
+    simple command lines are forwarded to it instead of loading the store.
+
+    Args:
+        argv (list, optional): The command-line arguments, without the program name. Defaults to sys.argv[1:].
+    '''
+    argv = sys.argv[1:] if argv is None else argv
+    if '--quiet' in argv or '--quiet=True' in argv: # Machine mode: strip colors from everything printed
+        import colorama
+        colorama.init(strip=True)
+
+    profiler.configure_from_environment()
+    try:
+        run_command_line(argv)
+    finally:
+        profiler.finish(argv)
+
+
+def run_command_line(argv):
+    '''
+    Run one command line, directly, through the daemon or through Fire; see main.
+
+    Args:
+        argv (list): The command-line arguments, without the program name.
+    '''
+    parsed = parse_command_line(argv)
+    if parsed is None:
+        import fire # Only imported when needed, as it makes up most of the startup time
+        profiler.configure(**profile_options(argv))
+        with profiler.phase('command'):
+            try:
+                fire.Fire(HabitTrackerCLI, command=argv)
+            except InvalidUserError: # Already reported
+                sys.exit(1)
+        return
+
+    init_kwargs, command_name, positional, command_kwargs = parsed
+    profiler.configure(init_kwargs.get('profile', False), init_kwargs.get('profile_trace'), init_kwargs.get('profile_dump'))
+    if 'user' in init_kwargs and not valid_user(init_kwargs['user']):
+        sys.exit(1)
+    file_path = resolve_store(**{name: value for name, value in init_kwargs.items() if name in ('file_path', 'user', 'shards_dir')})
+    if command_name not in LOCAL_COMMANDS and not profiler.enabled and os.name == 'posix' and os.path.exists(socket_path(file_path)):
+        import daemon # Only imported when a daemon may be running; profiled commands run here, where they can be measured
+        response = daemon.forward(file_path, argv)
+        if response is not None:
+            print(response['output'], end='')
+            if response['error']:
+                sys.exit(response['error'])
+            return
+
+    with profiler.phase('command'):
+        habit_tracker = HabitTrackerCLI(**init_kwargs)
+        print_result(getattr(habit_tracker, command_name)(*positional, **command_kwargs))
+
+
 if __name__ == "__main__":
-    fire.Fire(HabitTrackerCLI)
\ No newline at end of file
+    main()
\ No newline at end of file
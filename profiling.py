@@ -0,0 +1,173 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from colorama import Fore, Style
+
+PROFILE_ENV = 'HABITBUDDY_PROFILE' # Set to 1 to print the per-phase summary after every command
+TRACE_ENV = 'HABITBUDDY_PROFILE_TRACE' # Path a JSON trace line is appended to for every command, or '-' for standard error
+DUMP_ENV = 'HABITBUDDY_PROFILE_DUMP' # Path a cProfile dump of the command is written to
+
+class Profiler:
+    '''
+    Instrumentation for one invocation: the wall time of each phase and counters of the work done.
+
+    Phases nest; a phase started inside another is recorded under both names joined by '/', such as
+    'command/load/json_decode', so the time of a phase includes the time of the phases inside it.
+    While the profiler is disabled, phases and counters are not recorded.
+    '''
+    def __init__(self):
+        '''Initialize a disabled Profiler.'''
+        self.enabled = False
+        self.summary = False
+        self.trace_path = None
+        self.dump_path = None
+        self.phases = {}
+        self.counters = {}
+        self._stack = []
+        self._started = None
+        self._cprofile = None
+
+    def configure(self, summary=False, trace_path=None, dump_path=None):
+        '''
+        Enable the profiler and choose its outputs; options already enabled stay enabled.
+
+        Args:
+            summary (bool, optional): Print the phases and counters to standard error when the invocation finishes.
+            trace_path (str, optional): Append a JSON trace line to this file when the invocation finishes; '-' for standard error.
+            dump_path (str, optional): Run the invocation under cProfile and write its statistics to this file.
+        '''
+        if not (summary or trace_path or dump_path):
+            return
+        if not self.enabled:
+            self.enabled = True
+            self._started = time.perf_counter()
+        self.summary = self.summary or summary
+        self.trace_path = trace_path or self.trace_path
+        self.dump_path = dump_path or self.dump_path
+        if self.dump_path and self._cprofile is None:
+            import cProfile # Only imported when a dump is requested
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def configure_from_environment(self):
+        '''Enable the profiler if any of the HABITBUDDY_PROFILE variables are set.'''
+        self.configure(
+            summary=os.environ.get(PROFILE_ENV, '') not in ('', '0'),
+            trace_path=os.environ.get(TRACE_ENV) or None,
+            dump_path=os.environ.get(DUMP_ENV) or None,
+        )
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        Time a phase of the invocation.
+
+        Args:
+            name (str): The name of the phase.
+        '''
+        if not self.enabled:
+            yield
+            return
+        self._stack.append(name)
+        key = '/'.join(self._stack)
+        self.phases.setdefault(key, (0, 0.0)) # Listed in the order phases are first entered, so parents come before their phases
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._stack.pop()
+            calls, seconds = self.phases[key]
+            self.phases[key] = (calls + 1, seconds + elapsed)
+
+    def count(self, name, amount=1):
+        '''
+        Add to a counter, such as the number of habits loaded or bytes written.
+
+        Args:
+            name (str): The name of the counter.
+            amount (int, optional): The amount added. Defaults to 1.
+        '''
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dictionary(self, argv=None):
+        '''
+        Convert the recorded phases and counters to a dictionary, as written to trace lines.
+
+        Args:
+            argv (list, optional): The command-line arguments of the invocation.
+
+        Returns:
+            dict: The time, process id, arguments, total wall time in milliseconds, phases and counters.
+        '''
+        return {
+            'time': datetime.now().isoformat(),
+            'pid': os.getpid(),
+            'argv': argv,
+            'total_ms': round((time.perf_counter() - self._started) * 1000, 3) if self._started else 0,
+            'phases': {name: {'calls': calls, 'ms': round(seconds * 1000, 3)} for name, (calls, seconds) in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+
+    def finish(self, argv=None):
+        '''
+        Write the outputs chosen with configure and reset the profiler for the next invocation.
+
+        Args:
+            argv (list, optional): The command-line arguments of the invocation, recorded in the trace line.
+        '''
+        if not self.enabled:
+            return
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.dump_path)
+        report = self.to_dictionary(argv)
+        if self.trace_path:
+            line = json.dumps(report) + '\n'
+            if self.trace_path == '-':
+                sys.stderr.write(line)
+            else:
+                with open(self.trace_path, 'a', encoding='utf-8') as trace:
+                    trace.write(line)
+        if self.summary:
+            print(format_summary(report), file=sys.stderr)
+        self.__init__()
+
+
+def format_summary(report):
+    '''
+    Format a profiler report for people.
+
+    Args:
+        report (dict): A report, as returned by Profiler.to_dictionary.
+
+    Returns:
+        str: One line per phase, indented by nesting, followed by the counters.
+    '''
+    lines = [f"{Fore.CYAN}Profile: {Fore.WHITE}{report['total_ms']:.2f} ms{Fore.CYAN} in total{Style.RESET_ALL}"]
+    for name, phase in report['phases'].items():
+        depth = name.count('/')
+        label = '  ' * depth + name.rsplit('/', 1)[-1]
+        lines.append(f"{Fore.YELLOW}{label:<32}{Fore.WHITE}{phase['ms']:>10.2f} ms  {phase['calls']:>6} calls{Style.RESET_ALL}")
+    for name, value in sorted(report['counters'].items()):
+        lines.append(f'{Fore.GREEN}{name:<32}{Fore.WHITE}{value:>10}{Style.RESET_ALL}')
+    return '\n'.join(lines)
+
+
+def profiled(function):
+    '''Record each call of a function as a phase named after it.'''
+    @wraps(function)
+    def profiled_function(*args, **kwargs):
+        if not profiler.enabled:
+            return function(*args, **kwargs)
+        with profiler.phase(function.__name__):
+            return function(*args, **kwargs)
+    return profiled_function
+
+
+profiler = Profiler()
@@ -0,0 +1,359 @@
+import asyncio
+import json
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+from urllib.parse import urlsplit, parse_qs, unquote
+from colorama import Fore, Style
+from analytics import streak_calc, calculate_longest_streak, calculate_completion_rates, longest_streak_all_habits, habit_statistics, windowed_statistics, completion_counts, completion_heatmap, period_report, due_habits
+from data_storage import load_info, append_completions, store_lock
+from daemon import store_signature
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+MAX_BODY_SIZE = 64 * 1024
+RESPONSE_CACHE_SIZE = 1024 # Number of GET responses kept before the least recently used are evicted
+
+class HTTPError(Exception):
+    '''An error response with a status code and a message.'''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class HabitServer:
+    '''
+    Local HTTP/JSON API over a habit store, for many concurrent clients.
+
+    The store is loaded once and kept in memory. Completions posted by clients are put on a queue drained by a
+    single writer task: every completion that arrives while a batch is being saved joins the next batch, so
+    concurrent completions are coalesced into one append to the store. Like the daemon, the server reloads
+    the store before each request if another process changed it, and checks again before each batch is saved.
+    Responses to GET requests are cached, least recently used first out, until the next batch of completions
+    is applied or the store is reloaded (or the day changes, as streaks depend on the date).
+
+    Endpoints:
+        GET  /habits                       All habits, with their completion counts.
+        GET  /habits/<name>                One habit, with its current and longest streak.
+        GET  /habits/<name>/completions    The completion datetimes of a habit.
+        POST /habits/<name>/completions    Record a completion; the body may hold {"completion_datetime": "<ISO datetime>"}.
+                                           "recorded" is false if the habit deduplicates and already has one in that period.
+        GET  /habits/<name>/window         Completion count, rate and streaks of a habit from ?start= to ?end= (ISO dates,
+                                           by default the last 30 days), with counts per ?period=day|week|month.
+        GET  /habits/<name>/heatmap        Daily completion counts of a habit, one list per week (?weeks=12&end=<ISO date>).
+        GET  /analytics/summary            Current streak, longest streak and completion rate of every habit (?engine=numpy).
+        GET  /analytics/completion_rates   Completion rate of every habit.
+        GET  /analytics/longest_streak     The habit with the longest streak.
+        GET  /analytics/report             Completion counts of every habit in recent periods (?period=week&periods=8).
+        GET  /analytics/due                Habits overdue or due within ?within= days, most overdue first.
+        GET  /status                       Request, cache and batching counters.
+    '''
+    def __init__(self, file_path):
+        '''
+        Initialize a HabitServer and load its store.
+
+        Args:
+            file_path (str): Path to the habit store to serve.
+        '''
+        self.file_path = file_path
+        self.habit_list, self.signature = self._load()
+        self.cache = OrderedDict() # (path segments, query, date) -> response body
+        self.queue = None
+        self.store_access = None # Held while the store is reloaded or a batch is applied and saved
+        self.writer_task = None
+        self.counters = {'requests': 0, 'cache_hits': 0, 'cache_misses': 0, 'batches': 0, 'completions': 0}
+
+    async def start(self, host='127.0.0.1', port=8000):
+        '''
+        Start the writer task and listen for connections.
+
+        Args:
+            host (str, optional): The address to listen on. Defaults to '127.0.0.1'.
+            port (int, optional): The port to listen on, or 0 for any free port. Defaults to 8000.
+
+        Returns:
+            asyncio.Server: The listening server.
+        '''
+        self.queue = asyncio.Queue()
+        self.store_access = asyncio.Lock()
+        self.writer_task = asyncio.create_task(self._write_completions())
+        return await asyncio.start_server(self._serve_connection, host, port)
+
+    def _load(self):
+        '''Load the store, along with the signature of its files, under the store lock.'''
+        with store_lock(self.file_path):
+            habit_list = load_info(self.file_path, verbose=False)
+            signature = store_signature(self.file_path)
+        for habit in habit_list:
+            habit.completions.timestamps # Decode up front, as completions are read from the writer's thread too
+        return habit_list, signature
+
+    async def _refresh(self):
+        '''
+        Reload the store if another process changed it since it was loaded or last written, and drop the cached
+        responses. Requests only wait for a batch being saved if the store changed meanwhile.
+        '''
+        if store_signature(self.file_path) == self.signature:
+            return
+        async with self.store_access:
+            if store_signature(self.file_path) == self.signature: # Written by the batch that held the lock
+                return
+            self.habit_list, self.signature = await asyncio.get_running_loop().run_in_executor(None, self._load)
+            self.cache.clear()
+
+    def _save(self, batch, recorded):
+        '''
+        Save a batch of completions, already applied to the served habits; run in the writer's thread.
+
+        The store stays locked from the check to the write. If another process changed it since it was loaded
+        or last written, for example by creating a habit, it is reloaded and the batch is applied to the
+        reloaded habits instead, so that compacting the log, which rewrites the snapshot from the habits in
+        memory, does not drop the other process's changes.
+
+        Args:
+            batch (list): (habit name, completion datetime) tuples, in the order they were queued.
+            recorded (list): Whether the served habits recorded each completion; False for deduplicated ones.
+
+        Returns:
+            tuple: The reloaded HabitCollection, or None if the store had not changed; whether each completion
+                was recorded, or None for habits the other process deleted; and whether the batch was saved.
+        '''
+        with store_lock(self.file_path):
+            habit_list = None
+            if store_signature(self.file_path) != self.signature:
+                habit_list, self.signature = self._load()
+                habits = [habit_list.get(habit_name) for habit_name, _ in batch]
+                recorded = [habit.complete_habit(completion_datetime) if habit is not None else None for habit, (_, completion_datetime) in zip(habits, batch)]
+            completions = [completion for completion, is_recorded in zip(batch, recorded) if is_recorded]
+            saved = not completions or append_completions(habit_list or self.habit_list, completions, self.file_path, False)
+            self.signature = store_signature(self.file_path)
+        return habit_list, recorded, saved
+
+    async def _write_completions(self):
+        '''Apply and save queued completions in batches, one batch at a time.'''
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty(): # Everything that arrived while the previous batch was being saved
+                batch.append(self.queue.get_nowait())
+
+            recorded = [False] * len(batch)
+            try:
+                async with self.store_access:
+                    habits = [self.habit_list.get(habit_name) for habit_name, _, _ in batch] # Looked up now, as the store may have been reloaded since
+                    recorded = [habit.complete_habit(completion_datetime) if habit is not None else None for habit, (_, completion_datetime, _) in zip(habits, batch)] # False for deduplicated completions
+                    self.cache.clear()
+                    habit_list, recorded, saved = await loop.run_in_executor(
+                        None, self._save, [(habit_name, completion_datetime) for habit_name, completion_datetime, _ in batch], recorded,
+                    )
+                    if habit_list is not None: # Reloaded, as another process changed the store
+                        self.habit_list = habit_list
+                        self.cache.clear()
+            except Exception as error: # Whatever failed, the clients waiting on the batch must get an answer
+                print(f'{Fore.RED}Error: {Style.RESET_ALL} Failed to save completions: {error!r}', flush=True)
+                saved = False
+
+            self.counters['batches'] += 1
+            self.counters['completions'] += sum(is_recorded is True for is_recorded in recorded)
+            for (habit_name, _, future), is_recorded in zip(batch, recorded):
+                if future.done(): # The client went away
+                    continue
+                if not saved:
+                    future.set_exception(HTTPError(500, 'Failed to save data'))
+                elif is_recorded is None:
+                    future.set_exception(HTTPError(404, f'Habit {habit_name} not found'))
+                else:
+                    future.set_result(is_recorded)
+
+    async def _serve_connection(self, reader, writer):
+        '''Serve HTTP/1.1 requests on one connection until the client closes it.'''
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    keep_alive = keep_alive and version == 'HTTP/1.1'
+                    length = int(headers.get('content-length', 0))
+                    if not 0 <= length <= MAX_BODY_SIZE:
+                        raise ValueError
+                except ValueError:
+                    status, body, keep_alive = 400, json.dumps({'error': 'Malformed request'}).encode('utf-8'), False
+                else:
+                    status, body = await self.handle(method, target, await reader.readexactly(length))
+
+                writer.write(
+                    f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                    f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, method, target, body=b''):
+        '''
+        Handle one request.
+
+        Args:
+            method (str): The HTTP method.
+            target (str): The request target: a path with an optional query string.
+            body (bytes, optional): The request body.
+
+        Returns:
+            tuple: The status code and the JSON response body.
+        '''
+        self.counters['requests'] += 1
+        url = urlsplit(target)
+        path = [unquote(segment) for segment in url.path.strip('/').split('/')]
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            await self._refresh()
+            if method == 'POST' and len(path) == 3 and path[0] == 'habits' and path[2] == 'completions':
+                return 201, json.dumps(await self._complete(path[1], body)).encode('utf-8')
+            if method != 'GET':
+                raise HTTPError(405, f'{method} is not supported here')
+            if path == ['status']:
+                return 200, json.dumps(self.counters).encode('utf-8')
+
+            key = (tuple(path), tuple(sorted(query.items())), date.today())
+            response = self.cache.get(key)
+            if response is None:
+                self.counters['cache_misses'] += 1
+                response = self.cache[key] = json.dumps(self._read(path, query)).encode('utf-8')
+                if len(self.cache) > RESPONSE_CACHE_SIZE:
+                    self.cache.popitem(last=False)
+            else:
+                self.counters['cache_hits'] += 1
+                self.cache.move_to_end(key)
+            return 200, response
+        except HTTPError as error:
+            return error.status, json.dumps({'error': str(error)}).encode('utf-8')
+
+    def _habit(self, name):
+        '''Return the habit with the given name, or raise a 404 error.'''
+        habit = self.habit_list.get(name)
+        if habit is None:
+            raise HTTPError(404, f'Habit {name} not found')
+        return habit
+
+    def _read(self, path, query):
+        '''Build the response to a GET request.'''
+        if path == ['habits']:
+            return [
+                {'name': habit.name, 'description': habit.description, 'start_date': habit.start_date.isoformat(),
+                 'periodicity': habit.periodicity, 'completion_count': len(habit.completions)}
+                for habit in self.habit_list
+            ]
+        if len(path) == 2 and path[0] == 'habits':
+            habit = self._habit(path[1])
+            return {
+                'name': habit.name, 'description': habit.description, 'start_date': habit.start_date.isoformat(),
+                'periodicity': habit.periodicity, 'completion_count': len(habit.completions),
+                'current_streak': streak_calc(habit), 'longest_streak': calculate_longest_streak(habit),
+            }
+        if len(path) == 3 and path[0] == 'habits' and path[2] == 'completions':
+            return self._habit(path[1]).completions.to_strings()
+        if len(path) == 3 and path[0] == 'habits' and path[2] == 'window':
+            habit = self._habit(path[1])
+            try:
+                end = date.fromisoformat(query['end']) if 'end' in query else date.today()
+                start = date.fromisoformat(query['start']) if 'start' in query else end - timedelta(days=29)
+                if start > end:
+                    raise ValueError('The start date must not be after the end date')
+                statistics = windowed_statistics(habit, start, end)
+                if 'period' in query:
+                    statistics['counts'] = dict(completion_counts(habit, start, end, query['period']))
+            except ValueError as error:
+                raise HTTPError(400, str(error))
+            return statistics
+        if len(path) == 3 and path[0] == 'habits' and path[2] == 'heatmap':
+            habit = self._habit(path[1])
+            try:
+                weeks = int(query.get('weeks', 12))
+                if weeks < 1:
+                    raise ValueError('The number of weeks must be at least 1')
+                return completion_heatmap(habit, date.fromisoformat(query['end']) if 'end' in query else None, weeks)
+            except ValueError as error:
+                raise HTTPError(400, str(error))
+        if path == ['analytics', 'report']:
+            try:
+                periods = int(query.get('periods', 8))
+                if periods < 1:
+                    raise ValueError('The number of periods must be at least 1')
+                labels, rows = period_report(self.habit_list, query.get('period', 'week'), periods)
+            except ValueError as error:
+                raise HTTPError(400, str(error))
+            return {'periods': labels, 'habits': rows}
+        if path == ['analytics', 'due']:
+            try:
+                within = int(query.get('within', 0))
+                if within < 0:
+                    raise ValueError('The number of days must not be negative')
+            except ValueError as error:
+                raise HTTPError(400, str(error))
+            return due_habits(self.habit_list, within=within)
+        if path == ['analytics', 'summary']:
+            try:
+                return habit_statistics(self.habit_list, engine=query.get('engine', 'python'))
+            except (ValueError, ImportError) as error:
+                raise HTTPError(400, str(error))
+        if path == ['analytics', 'completion_rates']:
+            return calculate_completion_rates(self.habit_list)
+        if path == ['analytics', 'longest_streak']:
+            if not self.habit_list:
+                raise HTTPError(404, 'No habits found')
+            habit_name, longest_streak = longest_streak_all_habits(self.habit_list)
+            return {'habit_name': habit_name, 'longest_streak': longest_streak}
+        raise HTTPError(404, f'No resource at /{"/".join(path)}')
+
+    async def _complete(self, name, body):
+        '''Queue a completion for the writer task and wait until its batch is saved.'''
+        habit = self._habit(name)
+        try:
+            data = json.loads(body) if body.strip() else {}
+            completion_datetime = data.get('completion_datetime')
+            completion_datetime = datetime.fromisoformat(completion_datetime) if completion_datetime else datetime.now()
+        except (ValueError, TypeError, AttributeError):
+            raise HTTPError(400, 'The body must be a JSON object with an optional ISO formatted "completion_datetime"')
+        if completion_datetime.tzinfo is not None:
+            raise HTTPError(400, 'The "completion_datetime" must be a local time without a UTC offset')
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((habit.name, completion_datetime, future))
+        recorded = await future
+        return {'habit': habit.name, 'completion_datetime': completion_datetime.isoformat(), 'recorded': recorded}
+
+
+def run(file_path, host='127.0.0.1', port=8000):
+    '''
+    Serve the HTTP API for a store until interrupted.
+
+    Args:
+        file_path (str): Path to the habit store to serve.
+        host (str, optional): The address to listen on. Defaults to '127.0.0.1'.
+        port (int, optional): The port to listen on, or 0 for any free port. Defaults to 8000.
+    '''
+    async def serve():
+        server = await HabitServer(file_path).start(host, int(port))
+        address, bound_port = server.sockets[0].getsockname()[:2]
+        print(f'{Fore.GREEN}Serving {Fore.YELLOW}{file_path}{Fore.GREEN} on {Fore.YELLOW}http://{address}:{bound_port}{Style.RESET_ALL}', flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print(f'{Fore.GREEN}Server stopped{Style.RESET_ALL}')
@@ -0,0 +1,117 @@
+import os
+from analytics import streak_calc, calculate_completion_rates, longest_streak_all_habits
+from data_storage import load_info
+
+SHARD_EXTENSIONS = ('.json', '.hbin', '.db', '.sqlite', '.sqlite3') # In order of precedence when a user has several stores
+LEADERBOARD_KEYS = ('completion_rate', 'current_streak', 'longest_streak')
+
+def is_valid_user(user):
+    '''
+    Check that a user name can name a store in a directory of per-user shards.
+
+    Args:
+        user (str): The user name.
+
+    Returns:
+        bool: False if the name is empty or could escape the shards directory.
+    '''
+    return bool(user) and not user.startswith('.') and os.sep not in user and not (os.altsep and os.altsep in user)
+
+
+def shard_path(shards_dir, user):
+    '''
+    Return the path of a user's store in a directory of per-user shards.
+
+    Args:
+        shards_dir (str): The directory holding one store per user.
+        user (str): The user name; the store is named after it.
+
+    Returns:
+        str: Path to the user's existing store, or to a new JSON store if the user has none yet.
+
+    Raises:
+        ValueError: If the user name is empty or could escape the shards directory.
+    '''
+    if not is_valid_user(user):
+        raise ValueError(f'Invalid user name: {user!r}')
+    for extension in SHARD_EXTENSIONS:
+        path = os.path.join(shards_dir, user + extension)
+        if os.path.exists(path):
+            return path
+    return os.path.join(shards_dir, user + '.json')
+
+
+def shard_paths(shards_dir):
+    '''
+    Find the stores in a directory of per-user shards.
+
+    Args:
+        shards_dir (str): The directory holding one store per user.
+
+    Returns:
+        dict: User names mapped to the paths of their stores, sorted by user name.
+    '''
+    shards = {}
+    for file_name in os.listdir(shards_dir):
+        user, extension = os.path.splitext(file_name)
+        if extension.lower() in SHARD_EXTENSIONS and not user.startswith('.'):
+            path = os.path.join(shards_dir, file_name)
+            if user not in shards or SHARD_EXTENSIONS.index(extension.lower()) < SHARD_EXTENSIONS.index(os.path.splitext(shards[user])[1].lower()):
+                shards[user] = path
+    return dict(sorted(shards.items()))
+
+
+def shard_statistics(file_path):
+    '''
+    Compute the leaderboard statistics of one user's store. Runs in a worker process.
+
+    Args:
+        file_path (str): Path to the user's store.
+
+    Returns:
+        dict: The number of habits, the average completion rate, the best current streak and the
+            habit with the longest streak (None if the store has no habits).
+    '''
+    habit_list = load_info(file_path, verbose=False)
+    rates = calculate_completion_rates(habit_list)
+    longest_habit, longest_streak = longest_streak_all_habits(habit_list) if habit_list else (None, 0)
+    return {
+        'habit_count': len(habit_list),
+        'completion_rate': sum(rate['completion_rate'] for rate in rates) / len(rates) if rates else 0,
+        'current_streak': max((streak_calc(habit) for habit in habit_list), default=0),
+        'longest_streak': longest_streak,
+        'longest_streak_habit': longest_habit,
+    }
+
+
+def leaderboard(shards_dir, sort_by='completion_rate', workers=None):
+    '''
+    Rank the users of a directory of shards, computing each shard's statistics in parallel.
+
+    Args:
+        shards_dir (str): The directory holding one store per user.
+        sort_by (str, optional): The statistic users are ranked by: 'completion_rate', 'current_streak'
+            or 'longest_streak'. Defaults to 'completion_rate'.
+        workers (int, optional): Number of worker processes; with 1, the statistics are computed in this process.
+            Defaults to the number of CPUs.
+
+    Returns:
+        list: One dictionary per user with its 'user' name and statistics, best first.
+
+    Raises:
+        ValueError: If sort_by is not a leaderboard statistic.
+    '''
+    if sort_by not in LEADERBOARD_KEYS:
+        raise ValueError(f'Unknown leaderboard statistic {sort_by!r}; expected one of {", ".join(LEADERBOARD_KEYS)}')
+    shards = shard_paths(shards_dir)
+    workers = min(workers or os.cpu_count() or 1, len(shards))
+    if workers <= 1:
+        statistics = list(map(shard_statistics, shards.values()))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            statistics = list(executor.map(shard_statistics, shards.values(), chunksize=max(1, len(shards) // (workers * 4))))
+
+    rows = [{'user': user, **shard} for user, shard in zip(shards, statistics)]
+    rows.sort(key=lambda row: (-row[sort_by], row['user']))
+    return rows
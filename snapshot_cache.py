@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import struct
+from array import array
+from binary_storage import BIG_ENDIAN, LENGTH, SnapshotError, _Reader, _encode_fields, _encode_string
+from habit_manager import Completions, HabitCollection, Rollups
+
+MAGIC = b'HBPC'
+VERSION = 5 # Earlier copies hold streak statistics from before weekly streaks counted ISO weeks, no completion checksums or no renames
+HEADER = struct.Struct('<4sHqq32sI') # Magic, format version, snapshot mtime_ns, snapshot size, SHA-256 of the snapshot, number of habits
+HASH_CHUNK_SIZE = 1024 * 1024
+CHECKSUM = struct.Struct('<I') # Checksum of the completion strings, see Habit.checksum
+
+def snapshot_signature(file_path):
+    '''
+    Return what a parsed copy of a snapshot is checked against: the snapshot's modification time, size and content hash.
+
+    Args:
+        file_path (str): Path to the snapshot.
+
+    Returns:
+        tuple: (mtime_ns, size, SHA-256 digest) of the snapshot.
+    '''
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        status = os.fstat(file.fileno())
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return status.st_mtime_ns, status.st_size, digest.digest()
+
+
+def _encode_array(values):
+    '''Encode an array as its length followed by its items, little-endian.'''
+    if BIG_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return LENGTH.pack(len(values)) + values.tobytes()
+
+
+def _encode_habit(habit):
+    '''
+    Encode one habit record: the fields and statistics of a binary snapshot record, the checksum of the
+    completion strings, the decoded completion timestamps, and the completion counts per day, week and
+    month in their serialized form, which are parsed on first use as when loading the JSON snapshot.
+    '''
+    return b''.join([
+        _encode_fields(habit),
+        CHECKSUM.pack(habit.checksum), # Taken before the completions are decoded below
+        _encode_array(habit.completions.timestamps),
+        _encode_string(json.dumps(habit.rollups.to_dictionary(), separators=(',', ':'))),
+    ])
+
+
+def write_cache(file, signature, habit_list, log_id):
+    '''
+    Write a parsed copy of the habits loaded from a snapshot.
+
+    Completions are decoded before they are written, and, unlike in a binary snapshot, they are not
+    delta-encoded: they are stored as they are held in memory, so reading them back is a single copy.
+    Habits are written with the names they were given on load, and the renames of habits sharing a name
+    are written too, so that loading the copy reports them like loading the snapshot does.
+
+    Args:
+        file (file): The parsed copy, opened for writing in binary mode.
+        signature (tuple): The snapshot's signature, as returned by snapshot_signature.
+        habit_list (HabitCollection): The habits loaded from the snapshot, before the completion log was replayed.
+        log_id (str): Id of the completion log that extends the snapshot, or None.
+    '''
+    file.write(HEADER.pack(MAGIC, VERSION, *signature, len(habit_list)))
+    file.write(_encode_string(log_id or ''))
+    file.write(LENGTH.pack(len(habit_list.renamed)))
+    for name, new_name in habit_list.renamed:
+        file.write(_encode_string(name) + _encode_string(new_name))
+    for habit in habit_list:
+        file.write(_encode_habit(habit))
+
+
+def _read_array(reader, typecode):
+    '''Read an array written by _encode_array.'''
+    (size,) = reader.unpack(LENGTH)
+    values = array(typecode)
+    values.frombytes(reader.bytes(size * values.itemsize))
+    if BIG_ENDIAN:
+        values.byteswap()
+    return values
+
+
+def _read_habit(reader):
+    '''Read one habit record written by _encode_habit.'''
+    habit, statistics = reader.fields()
+    (checksum,) = reader.unpack(CHECKSUM)
+    habit.completions = Completions.from_timestamps(_read_array(reader, 'q'), ordered=True)
+    habit.checksum = checksum
+    habit.statistics = statistics
+    habit.rollups = Rollups.from_dictionary(json.loads(reader.string()))
+    return habit
+
+
+def read_cache(file, signature):
+    '''
+    Read the habits from a parsed copy of a snapshot, if it was written for the snapshot as it is now.
+
+    Args:
+        file (file): The parsed copy, opened for reading in binary mode.
+        signature (tuple): The snapshot's current signature, as returned by snapshot_signature.
+
+    Returns:
+        tuple or None: The loaded HabitCollection and the id of the completion log that extends the snapshot;
+            None if the copy was written for another version of the snapshot, or is not a valid parsed copy.
+    '''
+    buffer = file.read()
+    try:
+        with memoryview(buffer) as view:
+            reader = _Reader(view)
+            magic, version, mtime_ns, size, digest, habit_count = reader.unpack(HEADER)
+            if magic != MAGIC or version != VERSION or (mtime_ns, size, digest) != signature:
+                return None
+            log_id = reader.string() or None
+            (rename_count,) = reader.unpack(LENGTH)
+            renamed = [(reader.string(), reader.string()) for _ in range(rename_count)]
+            habit_list = HabitCollection()
+            for _ in range(habit_count):
+                habit_list.append_loaded(_read_habit(reader))
+            habit_list.renamed.extend(renamed)
+            return habit_list, log_id
+    except (SnapshotError, ValueError): # Truncated or corrupt; it is rewritten from the snapshot
+        return None
@@ -0,0 +1,275 @@
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from habit_manager import Habit, HabitCollection, Completions, Rollups, PERIODS, EPOCH_ORDINAL, MICROSECONDS_PER_DAY, period_index, to_timestamp
+from colorama import Fore, Style
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS habits (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    periodicity TEXT NOT NULL,
+    dedupe INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS habits_by_name ON habits (name);
+CREATE TABLE IF NOT EXISTS completions (
+    habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    completed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS completions_by_habit_seq ON completions (habit_id, seq);
+CREATE INDEX IF NOT EXISTS completions_by_habit_time ON completions (habit_id, completed_at);
+CREATE TABLE IF NOT EXISTS rollups (
+    habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+    period TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (habit_id, period, bucket)
+) WITHOUT ROWID;
+'''
+
+def connect(db_path):
+    '''
+    Open a SQLite habit store, creating its tables and indexes if needed.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+
+    Returns:
+        sqlite3.Connection: An open connection to the store.
+    '''
+    connection = sqlite3.connect(db_path)
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.executescript(SCHEMA)
+    if 'dedupe' not in {column for _, column, *_ in connection.execute('PRAGMA table_info(habits)')}: # Stores created before the column existed
+        connection.execute('ALTER TABLE habits ADD COLUMN dedupe INTEGER NOT NULL DEFAULT 0')
+    return connection
+
+
+@contextmanager
+def open_store(db_path):
+    '''
+    Open a SQLite habit store for the duration of a single transaction.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+
+    Yields:
+        sqlite3.Connection: An open connection, committed on success and closed afterwards.
+    '''
+    connection = connect(db_path)
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def _habit_from_row(row):
+    '''Create a Habit object, without completions, from a (name, description, start_date, periodicity, dedupe) row.'''
+    name, description, start_date, periodicity, dedupe = row
+    return Habit(name, description, datetime.fromisoformat(start_date), periodicity, bool(dedupe))
+
+
+def _completion_rows(connection, habit_id):
+    '''Return the completions of a habit, which are put in chronological order when decoded.'''
+    rows = connection.execute('SELECT completed_at FROM completions WHERE habit_id = ? ORDER BY seq', (habit_id,))
+    return Completions.from_strings(completed_at for (completed_at,) in rows)
+
+
+def _rollups_from_rows(rows):
+    '''Create Rollups from (period, bucket, count) rows, where buckets are numbered by period_index.'''
+    buckets = {period: {} for period in PERIODS}
+    for period, bucket, count in rows:
+        if period in buckets:
+            buckets[period][bucket] = count
+    return Rollups.from_buckets(buckets)
+
+
+def _rollup_rows(habit_id, rollups):
+    '''Return the (habit_id, period, bucket, count) rows of the periods with completions.'''
+    for period in PERIODS:
+        start, counts = rollups.counts(period)
+        for offset, count in enumerate(counts):
+            if count:
+                yield habit_id, period, start + offset, count
+
+
+def load_info(db_path, verbose=True):
+    '''
+    Load all habits and their completions from a SQLite store.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        verbose (bool, optional): Whether to print status messages. Errors are always printed. Defaults to True.
+
+    Returns:
+        HabitCollection: The loaded habits, indexed by name and periodicity.
+    '''
+    if verbose:
+        print(f'{Fore.YELLOW}{Style.BRIGHT}Loading data from database: {db_path}{Style.RESET_ALL}')
+
+    try:
+        with open_store(db_path) as connection:
+            habit_list = []
+            completion_strings = {}
+            for habit_id, *row in connection.execute('SELECT id, name, description, start_date, periodicity, dedupe FROM habits ORDER BY id'):
+                habit_list.append(_habit_from_row(row))
+                completion_strings[habit_id] = []
+            for habit_id, completed_at in connection.execute('SELECT habit_id, completed_at FROM completions ORDER BY habit_id, seq'):
+                completion_strings[habit_id].append(completed_at)
+            rollup_rows = {habit_id: [] for habit_id in completion_strings}
+            for habit_id, *row in connection.execute('SELECT habit_id, period, bucket, count FROM rollups ORDER BY habit_id'):
+                rollup_rows[habit_id].append(row)
+            for habit, strings, rows in zip(habit_list, completion_strings.values(), rollup_rows.values()):
+                habit.completions = Completions.from_strings(strings) # Decoded on first access, like completions loaded from JSON
+                habit.rollups = _rollups_from_rows(rows) # Checked against the completions before use
+
+            if verbose:
+                print(f'{Fore.GREEN}Data loaded successfully{Style.RESET_ALL}')
+            return HabitCollection(habit_list)
+    except sqlite3.Error:
+        print(f'{Fore.RED}Error: {Style.RESET_ALL} Failed to read the database.')
+        return HabitCollection()
+
+
+def load_habit(db_path, name):
+    '''
+    Load a single habit and its completions using the name index.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        name (str): The name of the habit to retrieve.
+
+    Returns:
+        Habit or None: The Habit instance with the matching name, if it exists; None otherwise.
+    '''
+    with open_store(db_path) as connection:
+        row = connection.execute('SELECT id, name, description, start_date, periodicity, dedupe FROM habits WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        habit = _habit_from_row(row[1:])
+        habit.completions = _completion_rows(connection, row[0])
+        habit.rollups = _rollups_from_rows(connection.execute('SELECT period, bucket, count FROM rollups WHERE habit_id = ?', (row[0],)))
+        return habit
+
+
+def load_summaries(db_path):
+    '''
+    Load all habits without their completions, along with their completion counts.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+
+    Returns:
+        tuple: List of Habit objects with empty completions, a dictionary mapping habit names to completion counts,
+            and a dictionary mapping the names of weekly habits to the ISO weeks (see period_index) they were completed in.
+    '''
+    with open_store(db_path) as connection:
+        rows = connection.execute(
+            'SELECT habits.name, habits.description, habits.start_date, habits.periodicity, habits.dedupe, '
+            '(SELECT COUNT(*) FROM completions WHERE completions.habit_id = habits.id) '
+            'FROM habits ORDER BY habits.id'
+        ).fetchall()
+        week_rows = connection.execute(
+            "SELECT habits.name, rollups.bucket FROM rollups JOIN habits ON habits.id = rollups.habit_id "
+            "WHERE habits.periodicity = 'weekly' AND rollups.period = 'week' AND rollups.count > 0 ORDER BY rollups.habit_id, rollups.bucket"
+        ).fetchall()
+    habit_list = [_habit_from_row(row[:5]) for row in rows]
+    completion_counts = {row[0]: row[5] for row in rows}
+    weeks = {}
+    for name, week in week_rows:
+        weeks.setdefault(name, []).append(week)
+    return habit_list, completion_counts, weeks
+
+
+def save_info(habit_list, db_path, verbose=True):
+    '''
+    Replace the contents of a SQLite store with the given habits in a single transaction.
+
+    Args:
+        habit_list (list): List of Habit objects.
+        db_path (str): Path to the SQLite database file.
+        verbose (bool, optional): Whether to print status messages. Errors are always printed. Defaults to True.
+
+    Returns:
+        bool: True if the data was saved.
+    '''
+    if verbose:
+        print(f'{Fore.GREEN}Saving data to database: {db_path}{Style.RESET_ALL}')
+
+    try:
+        with open_store(db_path) as connection:
+            connection.execute('DELETE FROM rollups')
+            connection.execute('DELETE FROM completions')
+            connection.execute('DELETE FROM habits')
+            for habit_id, habit in enumerate(habit_list, start=1):
+                connection.execute(
+                    'INSERT INTO habits (id, name, description, start_date, periodicity, dedupe) VALUES (?, ?, ?, ?, ?, ?)',
+                    (habit_id, habit.name, habit.description, habit.start_date.isoformat(), habit.periodicity, int(habit.dedupe)),
+                )
+                connection.executemany(
+                    'INSERT INTO completions (habit_id, seq, completed_at) VALUES (?, ?, ?)',
+                    ((habit_id, seq, completion) for seq, completion in enumerate(habit.completions.to_strings())),
+                )
+                connection.executemany(
+                    'INSERT INTO rollups (habit_id, period, bucket, count) VALUES (?, ?, ?, ?)',
+                    _rollup_rows(habit_id, habit.rollups),
+                )
+
+        if verbose:
+            print(f'{Fore.GREEN}Data saved successfully{Style.RESET_ALL}')
+        return True
+    except sqlite3.Error:
+        print(f'{Fore.RED}Error: {Style.RESET_ALL} Failed to save data.')
+        return False
+
+
+def append_completion(habit_name, completion_datetime, db_path):
+    '''
+    Persist a single completion by inserting one row.
+
+    Args:
+        habit_name (str): The name of the completed habit.
+        completion_datetime (datetime): The completion date and time.
+        db_path (str): Path to the SQLite database file.
+
+    Returns:
+        bool: True if the completion was saved.
+    '''
+    return append_completions([(habit_name, completion_datetime)], db_path)
+
+
+def append_completions(completions, db_path):
+    '''
+    Persist a batch of completions and update their rollups in a single transaction.
+
+    Args:
+        completions (list): (habit name, completion datetime) tuples, in the order they were recorded.
+        db_path (str): Path to the SQLite database file.
+
+    Returns:
+        bool: True if the completions were saved.
+    '''
+    try:
+        with open_store(db_path) as connection:
+            connection.executemany(
+                'INSERT INTO completions (habit_id, seq, completed_at) '
+                'SELECT id, (SELECT COALESCE(MAX(seq), -1) + 1 FROM completions WHERE habit_id = habits.id), ? '
+                'FROM habits WHERE name = ?',
+                ((completion_datetime.isoformat(), habit_name) for habit_name, completion_datetime in completions),
+            )
+            connection.executemany(
+                'INSERT INTO rollups (habit_id, period, bucket, count) SELECT id, ?, ?, 1 FROM habits WHERE name = ? '
+                'ON CONFLICT (habit_id, period, bucket) DO UPDATE SET count = count + 1',
+                (
+                    (period, period_index(EPOCH_ORDINAL + to_timestamp(completion_datetime) // MICROSECONDS_PER_DAY, period), habit_name)
+                    for habit_name, completion_datetime in completions for period in PERIODS
+                ),
+            )
+        return True
+    except sqlite3.Error:
+        print(f'{Fore.RED}Error: {Style.RESET_ALL} Failed to save data.')
+        return False
@@ -1,10 +1,35 @@
+import asyncio
+import filecmp
+import io
+import json
+import multiprocessing
+import pstats
+import os
+import random
 import pytest
 import shutil
-from datetime import datetime
+import sqlite3
+import sys
+import threading
+from datetime import date, datetime, timedelta
 from unittest.mock import patch
 from colorama import Fore, Style
-from main import HabitTrackerCLI
-from habit_manager import get_habit_by_name
+import main
+from main import HabitTrackerCLI, parse_command_line
+from benchmark import generate_store
+from habit_manager import Habit, HabitCollection, add_change_hook, delete_habit, edit_habit, get_habit_by_name
+from data_storage import load_info, save_info, log_path, read_json_snapshot
+import data_storage
+import binary_storage
+import directory_storage
+import server
+from daemon import HabitDaemon
+from server import HabitServer
+import shards
+import analytics
+import habit_manager
+import profiling
+from analytics import calculate_longest_streak, habit_statistics, habits_filter, streak_calc
 
 # Constants
 TEST_HABIT_NAME = "test habit"
@@ -31,8 +56,11 @@ class TestHabitTracker:
         yield
         self.habit_tracker.habit_list.clear()
 
-        # Restore the original habits.json file
+        # Restore the original habits.json file and discard the completion log written by the tests
         shutil.move("habits_original.json", "habits.json")
+        for path in (log_path("habits.json"), "habits.json.lock"):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_create_habit(self):
         self.habit_tracker.create(TEST_HABIT_NAME, TEST_DESCRIPTION, TEST_START_DATE, TEST_PERIODICITY_DAILY)
@@ -134,4 +162,1391 @@ class TestHabitTracker:
         )
         habit = get_habit_by_name(self.habit_tracker.habit_list, TEST_HABIT_NAME)
         assert habit.name == TEST_HABIT_NAME, "Habit name was edited to an empty string."
-        assert habit.description == TEST_DESCRIPTION, "Habit description was edited to an empty string."
\ No newline at end of file
+        assert habit.description == TEST_DESCRIPTION, "Habit description was edited to an empty string."
+
+class TestCompletionLog:
+    @pytest.fixture(autouse=True)
+    def setup_store(self, tmp_path):
+        self.file_path = str(tmp_path / "habits.json")
+        self.habit_tracker = HabitTrackerCLI(self.file_path)
+        self.habit_tracker.create(TEST_HABIT_NAME, TEST_DESCRIPTION, TEST_START_DATE, TEST_PERIODICITY_DAILY)
+
+    def test_complete_appends_without_rewriting_snapshot(self):
+        with open(self.file_path) as file:
+            snapshot = file.read()
+        self.habit_tracker.complete(TEST_HABIT_NAME, "2023-05-01T10:00:00")
+        with open(self.file_path) as file:
+            assert file.read() == snapshot, "Snapshot was rewritten on complete."
+        habit = get_habit_by_name(load_info(self.file_path), TEST_HABIT_NAME)
+        assert habit.completions == [datetime(2023, 5, 1, 10)], "Logged completion was not replayed."
+
+    def test_save_discards_replayed_log(self):
+        self.habit_tracker.complete(TEST_HABIT_NAME, "2023-05-01T10:00:00")
+        save_info(load_info(self.file_path), self.file_path)
+        habit = get_habit_by_name(load_info(self.file_path), TEST_HABIT_NAME)
+        assert len(habit.completions) == 1, "Logged completion was replayed twice."
+
+    def test_stale_log_is_ignored(self):
+        self.habit_tracker.complete(TEST_HABIT_NAME, "2023-05-01T10:00:00")
+        with open(log_path(self.file_path)) as file:
+            stale_log = file.read()
+        save_info(load_info(self.file_path), self.file_path)
+        with open(log_path(self.file_path), "w") as file: # Simulate a crash between snapshot write and log reset
+            file.write(stale_log)
+        habit = get_habit_by_name(load_info(self.file_path), TEST_HABIT_NAME)
+        assert len(habit.completions) == 1, "Stale log was replayed on top of a newer snapshot."
+
+    def test_torn_record_is_skipped(self):
+        self.habit_tracker.complete(TEST_HABIT_NAME, "2023-05-01T10:00:00")
+        with open(log_path(self.file_path), "a") as file:
+            file.write('{"habit":"test ha')
+        habit = get_habit_by_name(load_info(self.file_path), TEST_HABIT_NAME)
+        assert len(habit.completions) == 1, "Torn log record was not skipped."
+
+    def test_log_compaction(self, monkeypatch):
+        monkeypatch.setattr(data_storage, "COMPACTION_THRESHOLD", 200)
+        for day in range(1, 11):
+            self.habit_tracker.complete(TEST_HABIT_NAME, f"2023-05-{day:02d}T10:00:00")
+        assert os.path.getsize(log_path(self.file_path)) < 200, "Completion log was not compacted."
+        habit = get_habit_by_name(load_info(self.file_path), TEST_HABIT_NAME)
+        assert len(habit.completions) == 10, "Completions were lost during compaction."
+
+
+class TestSQLiteStorage:
+    @pytest.fixture(autouse=True)
+    def setup_store(self, tmp_path):
+        self.json_path = str(tmp_path / "habits.json")
+        self.db_path = str(tmp_path / "habits.db")
+        shutil.copyfile("habits.json", self.json_path)
+
+    def test_export_round_trip_is_lossless(self, tmp_path):
+        HabitTrackerCLI(self.json_path).export(f"sqlite:///{self.db_path}")
+        exported_path = str(tmp_path / "exported.json")
+        HabitTrackerCLI(self.db_path).export(exported_path)
+        original = [habit.to_dictionary() for habit in load_info(self.json_path)]
+        assert [habit.to_dictionary() for habit in load_info(exported_path)] == original, "JSON/SQLite round trip lost data."
+
+    def test_streak_reads_single_habit(self):
+        HabitTrackerCLI(self.json_path).export(self.db_path)
+        habit_tracker = HabitTrackerCLI(self.db_path)
+        expected = HabitTrackerCLI(self.json_path).streak("Read")
+        assert habit_tracker.streak("Read") == expected, "SQLite streak differs from JSON streak."
+        assert habit_tracker._habit_list is None, "Streak loaded the whole SQLite store."
+
+    def test_complete_and_completion_rates(self):
+        HabitTrackerCLI(self.json_path).export(self.db_path)
+        for file_path in (self.json_path, self.db_path):
+            HabitTrackerCLI(file_path).complete("Yoga", "2023-08-01T07:00:00")
+        habit_tracker = HabitTrackerCLI(self.db_path)
+        assert habit_tracker.completion_rates() == HabitTrackerCLI(self.json_path).completion_rates(), "SQLite completion rates differ from JSON."
+        assert habit_tracker._habit_list is None, "Completion rates loaded the whole SQLite store."
+
+
+class TestLazyCompletions:
+    def test_listing_does_not_decode_completions(self):
+        habit_tracker = HabitTrackerCLI()
+        habit_tracker.all_habits()
+        habit_tracker.filter(TEST_PERIODICITY_DAILY)
+        assert not any(habit.completions.is_decoded for habit in habit_tracker.habit_list), "Listing decoded completions."
+
+    def test_undecoded_completions_round_trip(self):
+        habit = get_habit_by_name(load_info("habits.json"), "Read")
+        habit.complete_habit(datetime(2023, 8, 1, 7, 30))
+        assert len(habit.completions) == 33, "Appending to undecoded completions failed."
+        assert not habit.completions.is_decoded, "Appending decoded completions."
+        strings = habit.to_dictionary()["completions"]
+        assert strings[-1] == "2023-08-01T07:30:00", "Appended completion was not serialized."
+        assert [completion.isoformat() for completion in habit.completions] == strings, "Decoded completions differ from their strings."
+
+
+class TestCompactCompletions:
+    def test_completions_round_trip_through_timestamps(self):
+        completions = [datetime(2023, 6, 22, 16, 28, 38, 672399), datetime(1969, 12, 31, 23, 59), datetime(2023, 6, 23)]
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2022, 1, 1), TEST_PERIODICITY_DAILY)
+        habit.completions = completions
+        completions.sort() # Completions are kept in chronological order
+        assert habit.completions == completions, "Completions changed when stored as timestamps."
+        assert habit.completions.timestamps.itemsize == 8, "Completions are not stored as 64-bit integers."
+        assert habit.completions.day_ordinals() == [completion.toordinal() for completion in completions], "Incorrect day ordinals."
+        assert Habit.from_dictionary(habit.to_dictionary()).completions == completions, "Completions changed in serialization."
+
+    def test_habit_has_no_instance_dictionary(self):
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2022, 1, 1), TEST_PERIODICITY_DAILY)
+        with pytest.raises(AttributeError):
+            habit.unknown_attribute = None
+
+
+class TestAnalyticsEngines:
+    @pytest.fixture(autouse=True)
+    def require_numpy(self):
+        pytest.importorskip("numpy")
+
+    def test_engines_agree_on_stored_habits(self):
+        habit_list = load_info("habits.json")
+        assert habit_statistics(habit_list, engine="numpy") == habit_statistics(habit_list), "Analytics engines disagree."
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_engines_agree_on_random_habits(self, seed):
+        rng = random.Random(seed)
+        today = datetime.now()
+        habit_list = []
+        for index in range(rng.randint(0, 8)):
+            start_date = today - timedelta(days=rng.randint(0, 90))
+            habit = Habit(f"habit {index}", TEST_DESCRIPTION, start_date, rng.choice([TEST_PERIODICITY_DAILY, TEST_PERIODICITY_WEEKLY, INVALID_PERIODICITY]))
+            habit.completions = [start_date + timedelta(days=rng.randint(0, 90), hours=rng.randint(0, 23)) for _ in range(rng.randint(0, 40))]
+            if rng.random() < 0.5:
+                habit.completions = sorted(habit.completions)
+            habit_list.append(habit)
+        assert habit_statistics(habit_list, engine="numpy") == habit_statistics(habit_list), "Analytics engines disagree."
+
+    def test_unknown_engine(self):
+        with pytest.raises(ValueError):
+            habit_statistics([], engine="fortran")
+
+
+class TestIncrementalStreaks:
+    def test_streaks_are_served_from_persisted_statistics(self, tmp_path):
+        file_path = str(tmp_path / "habits.json")
+        save_info(load_info("habits.json"), file_path)
+        habit = get_habit_by_name(load_info(file_path), "Read")
+        assert calculate_longest_streak(habit) == 32, "Incorrect longest streak."
+        assert streak_calc(habit) == 0, "Incorrect current streak."
+        assert not habit.completions.is_decoded, "Streaks were recomputed from completions."
+
+    def test_complete_updates_streaks(self):
+        today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, today - timedelta(days=10), TEST_PERIODICITY_DAILY)
+        for days_ago in (5, 4, 2, 1, 0):
+            habit.complete_habit(today - timedelta(days=days_ago))
+        assert (streak_calc(habit), calculate_longest_streak(habit)) == (3, 3), "Streaks were not updated on complete."
+
+    def test_backfilled_completion_recomputes_streaks(self):
+        today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, today - timedelta(days=10), TEST_PERIODICITY_DAILY)
+        for days_ago in (5, 4, 2, 1):
+            habit.complete_habit(today - timedelta(days=days_ago))
+        habit.complete_habit(today - timedelta(days=3))
+        assert calculate_longest_streak(habit) == 5, "Backfilled completion did not extend the longest streak."
+        recomputed = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, habit.start_date, TEST_PERIODICITY_DAILY)
+        recomputed.completions = list(habit.completions)
+        assert habit.statistics == recomputed.statistics, "Incremental statistics differ from a full recomputation."
+
+    def test_periodicity_change_recomputes_streaks(self):
+        habit = get_habit_by_name(load_info("habits.json"), "Read")
+        assert calculate_longest_streak(habit) == 32, "Incorrect daily longest streak."
+        edit_habit(habit, periodicity=TEST_PERIODICITY_WEEKLY)
+        assert calculate_longest_streak(habit) == 5, "Longest streak was not recomputed for the new periodicity."
+
+    def test_weekly_streaks_and_rates_count_iso_weeks(self):
+        today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        monday = today - timedelta(days=today.weekday())
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, monday - timedelta(weeks=3), TEST_PERIODICITY_WEEKLY)
+        for completion in (monday - timedelta(weeks=3), monday - timedelta(weeks=3, days=-1), monday - timedelta(weeks=2, days=-2), monday - timedelta(days=1)):
+            habit.complete_habit(completion) # Two in the first week, then Wednesday of the next week and Sunday of the week before this one
+        assert calculate_longest_streak(habit) == 3, "Consecutive ISO weeks were not counted as a streak."
+        assert analytics.completion_rate(habit, len(habit.completions)) == 75, "Weekly completion rate did not count ISO weeks."
+        assert habit_statistics([habit], engine="numpy") == habit_statistics([habit]), "Analytics engines disagree."
+
+    def test_weekly_current_streak_spans_a_week_boundary(self):
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2024, 1, 1), TEST_PERIODICITY_WEEKLY)
+        habit.complete_habit(datetime(2024, 1, 1, 8)) # Monday of 2024-W01
+        habit.complete_habit(datetime(2024, 1, 14, 20)) # Sunday of 2024-W02, 13 days later
+        assert habit.longest_streak() == 2 and habit.current_streak(date(2024, 1, 15)) == 2, "Consecutive ISO weeks did not form one streak."
+        assert habit.due_ordinal() == date(2024, 1, 21).toordinal(), "Weekly habit was not due by the end of the next ISO week."
+        assert habit.current_streak(date(2024, 1, 21)) == 2 and habit.current_streak(date(2024, 1, 22)) == 0, "Streak did not end after a week without completions."
+        assert analytics.windowed_statistics(habit, date(2024, 1, 1), date(2024, 1, 15))["current_streak"] == 2, "Windowed current streak differs."
+
+    def test_statistics_of_older_formats_are_recomputed(self, tmp_path):
+        habit = get_habit_by_name(load_info("habits.json"), "Read")
+        edit_habit(habit, periodicity=TEST_PERIODICITY_WEEKLY)
+        habit_dict = habit.to_dictionary()
+        del habit_dict["statistics"]["format"]
+        habit_dict["statistics"]["longest_streak"] = 1
+        assert Habit.from_dictionary(habit_dict).longest_streak() == 5, "Statistics of an older format were trusted."
+
+    def test_statistics_of_edited_completions_are_recomputed(self):
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2024, 1, 1), TEST_PERIODICITY_DAILY)
+        for day in (1, 2, 3):
+            habit.complete_habit(datetime(2024, 1, day, 8))
+        habit_dict = habit.to_dictionary()
+        habit_dict["completions"][-1] = "2024-02-03T08:00:00" # Edited by hand, same completion count
+        loaded = Habit.from_dictionary(habit_dict)
+        assert loaded.longest_streak() == 2, "Statistics of edited completions were trusted."
+        assert loaded.rollups.count("month", habit_manager.period_index(date(2024, 2, 1).toordinal(), "month")) == 1, "Rollups of edited completions were trusted."
+        assert Habit.from_dictionary(habit.to_dictionary()).statistics == habit.statistics, "Statistics of unchanged completions were not restored."
+
+
+class TestHabitCollection:
+    @pytest.fixture(autouse=True)
+    def setup_collection(self):
+        self.habit_list = load_info("habits.json")
+
+    def test_rename_updates_name_index(self):
+        habit = get_habit_by_name(self.habit_list, "Yoga")
+        edit_habit(habit, name=NEW_HABIT_NAME, habit_list=self.habit_list)
+        assert get_habit_by_name(self.habit_list, NEW_HABIT_NAME) is habit, "Renamed habit was not indexed."
+        assert get_habit_by_name(self.habit_list, "Yoga") is None, "Old name is still indexed."
+        assert [habit.name for habit in self.habit_list][:2] == ["Read", NEW_HABIT_NAME], "Rename changed the habit order."
+
+    def test_rename_collision_leaves_habit_unchanged(self):
+        habit = get_habit_by_name(self.habit_list, "Yoga")
+        with pytest.raises(ValueError):
+            edit_habit(habit, name="Read", description=NEW_DESCRIPTION, habit_list=self.habit_list)
+        assert habit.name == "Yoga" and habit.description != NEW_DESCRIPTION, "Habit was changed despite the name collision."
+        assert get_habit_by_name(self.habit_list, "Yoga") is habit, "Name index changed despite the name collision."
+        assert get_habit_by_name(self.habit_list, "Read").name == "Read", "Colliding habit was replaced."
+
+    def test_cli_rename_collision(self, capsys, tmp_path):
+        file_path = str(tmp_path / "habits.json")
+        shutil.copyfile("habits.json", file_path)
+        HabitTrackerCLI(file_path).edit("Yoga", name="Read")
+        assert "already exists" in capsys.readouterr().out, "Rename collision was not reported."
+        assert get_habit_by_name(load_info(file_path), "Yoga") is not None, "Habit was renamed despite the collision."
+
+    def test_periodicity_index_follows_edits_in_order(self):
+        edit_habit(get_habit_by_name(self.habit_list, "Meditation"), periodicity=TEST_PERIODICITY_WEEKLY, habit_list=self.habit_list)
+        expected = [habit for habit in self.habit_list if habit.periodicity == TEST_PERIODICITY_WEEKLY]
+        assert habits_filter(self.habit_list, TEST_PERIODICITY_WEEKLY) == expected, "Periodicity index is out of order."
+        assert "Meditation" not in [habit.name for habit in habits_filter(self.habit_list, TEST_PERIODICITY_DAILY)], "Old periodicity is still indexed."
+
+    def test_remove_and_duplicate_names(self):
+        habit = get_habit_by_name(self.habit_list, "Read")
+        delete_habit(self.habit_list, habit)
+        assert get_habit_by_name(self.habit_list, "Read") is None and len(self.habit_list) == 6, "Habit was not removed."
+        self.habit_list.append(habit)
+        with pytest.raises(ValueError):
+            self.habit_list.append(Habit("Read", TEST_DESCRIPTION, datetime(2022, 1, 1), TEST_PERIODICITY_DAILY))
+
+    @pytest.mark.parametrize("file_name", ["habits.json", "habits.hbin"])
+    def test_duplicate_names_are_renamed_on_load(self, tmp_path, capsys, file_name):
+        file_path = str(tmp_path / file_name)
+        duplicate = Habit("Read", NEW_DESCRIPTION, datetime(2022, 1, 1), TEST_PERIODICITY_WEEKLY)
+        duplicate.complete_habit(datetime(2022, 1, 3, 9))
+        save_info(list(self.habit_list) + [duplicate], file_path)
+        capsys.readouterr()
+        habit_list = load_info(file_path, verbose=False)
+        assert "Several habits are named Read" in capsys.readouterr().out, "Duplicate name was not reported."
+        assert get_habit_by_name(habit_list, "Read").description == get_habit_by_name(self.habit_list, "Read").description, "The first habit lost its name."
+        renamed = get_habit_by_name(habit_list, "Read (2)")
+        assert renamed is not None and renamed.description == NEW_DESCRIPTION and len(renamed.completions) == 1, "Duplicate habit was not kept under a new name."
+        assert len(habit_list) == len(self.habit_list) + 1, "Habits were lost."
+        save_info(habit_list, file_path)
+        assert [habit.name for habit in load_info(file_path, verbose=False)][-1] == "Read (2)", "New name was not saved."
+
+
+class TestBulkOperations:
+    @pytest.fixture(autouse=True)
+    def setup_store(self, tmp_path, monkeypatch):
+        self.file_path = str(tmp_path / "habits.json")
+        shutil.copyfile("habits.json", self.file_path)
+        self.habit_tracker = HabitTrackerCLI(self.file_path)
+        self.saves = []
+        monkeypatch.setattr(main, "save_info", lambda habit_list, file_path, **kwargs: self.saves.append(file_path) or save_info(habit_list, file_path, **kwargs))
+
+    def test_delete_many_saves_once(self):
+        self.habit_tracker.delete("Read", "Yoga", "Reflection")
+        assert len(self.saves) == 1, "Store was saved more than once."
+        assert len(load_info(self.file_path)) == 4, "Habits were not deleted."
+
+    def test_delete_many_is_all_or_nothing(self):
+        with pytest.raises(ValueError):
+            self.habit_tracker.delete("Read", TEST_HABIT_NAME)
+        assert get_habit_by_name(self.habit_tracker.habit_list, "Read") is not None, "Habit was deleted despite the error."
+        assert not self.saves, "Store was saved despite the error."
+
+    def test_complete_many_saves_once(self, tmp_path):
+        source = tmp_path / "completions.csv"
+        source.write_text("# habit,completion\nRead,2023-08-01T07:00:00\n\n\"Meal Planning & Prep\",2023-08-02T18:00:00\nRead,2023-08-02T07:00:00\n")
+        assert self.habit_tracker.complete_many(str(source)) == 3, "Completions were not recorded."
+        assert len(self.saves) == 1, "Store was saved more than once."
+        habit = get_habit_by_name(load_info(self.file_path), "Read")
+        assert habit.completions[-2:] == [datetime(2023, 8, 1, 7), datetime(2023, 8, 2, 7)], "Completions were not saved."
+
+    def test_complete_many_rejects_invalid_input(self, tmp_path):
+        source = tmp_path / "completions.csv"
+        source.write_text(f"Read,2023-08-01T07:00:00\n{TEST_HABIT_NAME},2023-08-02T07:00:00\n")
+        assert self.habit_tracker.complete_many(str(source)) is None, "Unknown habit was accepted."
+        source.write_text("Read,yesterday\n")
+        assert self.habit_tracker.complete_many(str(source)) is None, "Invalid datetime was accepted."
+        source.write_text("Read,2023-08-01T07:00:00+02:00\n")
+        assert self.habit_tracker.complete_many(str(source)) is None, "Datetime with a UTC offset was accepted."
+        self.habit_tracker.complete("Read", "2023-08-01T07:00:00Z")
+        assert len(get_habit_by_name(self.habit_tracker.habit_list, "Read").completions) == 32, "Completions were recorded despite the error."
+        assert not self.saves, "Store was saved despite the error."
+
+    def test_import_habits_is_idempotent(self, tmp_path):
+        source = str(tmp_path / "import.json")
+        imported = load_info("habits.json")
+        get_habit_by_name(imported, "Read").complete_habit(datetime(2023, 8, 1, 7))
+        imported.append(Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2022, 1, 1), TEST_PERIODICITY_DAILY))
+        save_info(imported, source)
+        assert self.habit_tracker.import_habits(source) == 1, "New habit was not imported."
+        assert HabitTrackerCLI(self.file_path).import_habits(source) == 0, "Habit was imported twice."
+        habit_list = load_info(self.file_path)
+        assert len(habit_list) == 8 and len(get_habit_by_name(habit_list, "Read").completions) == 33, "Completions were not merged exactly once."
+
+    def run_batch(self, tmp_path, capsys, script):
+        source = tmp_path / "script.txt"
+        source.write_text(script)
+        capsys.readouterr()
+        self.habit_tracker.batch(str(source))
+        return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    def test_batch_saves_once(self, tmp_path, capsys):
+        records = self.run_batch(tmp_path, capsys, (
+            f'# Setup\ncreate "{TEST_HABIT_NAME}" "{TEST_DESCRIPTION}" {TEST_START_DATE} {TEST_PERIODICITY_DAILY}\n\n'
+            f'{{"command": "complete", "args": ["{TEST_HABIT_NAME}"], "kwargs": {{"completion_datetime": "2023-08-01T07:00:00"}}}}\n'
+            'edit Read --description "Read every day"\n'
+            f'streak "{TEST_HABIT_NAME}"\n'
+            'delete Yoga Reflection\n'
+        ))
+        assert [record["line"] for record in records] == [2, 4, 5, 6, 7, None], "Incorrect records."
+        assert not any(record["error"] for record in records), "A command failed."
+        assert records[3]["result"] == f"Current streak for {TEST_HABIT_NAME}: 0", "Commands did not see earlier changes."
+        assert "\x1b" not in records[0]["output"], "Output was not stripped of colors."
+        assert len(self.saves) == 1 and records[-1]["result"] == {"saved": True, "completions_appended": 0}, "Store was not saved once."
+        habit_list = load_info(self.file_path)
+        assert len(habit_list) == 6 and get_habit_by_name(habit_list, TEST_HABIT_NAME).completions == [datetime(2023, 8, 1, 7)], "Changes were not saved."
+        assert get_habit_by_name(habit_list, "Read").description == "Read every day", "Edit was not saved."
+
+    def test_batch_checkpoints_and_errors(self, tmp_path, capsys):
+        records = self.run_batch(tmp_path, capsys, (
+            'complete Read --completion_datetime 2023-08-01T07:00:00\n'
+            'checkpoint\n'
+            'complete Read --completion_datetime=2023-08-02T07:00:00\n'
+            f'edit "{TEST_HABIT_NAME}"\n'
+            '--file_path other.json all_habits\n'
+            'serve\n'
+            '{"command": "streak", "args": "Read"}\n'
+            'nonexistent\n'
+        ))
+        assert records[1]["result"] == {"saved": False, "completions_appended": 1}, "Checkpoint did not append the completion."
+        assert [bool(record["error"]) for record in records[3:-1]] == [True] * 5 and records[-1]["errors"] == 5, "Errors were not reported."
+        assert records[-1]["result"] == {"saved": False, "completions_appended": 1}, "Final checkpoint did not append the completion."
+        assert not self.saves, "Store was rewritten for completions only."
+        assert load_info(self.file_path)[0].completions[-2:] == [datetime(2023, 8, 1, 7), datetime(2023, 8, 2, 7)], "Completions were not saved."
+        assert self.habit_tracker._pending is None, "Batch state was not reset."
+
+    def test_batch_from_stdin_keeps_its_script(self, capsys, monkeypatch):
+        monkeypatch.setattr(sys, "stdin", io.StringIO("complete_many -\ncomplete_many\ncomplete Read --completion_datetime 2023-08-01T07:00:00\n"))
+        capsys.readouterr()
+        self.habit_tracker.batch("-")
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [bool(record["error"]) for record in records] == [True, True, False, False] and records[-1]["errors"] == 2, "Reading standard input was not refused."
+        assert load_info(self.file_path)[0].completions[-1] == datetime(2023, 8, 1, 7), "Rest of the script was not run."
+
+    def test_batch_reports_failed_checkpoints(self, tmp_path, capsys, monkeypatch):
+        appends = []
+        monkeypatch.setattr(main, "append_completions", lambda habit_list, completions, file_path, **kwargs: appends.append(list(completions)) and False)
+        records = self.run_batch(tmp_path, capsys, 'complete Read --completion_datetime 2023-08-01T07:00:00\ncheckpoint\n')
+        assert records[1]["error"] and records[1]["result"] is None, "Failed append was not reported."
+        assert records[-1]["error"] and records[-1]["errors"] == 2, "Failed final checkpoint was not reported."
+        assert len(appends) == 2 and appends[1] == appends[0], "Unsaved completions were not kept for the next checkpoint."
+
+        monkeypatch.setattr(main, "save_info", lambda habit_list, file_path, **kwargs: False)
+        records = self.run_batch(tmp_path, capsys, 'delete Yoga\n')
+        assert records[-1]["error"] and records[-1]["result"] is None, "Failed save was not reported."
+
+
+def create_habits_concurrently(file_path, worker, count):
+    for index in range(count):
+        HabitTrackerCLI(file_path).create(f"worker {worker} habit {index}", TEST_DESCRIPTION, TEST_START_DATE, TEST_PERIODICITY_DAILY)
+
+
+def complete_habit_concurrently(file_path, worker, count):
+    data_storage.COMPACTION_THRESHOLD = 300 # Compact often, so compactions race with appends and creates
+    for index in range(count):
+        HabitTrackerCLI(file_path).complete("Read", f"2024-{worker + 1:02d}-{index + 1:02d}T07:00:00")
+
+
+class TestConcurrentWriters:
+    def test_concurrent_writers_do_not_lose_or_corrupt_data(self, tmp_path):
+        file_path = str(tmp_path / "habits.json")
+        shutil.copyfile("habits.json", file_path)
+        workers = [multiprocessing.Process(target=create_habits_concurrently, args=(file_path, worker, 8)) for worker in range(4)]
+        workers += [multiprocessing.Process(target=complete_habit_concurrently, args=(file_path, worker, 20)) for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=120)
+            assert worker.exitcode == 0, "A concurrent writer failed."
+
+        with open(file_path) as file:
+            json.load(file) # The snapshot is complete, valid JSON
+        habit_list = load_info(file_path)
+        assert len(habit_list) == 7 + 4 * 8, "Habits created concurrently were lost."
+        assert len(get_habit_by_name(habit_list, "Read").completions) == 32 + 4 * 20, "Completions recorded concurrently were lost."
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")], "Temporary files were left behind."
+
+    def test_interrupted_save_keeps_previous_snapshot(self, tmp_path, monkeypatch):
+        file_path = str(tmp_path / "habits.json")
+        shutil.copyfile("habits.json", file_path)
+        habit_list = load_info(file_path)
+        habit_list.append(Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2022, 1, 1), TEST_PERIODICITY_DAILY))
+
+        def interrupted_dump(data, file, **kwargs):
+            file.write('{"habits": [')
+            raise KeyboardInterrupt
+        monkeypatch.setattr(data_storage.json, "dump", interrupted_dump)
+        with pytest.raises(KeyboardInterrupt):
+            save_info(habit_list, file_path)
+        monkeypatch.undo()
+        assert len(load_info(file_path)) == 7, "Interrupted save damaged the snapshot."
+        assert sorted(os.listdir(tmp_path)) == ["habits.json", "habits.json.lock"], "Temporary file was left behind."
+
+
+class TestFastStartup:
+    def test_parse_command_line(self):
+        assert parse_command_line(["--quiet", "complete", "Read", "--completion_datetime", "2023-01-01T12:00:00", "--file_path=x.json"]) == (
+            {"quiet": True, "file_path": "x.json"}, "complete", ["Read"], {"completion_datetime": "2023-01-01T12:00:00"}
+        ), "Command line was parsed incorrectly."
+        assert parse_command_line(["delete", "Read", "Yoga"]) == ({}, "delete", ["Read", "Yoga"], {}), "Varargs were parsed incorrectly."
+
+    @pytest.mark.parametrize("argv", [
+        [], ["--help"], ["streak"], ["streak", "Read", "--"], ["streak", "Read", "extra"],
+        ["edit", "Read", "--bogus", "1"], ["_find_habit", "Read"], ["habit_list"], ["--quiet=maybe", "all_habits"],
+    ])
+    def test_parse_command_line_falls_back_to_fire(self, argv):
+        assert parse_command_line(argv) is None, "Command line should be left to Fire."
+
+    def test_quiet_mode_skips_banner_and_store_messages(self, capsys):
+        main.main(["--quiet", "streak", "Read"])
+        output = capsys.readouterr().out
+        assert "Welcome" not in output and "Loading data" not in output, "Quiet mode printed extra output."
+
+    def test_store_is_loaded_on_first_use(self):
+        habit_tracker = HabitTrackerCLI(quiet=True)
+        assert habit_tracker._habit_list is None, "Store was loaded before a command needed it."
+
+
+class TestStoreGenerator:
+    def test_generated_store_has_requested_shape(self, tmp_path):
+        file_path = str(tmp_path / "habits.json")
+        generate_store(file_path, 1001, habit_count=4, periodicities=("daily", "weekly"), density=0.5, gap_every=10, gap_length=3)
+        habit_list = load_info(file_path, verbose=False)
+        assert len(habit_list) == 4, "Generated store has the wrong number of habits."
+        assert sum(len(habit.completions) for habit in habit_list) == 1001, "Generated store has the wrong number of completions."
+        assert [habit.periodicity for habit in habit_list] == ["daily", "weekly", "daily", "weekly"], "Periodicities were not assigned in turn."
+        for habit in habit_list:
+            assert list(habit.completions) == sorted(habit.completions), "Generated completions are out of order."
+            assert habit.start_date <= habit.completions[0], "Habit starts after its first completion."
+
+    def test_generated_store_is_reproducible(self, tmp_path):
+        first, second = str(tmp_path / "first.json"), str(tmp_path / "second.json")
+        generate_store(first, 500, density=0.7)
+        generate_store(second, 500, density=0.7)
+        assert filecmp.cmp(first, second, shallow=False), "The same seed generated different stores."
+
+
+class TestStreamingLoader:
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 16])
+    def test_stream_matches_json_load(self, tmp_path, chunk_size):
+        file_path = str(tmp_path / "habits.json")
+        generate_store(file_path, 300, habit_count=5, density=0.8)
+        with open(file_path) as file:
+            data = json.load(file)
+        data["log_id"] = "abc"
+        data["version"] = 12345
+        with open(file_path, "w") as file:
+            json.dump(data, file, indent=4)
+
+        with open(file_path) as file:
+            stream = data_storage.HabitStream(file, chunk_size)
+            habits = list(stream)
+        assert habits == data["habits"], "Streamed habits differ from the parsed file."
+        assert stream.metadata == {"log_id": "abc", "version": 12345}, "Top-level values were not collected."
+
+    def test_empty_store(self):
+        assert list(data_storage.HabitStream(io.StringIO('{"habits": []}'))) == [], "Empty habit list was not streamed."
+        assert list(data_storage.HabitStream(io.StringIO('{}'))) == [], "Empty object was not streamed."
+
+    @pytest.mark.parametrize("text", ['{"habits": [{"name": "Read"}', '{"habits": [{"name": "Read"}]', '["habits"]', '{"habits": [1 2]}'])
+    def test_malformed_store_raises(self, text):
+        with pytest.raises(json.JSONDecodeError):
+            list(data_storage.HabitStream(io.StringIO(text), chunk_size=4))
+
+    def test_large_store_is_decoded_while_loading(self, tmp_path, monkeypatch):
+        file_path = str(tmp_path / "habits.json")
+        generate_store(file_path, 100, habit_count=2)
+        assert not any(habit.completions.is_decoded for habit in load_info(file_path, verbose=False)), "Small store was decoded eagerly."
+        monkeypatch.setattr(data_storage, "EAGER_DECODE_THRESHOLD", 0)
+        habit_list = load_info(file_path, verbose=False)
+        assert all(habit.completions.is_decoded for habit in habit_list), "Large store was not decoded while loading."
+        assert sum(len(habit.completions) for habit in habit_list) == 100, "Completions were lost while loading."
+
+
+class TestBinarySnapshot:
+    @pytest.fixture
+    def habit_list(self):
+        read = Habit("Read", "Read a book", datetime(2023, 1, 1), "daily")
+        for completion in ["2023-01-03T21:00:00", "2023-01-01T08:00:00.000123", "2023-01-02T08:30:00"]:
+            read.complete_habit(datetime.fromisoformat(completion))
+        walk = Habit("Walk", "Go for a walk 🚶", datetime(2023, 1, 2, 7, 15), "weekly")
+        walk.complete_habit(datetime(2023, 1, 2, 7, 15))
+        return HabitCollection([read, walk, Habit("Yoga", "", datetime(2023, 2, 1), "daily")])
+
+    @pytest.mark.parametrize("use_mmap", [True, False])
+    def test_round_trip(self, tmp_path, habit_list, use_mmap):
+        file_path = str(tmp_path / "habits.hbin")
+        save_info(habit_list, file_path, verbose=False)
+        with open(file_path, "rb") as file:
+            loaded, _ = binary_storage.read_snapshot(file, use_mmap)
+        assert [habit.to_dictionary() for habit in loaded] == [habit.to_dictionary() for habit in habit_list], "Binary snapshot did not round-trip."
+        assert loaded.get("Read").statistics == habit_list.get("Read").statistics, "Streak statistics were not restored."
+
+    def test_convert_between_formats(self, tmp_path):
+        json_path, binary_path, copy_path = str(tmp_path / "habits.json"), str(tmp_path / "habits.hbin"), str(tmp_path / "copy.json")
+        generate_store(json_path, 2000, habit_count=3, density=0.6, gap_every=7, gap_length=2)
+        original = load_info(json_path, verbose=False)
+        HabitTrackerCLI(json_path, quiet=True).export(binary_path)
+        HabitTrackerCLI(binary_path, quiet=True).export(copy_path)
+        assert [habit.to_dictionary() for habit in load_info(copy_path, verbose=False)] == [habit.to_dictionary() for habit in original], "Conversion through the binary format lost data."
+        assert os.path.getsize(binary_path) < os.path.getsize(json_path) / 5, "Binary snapshot is not compact."
+
+    def test_completion_log_is_replayed(self, tmp_path, habit_list):
+        file_path = str(tmp_path / "habits.hbin")
+        save_info(habit_list, file_path, verbose=False)
+        habit_list.get("Yoga").complete_habit(datetime(2023, 2, 2, 6, 0))
+        data_storage.append_completion(habit_list, "Yoga", datetime(2023, 2, 2, 6, 0), file_path, verbose=False)
+        assert load_info(file_path, verbose=False).get("Yoga").completions == [datetime(2023, 2, 2, 6, 0)], "Logged completion was not replayed."
+
+    @pytest.mark.parametrize("contents", [b"", b"not a snapshot", binary_storage.HEADER.pack(binary_storage.MAGIC, 99, 0), binary_storage.HEADER.pack(binary_storage.MAGIC, 1, 1)])
+    def test_invalid_snapshot(self, tmp_path, capsys, contents):
+        file_path = tmp_path / "habits.hbin"
+        file_path.write_bytes(contents)
+        assert len(load_info(str(file_path), verbose=False)) == 0, "Invalid snapshot was loaded."
+        assert "failed to decode the binary snapshot" in capsys.readouterr().out, "Invalid snapshot was not reported."
+
+
+@pytest.mark.skipif(os.name != "posix", reason="The daemon uses Unix domain sockets")
+class TestDaemon:
+    @pytest.fixture
+    def store(self, tmp_path):
+        file_path = str(tmp_path / "habits.json")
+        shutil.copy("habits.json", file_path)
+        return file_path
+
+    @pytest.fixture
+    def daemon(self, store):
+        server = HabitDaemon(store)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        yield server
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+    def test_commands_are_forwarded_to_resident_store(self, store, daemon, capsys):
+        main.main(["--file_path", store, "complete", "Read", "--completion_datetime", "2030-01-01T08:00:00"])
+        assert "Read" in capsys.readouterr().out, "Forwarded command printed nothing."
+        resident = daemon.cli._habit_list
+        assert resident is not None and datetime(2030, 1, 1, 8) in resident.get("Read").completions, "Completion was not recorded in the daemon."
+
+        main.main(["--file_path", store, "--quiet", "longest_streak", "Read"])
+        assert "Welcome" not in capsys.readouterr().out, "Quiet flag was not forwarded."
+        assert daemon.cli._habit_list is resident, "Daemon reloaded a store it changed itself."
+        assert datetime(2030, 1, 1, 8) in load_info(store, verbose=False).get("Read").completions, "Completion was not persisted."
+
+    def test_changes_by_other_processes_are_reloaded(self, store, daemon, capsys):
+        main.main(["--file_path", store, "all_habits"])
+        habit_list = load_info(store, verbose=False)
+        habit_list.remove(habit_list.get("Read"))
+        save_info(habit_list, store, verbose=False)
+        main.main(["--file_path", store, "all_habits"])
+        assert "Read" not in capsys.readouterr().out.split("Total habits")[-1], "Daemon served a stale store."
+
+    def test_init_flags_apply_per_command(self, store, daemon, capsys):
+        main.main(["--file_path", store, "--quiet", "--cache", "streak", "Read"])
+        assert os.path.exists(data_storage.cache_path(store)), "Cache flag was not applied by the daemon."
+        os.remove(data_storage.cache_path(store))
+        main.main(["--file_path", store, "--quiet", "streak", "Read"])
+        assert not os.path.exists(data_storage.cache_path(store)), "Cache flag outlived its command."
+        assert daemon.run(["--file_path", store, "--profile_trace", "trace.jsonl", "all_habits"])["error"], "Profiled command was run by the daemon."
+
+    def test_errors_are_reported(self, store, daemon):
+        with pytest.raises(SystemExit) as error:
+            main.main(["--file_path", store, "streak", "Missing"])
+        assert "Habit not found" in str(error.value.code), "Command error was not reported."
+
+    def test_stale_socket_runs_command_locally(self, store, capsys):
+        open(data_storage.socket_path(store), "w").close()
+        main.main(["--file_path", store, "all_habits"])
+        assert "Total habits" in capsys.readouterr().out, "Command did not run without a daemon."
+        server = HabitDaemon(store) # Replaces the stale socket
+        server.server_close()
+        assert not os.path.exists(data_storage.socket_path(store)), "Socket was not removed on shutdown."
+
+
+class TestHTTPServer:
+    @pytest.fixture
+    def store(self, tmp_path):
+        file_path = str(tmp_path / "habits.json")
+        shutil.copy("habits.json", file_path)
+        return file_path
+
+    def test_reads_are_served_from_cache(self, store):
+        async def scenario():
+            habit_server = HabitServer(store)
+            await habit_server.start(port=0)
+            first = await habit_server.handle("GET", "/analytics/summary")
+            second = await habit_server.handle("GET", "/analytics/summary")
+            habit = await habit_server.handle("GET", "/habits/Read")
+            missing = await habit_server.handle("GET", "/habits/Missing")
+            wrong_method = await habit_server.handle("PUT", "/habits")
+            return habit_server, first, second, habit, missing, wrong_method
+
+        habit_server, first, second, habit, missing, wrong_method = asyncio.run(scenario())
+        assert first == second and first[0] == 200, "Summary was not served."
+        assert json.loads(first[1]) == habit_statistics(habit_server.habit_list), "Summary differs from the analytics module."
+        assert habit_server.counters["cache_hits"] == 1, "Repeated read was not served from the cache."
+        assert json.loads(habit[1])["longest_streak"] == calculate_longest_streak(habit_server.habit_list.get("Read")), "Habit streak is wrong."
+        assert missing[0] == 404 and wrong_method[0] == 405, "Errors were not reported."
+
+    def test_concurrent_completions_are_coalesced(self, store):
+        async def scenario():
+            habit_server = HabitServer(store)
+            server = await habit_server.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+
+            async def complete(index):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                body = json.dumps({"completion_datetime": f"2031-01-{index + 1:02d}T08:00:00"}).encode()
+                writer.write(b"POST /habits/Read/completions HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body))
+                response = await reader.read()
+                writer.close()
+                return response
+
+            before = await habit_server.handle("GET", "/habits/Read")
+            responses = await asyncio.gather(*(complete(index) for index in range(20)))
+            after = await habit_server.handle("GET", "/habits/Read")
+            invalid = await habit_server.handle("POST", "/habits/Read/completions", b'{"completion_datetime": "yesterday"}')
+            aware = await habit_server.handle("POST", "/habits/Read/completions", b'{"completion_datetime": "2031-02-01T08:00:00+02:00"}')
+            server.close()
+            return habit_server, before, after, responses, invalid, aware
+
+        habit_server, before, after, responses, invalid, aware = asyncio.run(scenario())
+        assert all(response.startswith(b"HTTP/1.1 201") for response in responses), "Completions were not accepted."
+        assert habit_server.counters["batches"] < 20, "Concurrent completions were not coalesced."
+        assert json.loads(after[1])["completion_count"] == json.loads(before[1])["completion_count"] + 20, "Cached read was not invalidated."
+        completions = load_info(store, verbose=False).get("Read").completions
+        assert all(datetime(2031, 1, day, 8) in completions for day in range(1, 21)), "Completions were not saved."
+        assert invalid[0] == 400, "Invalid completion datetime was accepted."
+        assert aware[0] == 400, "Completion datetime with a UTC offset was accepted."
+
+    def test_changes_of_other_processes_survive_compaction(self, store, monkeypatch):
+        monkeypatch.setattr(data_storage, "COMPACTION_THRESHOLD", 0) # Every batch rewrites the snapshot
+        async def scenario():
+            habit_server = HabitServer(store)
+            listener = await habit_server.start(port=0)
+            HabitTrackerCLI(store, quiet=True).create(TEST_HABIT_NAME, TEST_DESCRIPTION, TEST_START_DATE, TEST_PERIODICITY_DAILY)
+            completed = await habit_server.handle("POST", "/habits/Read/completions", b'{"completion_datetime": "2031-01-01T08:00:00"}')
+            habits = await habit_server.handle("GET", "/habits")
+            listener.close()
+            return completed, habits
+
+        completed, habits = asyncio.run(scenario())
+        assert completed[0] == 201 and json.loads(completed[1])["recorded"], "Completion was not saved."
+        assert TEST_HABIT_NAME in [habit["name"] for habit in json.loads(habits[1])], "Server did not reload the changed store."
+        habit_list = load_info(store, verbose=False)
+        assert habit_list.get(TEST_HABIT_NAME) is not None, "Compaction dropped a habit created by another process."
+        assert datetime(2031, 1, 1, 8) in habit_list.get("Read").completions, "Completion was not saved to the reloaded store."
+
+    def test_writer_failures_are_reported(self, store, monkeypatch):
+        def fail(*args):
+            raise RuntimeError("disk on fire")
+        monkeypatch.setattr(server, "append_completions", fail)
+        async def scenario():
+            habit_server = HabitServer(store)
+            listener = await habit_server.start(port=0)
+            failed = await asyncio.wait_for(habit_server.handle("POST", "/habits/Read/completions", b""), 5)
+            monkeypatch.undo()
+            saved = await asyncio.wait_for(habit_server.handle("POST", "/habits/Read/completions", b""), 5)
+            listener.close()
+            return failed, saved
+
+        failed, saved = asyncio.run(scenario())
+        assert failed[0] == 500, "Failed write was not reported."
+        assert saved[0] == 201, "Writer task stopped after a failed write."
+
+    def test_reads_see_changes_of_other_processes(self, store, monkeypatch):
+        monkeypatch.setattr(server, "RESPONSE_CACHE_SIZE", 2)
+        async def scenario():
+            habit_server = HabitServer(store)
+            listener = await habit_server.start(port=0)
+            before = await habit_server.handle("GET", "/habits")
+            HabitTrackerCLI(store, quiet=True).create(TEST_HABIT_NAME, TEST_DESCRIPTION, TEST_START_DATE, TEST_PERIODICITY_DAILY)
+            HabitTrackerCLI(store, quiet=True).complete("Read", "2031-01-01T08:00:00")
+            after = await habit_server.handle("GET", "/habits")
+            read = await habit_server.handle("GET", "/habits/Read/completions")
+            for index in range(5):
+                await habit_server.handle("GET", f"/habits?page={index}")
+            listener.close()
+            return habit_server, before, after, read
+
+        habit_server, before, after, read = asyncio.run(scenario())
+        assert TEST_HABIT_NAME not in before[1].decode() and TEST_HABIT_NAME in after[1].decode(), "Cached response outlived a change of the store."
+        assert "2031-01-01T08:00:00" in json.loads(read[1]), "Logged completion of another process was not served."
+        assert len(habit_server.cache) == 2, "Response cache was not bounded."
+
+
+class TestShards:
+    @pytest.fixture
+    def shards_dir(self, tmp_path):
+        for user, completion_count in [("alice", 300), ("bob", 50), ("carol", 120)]:
+            generate_store(str(tmp_path / f"{user}.json"), completion_count, habit_count=2, density=0.9, seed=len(user))
+        open(tmp_path / "alice.json.log", "w").close()
+        open(tmp_path / "notes.txt", "w").close()
+        return str(tmp_path)
+
+    def test_shard_paths(self, shards_dir):
+        assert list(shards.shard_paths(shards_dir)) == ["alice", "bob", "carol"], "Shards were not found."
+        assert shards.shard_path(shards_dir, "dave") == os.path.join(shards_dir, "dave.json"), "New user's store path is wrong."
+        with pytest.raises(ValueError):
+            shards.shard_path(shards_dir, "../alice")
+
+    def test_parallel_leaderboard_matches_serial(self, shards_dir):
+        serial = shards.leaderboard(shards_dir, workers=1)
+        assert shards.leaderboard(shards_dir, workers=3) == serial, "Process pool gave different results."
+        assert [row["completion_rate"] for row in serial] == sorted((row["completion_rate"] for row in serial), reverse=True), "Leaderboard is not ranked."
+        alice = next(row for row in serial if row["user"] == "alice")
+        habit_list = load_info(os.path.join(shards_dir, "alice.json"), verbose=False)
+        assert alice["longest_streak"] == max(calculate_longest_streak(habit) for habit in habit_list), "Longest streak is wrong."
+        assert alice["current_streak"] == max(streak_calc(habit) for habit in habit_list), "Current streak is wrong."
+        with pytest.raises(ValueError):
+            shards.leaderboard(shards_dir, sort_by="name")
+
+    def test_user_mode(self, tmp_path):
+        shards_dir = str(tmp_path / "shards")
+        HabitTrackerCLI(user="dave", shards_dir=shards_dir, quiet=True).create("Read", "Read a book", "now", "daily")
+        assert [habit.name for habit in load_info(os.path.join(shards_dir, "dave.json"), verbose=False)] == ["Read"], "Habit was not created in the user's shard."
+        rows = HabitTrackerCLI(shards_dir=shards_dir, quiet=True).leaderboard(sort_by="longest_streak")
+        assert len(rows) == 1 and "dave" in rows[0], "Leaderboard did not list the user."
+
+    def test_invalid_user_is_reported(self, tmp_path, capsys):
+        with pytest.raises(ValueError):
+            HabitTrackerCLI(user="../dave", shards_dir=str(tmp_path), quiet=True)
+        assert "Invalid user name" in capsys.readouterr().out, "Invalid user name was not reported."
+        for argv in (["--user", "../dave", "all_habits"], ["--user", "../dave", "all_habits", "--"]): # Dispatched directly, then through Fire
+            with pytest.raises(SystemExit) as error:
+                main.main(["--shards_dir", str(tmp_path), *argv])
+            assert error.value.code == 1 and "Invalid user name" in capsys.readouterr().out, "Invalid user name did not exit with an error."
+
+
+class TestAnalyticsCache:
+    @pytest.fixture
+    def cache(self, monkeypatch):
+        cache = analytics.AnalyticsCache(max_entries=100)
+        monkeypatch.setattr(analytics, "analytics_cache", cache)
+        monkeypatch.setattr(main, "analytics_cache", cache)
+        monkeypatch.setattr(habit_manager, "_change_hooks", [])
+        add_change_hook(cache.invalidate)
+        return cache
+
+    @pytest.fixture
+    def habit(self):
+        habit = Habit("Read", "Read a book", datetime.now() - timedelta(days=3), "daily")
+        for days_ago in (2, 1, 0):
+            habit.complete_habit(datetime.now() - timedelta(days=days_ago))
+        return habit
+
+    def test_hits_and_misses(self, cache, habit):
+        assert streak_calc(habit) == 3 and streak_calc(habit) == 3, "Cached streak is wrong."
+        assert (cache.hits, cache.misses) == (1, 1), "Repeated lookup was not a hit."
+
+    def test_changes_invalidate_results(self, cache, habit):
+        calculate_longest_streak(habit)
+        habit.complete_habit(datetime.now() + timedelta(days=1))
+        assert cache.entries == {}, "Completing the habit did not drop its cached results."
+        assert calculate_longest_streak(habit) == 4, "Stale longest streak was returned."
+        edit_habit(habit, periodicity="weekly")
+        assert calculate_longest_streak(habit) == 1 and cache.misses == 3, "Edited habit was served from the cache."
+
+    def test_habits_with_the_same_fields_do_not_share_results(self, cache, habit):
+        other = Habit("Read", "Read a book", habit.start_date, "daily")
+        other.completions = [datetime.now() - timedelta(days=days_ago) for days_ago in (9, 6, 3)]
+        assert streak_calc(habit) == 3 and streak_calc(other) == 0, "Results of another habit were returned."
+
+    def test_least_recently_used_results_are_evicted(self, cache, habit):
+        cache.max_entries = 4
+        habits = [Habit(f"Habit {index}", "", habit.start_date, "daily") for index in range(5)]
+        for other in habits:
+            streak_calc(other)
+        streak_calc(habits[1])
+        streak_calc(habits[0])
+        assert len(cache.entries) == 4 and cache.misses == 6, "Least recently used result was not evicted."
+
+    def test_cache_is_saved_next_to_the_store(self, cache, tmp_path):
+        file_path = str(tmp_path / "habits.json")
+        shutil.copy("habits.json", file_path)
+        first = HabitTrackerCLI(file_path, quiet=True, cache=True).completion_rates()
+        assert os.path.exists(data_storage.cache_path(file_path)), "Cache was not saved."
+
+        cache.clear()
+        assert HabitTrackerCLI(file_path, quiet=True, cache=True).completion_rates() == first, "Saved rates differ."
+        assert cache.misses == len(first) and cache.hits == len(first), "Saved results were not reused."
+
+    def test_saved_counters_are_not_counted_twice(self, cache, tmp_path, capsys):
+        file_path, source = str(tmp_path / "habits.json"), tmp_path / "script.txt"
+        shutil.copy("habits.json", file_path)
+        source.write_text("streak Read\nstreak Read\nstreak Read\ncache_stats\n")
+        HabitTrackerCLI(file_path, quiet=True, cache=True).batch(str(source))
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert records[3]["result"].startswith("Analytics cache: 2 hits, 1 misses"), "Saved counters were counted again."
+        assert json.loads(open(data_storage.cache_path(file_path)).read())["hits"] == 2, "Hits were not saved."
+
+    def test_saved_results_of_edited_completions_are_not_reused(self, cache, tmp_path):
+        file_path = str(tmp_path / "habits.json")
+        habit = Habit("Read", "Read a book", datetime(2024, 1, 1), "daily")
+        for day in (1, 2, 3):
+            habit.complete_habit(datetime(2024, 1, day, 8))
+        save_info(HabitCollection([habit]), file_path, verbose=False)
+        assert "is \x1b[37m3\x1b[32m days" in HabitTrackerCLI(file_path, quiet=True, cache=True).longest_streak("Read"), "Incorrect longest streak."
+
+        with open(file_path) as file:
+            data = json.load(file)
+        data["habits"][0]["completions"][-1] = "2024-02-03T08:00:00" # Edited by hand, same completion count
+        with open(file_path, "w") as file:
+            json.dump(data, file)
+        cache.clear()
+        assert "is \x1b[37m2\x1b[32m days" in HabitTrackerCLI(file_path, quiet=True, cache=True).longest_streak("Read"), "Saved result of other completions was reused."
+
+
+class TestWindowedAnalytics:
+    def brute_force(self, habit, start, end):
+        '''Recompute the windowed statistics from a full scan of the habit's completions.'''
+        in_window = sorted(completion for completion in habit.completions if start <= completion.date() <= end)
+        scanned = Habit(habit.name, habit.description, habit.start_date, habit.periodicity)
+        scanned.completions = in_window
+        return (
+            len(in_window),
+            scanned.current_streak(end) if in_window else 0,
+            scanned.longest_streak() if in_window else 0,
+        )
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_windows_agree_with_full_scans(self, seed):
+        rng = random.Random(seed)
+        start_date = datetime(2023, 1, 1)
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, start_date, rng.choice([TEST_PERIODICITY_DAILY, TEST_PERIODICITY_WEEKLY, INVALID_PERIODICITY]))
+        for _ in range(rng.randint(0, 150)): # Recorded out of order, so the sorted view is kept up to date by appends
+            habit.complete_habit(start_date + timedelta(days=rng.randint(0, 120), hours=rng.randint(0, 23)))
+        for _ in range(10):
+            start = (start_date + timedelta(days=rng.randint(-10, 130))).date()
+            end = start + timedelta(days=rng.randint(0, 60))
+            statistics = analytics.windowed_statistics(habit, start, end)
+            assert (statistics["completion_count"], statistics["current_streak"], statistics["longest_streak"]) == self.brute_force(habit, start, end), "Window differs from a full scan."
+            for period in analytics.PERIODS:
+                counts = analytics.completion_counts(habit, start, end, period)
+                assert sum(count for _, count in counts) == statistics["completion_count"], f"Counts per {period} do not add up."
+
+    def test_full_window_matches_lifetime_statistics(self):
+        habit = get_habit_by_name(load_info("habits.json"), "Read")
+        first = min(habit.completions).date()
+        statistics = analytics.windowed_statistics(habit, first, datetime.now().date())
+        assert statistics["completion_count"] == len(habit.completions), "Incorrect completion count."
+        assert statistics["longest_streak"] == calculate_longest_streak(habit), "Incorrect longest streak."
+        assert statistics["current_streak"] == streak_calc(habit), "Incorrect current streak."
+
+    def test_counts_per_period(self):
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2024, 1, 1), TEST_PERIODICITY_DAILY)
+        for day in (3, 1, 2, 10, 31):
+            habit.complete_habit(datetime(2024, 1, day, 9))
+        start, end = datetime(2023, 12, 30).date(), datetime(2024, 2, 2).date()
+        assert analytics.completion_counts(habit, start, end, "month") == [("2023-12", 0), ("2024-01", 5), ("2024-02", 0)], "Incorrect monthly counts."
+        assert analytics.completion_counts(habit, start, end, "week")[:3] == [("2023-W52", 0), ("2024-W01", 3), ("2024-W02", 1)], "Incorrect weekly counts."
+        assert analytics.completion_counts(habit, start, start + timedelta(days=3), "day") == [("2023-12-30", 0), ("2023-12-31", 0), ("2024-01-01", 1), ("2024-01-02", 1)], "Incorrect daily counts."
+        with pytest.raises(ValueError):
+            analytics.completion_counts(habit, start, end, "year")
+
+    def test_window_follows_changes(self):
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2024, 1, 1), TEST_PERIODICITY_DAILY)
+        for day in (1, 2, 3):
+            habit.complete_habit(datetime(2024, 1, day))
+        habit.complete_habit(datetime(2023, 12, 31))
+        del habit.completions[2] # The backfilled completion was inserted first
+        window = analytics.window_day_ordinals(habit, datetime(2023, 12, 1).date(), datetime(2024, 1, 31).date())
+        assert window == [datetime(2023, 12, 31).toordinal(), datetime(2024, 1, 1).toordinal(), datetime(2024, 1, 3).toordinal()], "Window is stale."
+
+    def test_window_command(self, capsys):
+        cli = HabitTrackerCLI(quiet=True)
+        result = cli.window("Read", start="2023-01-01", end="2023-12-31", period="month")
+        assert len(result) == 13 and "Read" in result[0], "Incorrect window output."
+        assert cli.window("Read", start="2023-12-31", end="2023-01-01") is None, "Reversed range was accepted."
+        assert cli.window("Read", start="yesterday") is None, "Invalid date was accepted."
+        assert cli.window("Missing") is None, "Missing habit was accepted."
+
+    def test_window_endpoint(self):
+        async def scenario():
+            habit_server = HabitServer("habits.json")
+            window = await habit_server.handle("GET", "/habits/Read/window?start=2023-01-01&end=2023-03-31&period=month")
+            invalid = await habit_server.handle("GET", "/habits/Read/window?period=year")
+            return habit_server, window, invalid
+
+        habit_server, window, invalid = asyncio.run(scenario())
+        start, end = datetime(2023, 1, 1).date(), datetime(2023, 3, 31).date()
+        expected = analytics.windowed_statistics(habit_server.habit_list.get("Read"), start, end)
+        expected["counts"] = dict(analytics.completion_counts(habit_server.habit_list.get("Read"), start, end, "month"))
+        assert window[0] == 200 and json.loads(window[1]) == expected, "Incorrect window response."
+        assert invalid[0] == 400, "Invalid period was accepted."
+
+
+class TestRollups:
+    def bucket_counts(self, rollups):
+        '''Return the non-zero counts of every period, keyed by period number.'''
+        buckets = {}
+        for period in habit_manager.PERIODS:
+            start, counts = rollups.counts(period)
+            buckets[period] = {start + offset: count for offset, count in enumerate(counts) if count}
+        return buckets
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_incremental_rollups_match_a_recount(self, seed):
+        rng = random.Random(seed)
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2023, 1, 1), TEST_PERIODICITY_DAILY)
+        habit.rollups # Built before the completions, so every completion below is counted incrementally
+        for _ in range(rng.randint(0, 100)):
+            habit.complete_habit(datetime(2023, 1, 1) + timedelta(days=rng.randint(-60, 400), hours=rng.randint(0, 23)))
+        assert self.bucket_counts(habit.rollups) == self.bucket_counts(habit_manager.Rollups(habit.completions.day_ordinals())), "Rollups differ from a recount."
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_counts_per_period_agree_with_full_scans(self, seed):
+        rng = random.Random(seed)
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2023, 1, 1), TEST_PERIODICITY_WEEKLY)
+        habit.completions = [datetime(2023, 1, 1) + timedelta(days=rng.randint(0, 200)) for _ in range(rng.randint(0, 80))]
+        start = datetime(2023, 1, 1).date() + timedelta(days=rng.randint(-20, 150))
+        end = start + timedelta(days=rng.randint(0, 90))
+        for period in habit_manager.PERIODS:
+            expected = {}
+            for completion in habit.completions:
+                if start <= completion.date() <= end:
+                    label = habit_manager.period_label(habit_manager.period_index(completion.toordinal(), period), period)
+                    expected[label] = expected.get(label, 0) + 1
+            counts = analytics.completion_counts(habit, start, end, period)
+            assert {label: count for label, count in counts if count} == expected, f"Counts per {period} differ from a full scan."
+
+    def test_rollups_are_persisted_with_json_stores(self, tmp_path):
+        file_path = str(tmp_path / "habits.json")
+        save_info(load_info("habits.json", verbose=False), file_path, verbose=False)
+        HabitTrackerCLI(file_path, quiet=True).complete("Read", "2023-07-24T08:00:00") # Logged, then counted on load
+        habit = load_info(file_path, verbose=False).get("Read")
+        counts = analytics.completion_counts(habit, datetime(2023, 6, 1).date(), datetime(2023, 7, 31).date(), "month")
+        assert counts == [("2023-06", 9), ("2023-07", 24)], "Incorrect monthly counts."
+        assert not habit.completions.is_decoded, "Rollups were recomputed from completions."
+
+    def test_rollups_are_persisted_with_sqlite_stores(self, tmp_path):
+        db_path = str(tmp_path / "habits.db")
+        HabitTrackerCLI(quiet=True).export(db_path)
+        HabitTrackerCLI(db_path, quiet=True).complete("Read", "2023-07-24T08:00:00")
+        habit = load_info(db_path, verbose=False).get("Read")
+        assert habit.rollups.completion_count == len(habit.completions), "Rollups were not updated with the completion."
+        assert habit.rollups.count("month", 2023 * 12 + 6) == 24 and not habit.completions.is_decoded, "Rollups were not read from the database."
+
+    def test_heatmap_and_report(self):
+        cli = HabitTrackerCLI(quiet=True)
+        heatmap = analytics.completion_heatmap(cli.habit_list.get("Read"), datetime(2023, 7, 23).date(), weeks=6)
+        assert heatmap["start"] == "2023-06-12" and heatmap["weeks"][0] == [0] * 7 and heatmap["weeks"][1] == [0, 0, 0, 1, 1, 1, 1], "Incorrect heatmap."
+        assert len(cli.heatmap("Read", weeks=6, end="2023-07-23")) == 8, "Incorrect heatmap output."
+        labels, rows = analytics.period_report(cli.habit_list, "month", 2, today=datetime(2023, 7, 1).date())
+        assert labels == ["2023-06", "2023-07"] and rows[0] == {"habit_name": "Read", "counts": [9, 23]}, "Incorrect report."
+        assert len(cli.report("week", 4)) == len(cli.habit_list) + 1, "Incorrect report output."
+        assert cli.report("year") is None and cli.heatmap("Read", weeks=0) is None, "Invalid arguments were accepted."
+
+    def test_heatmap_and_report_endpoints(self):
+        async def scenario():
+            habit_server = HabitServer("habits.json")
+            heatmap = await habit_server.handle("GET", "/habits/Read/heatmap?weeks=6&end=2023-07-23")
+            report = await habit_server.handle("GET", "/analytics/report?period=month&periods=3")
+            invalid = await habit_server.handle("GET", "/analytics/report?period=year")
+            return heatmap, report, invalid
+
+        heatmap, report, invalid = asyncio.run(scenario())
+        assert heatmap[0] == 200 and len(json.loads(heatmap[1])["weeks"]) == 6, "Incorrect heatmap response."
+        assert report[0] == 200 and len(json.loads(report[1])["periods"]) == 3, "Incorrect report response."
+        assert invalid[0] == 400, "Invalid period was accepted."
+
+
+class TestProfiling:
+    @pytest.fixture
+    def store(self, tmp_path):
+        file_path = str(tmp_path / "habits.json")
+        shutil.copy("habits.json", file_path)
+        return file_path
+
+    def test_summary_is_printed_with_the_profile_flag(self, store, capsys):
+        main.main(["--quiet", "--profile", "--file_path", store, "summary"])
+        summary = capsys.readouterr().err
+        assert "read_snapshot" in summary and "habit_statistics" in summary and "habits_loaded" in summary, "Phases were not reported."
+        assert not profiling.profiler.enabled and profiling.profiler.phases == {}, "Profiler was not reset."
+
+    def test_trace_lines_are_appended_per_invocation(self, store, tmp_path, monkeypatch):
+        trace_path = str(tmp_path / "trace.jsonl")
+        monkeypatch.setenv(profiling.TRACE_ENV, trace_path)
+        main.main(["--quiet", "--file_path", store, "complete", "Read", "--completion_datetime", "2023-08-01T07:00:00"])
+        main.main(["--quiet", "--file_path", store, "streak", "Read"])
+        with open(trace_path) as trace:
+            complete, streak = [json.loads(line) for line in trace]
+        assert "command/append" in complete["phases"] and complete["counters"]["completions_appended"] == 1, "Append was not traced."
+        assert complete["counters"]["bytes_written"] == os.path.getsize(log_path(store)), "Incorrect bytes written."
+        assert streak["argv"][-2:] == ["streak", "Read"] and "command/load/replay_log" in streak["phases"], "Load was not traced."
+        assert streak["counters"]["bytes_read"] == os.path.getsize(store) + os.path.getsize(log_path(store)), "Incorrect bytes read."
+        assert streak["counters"]["log_events_replayed"] == 1, "Replayed events were not counted."
+
+    def test_cprofile_dump(self, store, tmp_path):
+        dump_path = str(tmp_path / "profile.out")
+        main.main(["--quiet", "--profile_dump", dump_path, "--file_path", store, "completion_rates"])
+        functions = {function for _, _, function in pstats.Stats(dump_path).stats}
+        assert "load_info" in functions and "calculate_completion_rates" in functions, "cProfile dump is incomplete."
+
+    def test_nothing_is_recorded_by_default(self, store):
+        HabitTrackerCLI(store, quiet=True).summary()
+        assert profiling.profiler.phases == {} and profiling.profiler.counters == {}, "Disabled profiler recorded data."
+        HabitTrackerCLI(store, quiet=True, profile=True, profile_dump=str(store) + ".out").summary()
+        assert not profiling.profiler.enabled, "Profiler was enabled outside of main."
+
+    def test_profile_options_of_fire_command_lines(self):
+        options = main.profile_options(["--profile", "--profile-trace=-", "--profile_dump", "out", "summary", "--"])
+        assert options == {"summary": True, "trace_path": "-", "dump_path": "out"}, "Profile options were not found."
+        assert main.profile_options(["--profile=False", "summary"]) == {"summary": False}, "Disabled profile option was not read."
+
+
+def reference_streak_calc(habit):
+    '''The current streak from a walk backwards from today: over completions, or over ISO weeks for weekly habits.'''
+    current_date = datetime.now().date()
+    current_streak = 0
+    if habit.periodicity == "weekly":
+        current_week = current_date - timedelta(days=current_date.weekday())
+        for week in sorted({completion.date() - timedelta(days=completion.weekday()) for completion in habit.completions}, reverse=True):
+            if (current_week - week).days > 7:
+                break
+            current_streak += 1
+            current_week = week
+        return current_streak
+    streak_increment = 1 if habit.periodicity == "daily" else 7
+    for completion_date in reversed(list(habit.completions)):
+        if (current_date - completion_date.date()).days > streak_increment:
+            break
+        current_streak += 1
+        current_date = completion_date.date()
+    return current_streak
+
+
+def reference_longest_streak(habit):
+    '''The longest streak from a sort of the completions: days exactly one apart, or consecutive ISO weeks for weekly habits.'''
+    longest_streak = current_streak = 1
+    completions = sorted(habit.completions)
+    if habit.periodicity == "weekly":
+        weeks = sorted({completion.date() - timedelta(days=completion.weekday()) for completion in completions})
+        for i in range(1, len(weeks)):
+            current_streak = current_streak + 1 if weeks[i] - weeks[i - 1] == timedelta(days=7) else 1
+            longest_streak = max(longest_streak, current_streak)
+        return longest_streak
+    for i in range(1, len(completions)):
+        if habit.periodicity == "daily" and completions[i].date() - completions[i - 1].date() == timedelta(days=1):
+            current_streak += 1
+        else:
+            current_streak = 1
+        longest_streak = max(longest_streak, current_streak)
+    return longest_streak
+
+
+class TestSortedCompletions:
+    def random_completions(self, rng):
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return [today - timedelta(days=rng.randint(0, 60), hours=rng.randint(0, 23), minutes=rng.randint(0, 59)) for _ in range(rng.randint(0, 50))]
+
+    @pytest.mark.parametrize("seed", range(50))
+    def test_backfilled_completions_match_reference(self, seed):
+        rng = random.Random(seed)
+        periodicity = rng.choice([TEST_PERIODICITY_DAILY, TEST_PERIODICITY_WEEKLY, INVALID_PERIODICITY])
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime.now() - timedelta(days=90), periodicity)
+        completions = self.random_completions(rng)
+        for completion in completions:
+            assert habit.complete_habit(completion), "Completion was not recorded."
+        timestamps = list(habit.completions.timestamps)
+        assert timestamps == sorted(timestamps), "Completions are out of order."
+        assert list(habit.completions) == sorted(completions), "Completions were lost."
+        assert streak_calc(habit) == reference_streak_calc(habit), "Current streak differs from the reference."
+        assert calculate_longest_streak(habit) == reference_longest_streak(habit), "Longest streak differs from the reference."
+        assert habit.statistics == habit._compute_statistics(), "Incremental statistics differ from a full recomputation."
+
+    @pytest.mark.parametrize("seed", range(50))
+    def test_deduplicated_completions_match_reference(self, seed):
+        rng = random.Random(seed)
+        periodicity = rng.choice([TEST_PERIODICITY_DAILY, TEST_PERIODICITY_WEEKLY])
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime.now() - timedelta(days=90), periodicity, dedupe=True)
+        completions = self.random_completions(rng)
+        periods = {}
+        for completion in completions:
+            period = completion.date().isocalendar()[:2] if periodicity == TEST_PERIODICITY_WEEKLY else completion.date()
+            assert habit.complete_habit(completion) == (period not in periods), "Duplicate completion was not detected."
+            periods.setdefault(period, completion)
+        assert list(habit.completions) == sorted(periods.values()), "Incorrect deduplicated completions."
+        expected = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, habit.start_date, periodicity)
+        expected.completions = sorted(periods.values())
+        assert streak_calc(habit) == reference_streak_calc(expected), "Current streak differs from the reference."
+        assert calculate_longest_streak(habit) == reference_longest_streak(expected), "Longest streak differs from the reference."
+
+    def test_turning_on_dedupe_removes_duplicates(self):
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2024, 1, 1), TEST_PERIODICITY_DAILY)
+        for completion in (datetime(2024, 1, 2, 20), datetime(2024, 1, 2, 8), datetime(2024, 1, 3, 9), datetime(2024, 1, 9, 9)):
+            habit.complete_habit(completion)
+        edit_habit(habit, dedupe=True)
+        assert list(habit.completions) == [datetime(2024, 1, 2, 8), datetime(2024, 1, 3, 9), datetime(2024, 1, 9, 9)], "Duplicates were not removed."
+        edit_habit(habit, periodicity=TEST_PERIODICITY_WEEKLY)
+        assert list(habit.completions) == [datetime(2024, 1, 2, 8), datetime(2024, 1, 9, 9)], "Duplicates in the new period were not removed."
+        assert not habit.complete_habit(datetime(2024, 1, 14)), "Duplicate completion was recorded."
+
+    def test_edited_completions_refresh_statistics(self):
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2024, 1, 1), TEST_PERIODICITY_DAILY)
+        for day in range(1, 5):
+            habit.complete_habit(datetime(2024, 1, day, 8))
+        version = habit.version
+        assert habit.longest_streak() == 4 and habit.rollups.count("day", habit_manager.period_index(date(2024, 1, 3).toordinal(), "day")) == 1
+        habit.completions[2] = datetime(2024, 3, 1)
+        assert habit.version != version, "Editing a completion did not change the version."
+        assert habit.statistics == habit._compute_statistics() and habit.longest_streak() == 2, "Statistics are stale after an edit."
+        assert habit.rollups.count("day", habit_manager.period_index(date(2024, 1, 3).toordinal(), "day")) == 0, "Rollups are stale after an edit."
+        del habit.completions[0]
+        habit.complete_habit(datetime(2024, 3, 2, 8))
+        assert habit.statistics == habit._compute_statistics(), "Statistics are stale after a deletion."
+        assert habit.rollups.counts("day") == habit_manager.Rollups(habit.completions.day_ordinals()).counts("day"), "Rollups are stale after a deletion."
+
+    def test_completions_keep_their_order(self):
+        completions = habit_manager.Completions([datetime(2024, 1, 3), datetime(2024, 1, 1)])
+        with pytest.raises(TypeError):
+            completions.insert(0, datetime(2024, 1, 5))
+        with pytest.raises(TypeError):
+            completions.reverse()
+        completions += [datetime(2024, 1, 2)]
+        completions[0] = datetime(2024, 1, 4)
+        assert list(completions) == [datetime(2024, 1, 2), datetime(2024, 1, 3), datetime(2024, 1, 4)], "Completions are out of order."
+
+    @pytest.mark.parametrize("file_name", ["habits.json", "habits.db", "habits.hbin"])
+    def test_dedupe_is_persisted(self, tmp_path, file_name):
+        file_path = str(tmp_path / file_name)
+        cli = HabitTrackerCLI(file_path, quiet=True)
+        cli.create("Stretch", "Stretch once a day", "2024-01-01", TEST_PERIODICITY_DAILY, dedupe=True)
+        cli.complete("Stretch", "2024-01-02T08:00:00")
+        HabitTrackerCLI(file_path, quiet=True).complete("Stretch", "2024-01-02T20:00:00")
+        habit = load_info(file_path, verbose=False).get("Stretch")
+        assert habit.dedupe and habit.completions == [datetime(2024, 1, 2, 8)], "Deduplication was not persisted."
+
+    def test_sqlite_stores_without_the_dedupe_column_are_migrated(self, tmp_path):
+        db_path = str(tmp_path / "habits.db")
+        with sqlite3.connect(db_path) as connection:
+            connection.execute("CREATE TABLE habits (id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT NOT NULL, start_date TEXT NOT NULL, periodicity TEXT NOT NULL)")
+            connection.execute("INSERT INTO habits VALUES (1, 'Read', 'Read a book', '2024-01-01T00:00:00', 'daily')")
+        connection.close()
+        habit = load_info(db_path, verbose=False).get("Read")
+        assert habit is not None and not habit.dedupe, "Store without the dedupe column was not migrated."
+
+
+class TestDirectoryStore:
+    @pytest.fixture
+    def store(self, tmp_path):
+        directory = str(tmp_path / "store") + os.sep
+        HabitTrackerCLI("habits.json", quiet=True).export(directory)
+        return directory
+
+    def file_states(self, directory):
+        return {entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size) for entry in os.scandir(directory)}
+
+    def test_export_round_trip_is_lossless(self, store, tmp_path):
+        exported_path = str(tmp_path / "exported.json")
+        HabitTrackerCLI(store, quiet=True).export(exported_path)
+        original = [habit.to_dictionary() for habit in load_info("habits.json", verbose=False)]
+        assert [habit.to_dictionary() for habit in load_info(exported_path, verbose=False)] == original, "Directory round trip lost data."
+        assert len(os.listdir(store)) == 2 * len(original) + 1, "Expected a manifest plus one file and log per habit."
+
+    def test_lookups_read_a_single_habit(self, store):
+        cli = HabitTrackerCLI(store, quiet=True)
+        assert cli.streak("Read") == HabitTrackerCLI("habits.json", quiet=True).streak("Read"), "Directory streak differs from JSON streak."
+        assert len(cli.habit_list.files) == 1, "Streak read more than one habit."
+
+    def test_complete_appends_to_one_habit_log(self, store):
+        before = self.file_states(store)
+        HabitTrackerCLI(store, quiet=True).complete("Yoga", "2023-08-01T07:00:00")
+        after = self.file_states(store)
+        changed = {name for name in after if after[name] != before.get(name)}
+        habit_file = directory_storage.read_manifest(store)["habits"][1]["file"]
+        assert changed == {habit_file + ".log"}, "Completing a habit touched other files."
+        assert datetime(2023, 8, 1, 7) in load_info(store, verbose=False).get("Yoga").completions, "Completion was not saved."
+
+    def test_edit_rewrites_only_the_changed_habit(self, store):
+        before = self.file_states(store)
+        HabitTrackerCLI(store, quiet=True).edit("Yoga", description="20 minutes")
+        after = self.file_states(store)
+        habit_file = directory_storage.read_manifest(store)["habits"][1]["file"]
+        assert {name for name in after if after[name] != before.get(name)} == {habit_file, habit_file + ".log"}, "Edit rewrote other habits."
+        HabitTrackerCLI(store, quiet=True).edit("Yoga", name="Stretching")
+        habit_list = load_info(store, verbose=False)
+        assert habit_list.get("Stretching").description == "20 minutes" and habit_list.get("Yoga") is None, "Rename was not saved."
+        assert [habit.name for habit in habit_list][:3] == ["Read", "Stretching", "Gratitude Journaling"], "Habit order changed."
+
+    def test_create_and_delete(self, store):
+        cli = HabitTrackerCLI(store, quiet=True)
+        cli.create("Nap", "Take a nap", "2024-01-01", TEST_PERIODICITY_DAILY)
+        assert len(cli.habit_list.files) == 1, "Creating a habit read other habits."
+        HabitTrackerCLI(store, quiet=True).delete("Nap", "Read")
+        habit_list = load_info(store, verbose=False)
+        assert habit_list.get("Nap") is None and habit_list.get("Read") is None and len(habit_list) == 6, "Habits were not deleted."
+        assert len(os.listdir(store)) == 2 * 6 + 1, "Files of deleted habits were left behind."
+
+    def test_habit_log_is_compacted(self, store, monkeypatch):
+        monkeypatch.setattr(directory_storage, "COMPACTION_THRESHOLD", 200)
+        for day in range(1, 11):
+            HabitTrackerCLI(store, quiet=True).complete("Yoga", f"2023-09-{day:02d}T07:00:00")
+        habit_file = directory_storage.read_manifest(store)["habits"][1]["file"]
+        assert os.path.getsize(os.path.join(store, habit_file + ".log")) < 200, "Habit log was not compacted."
+        assert len(load_info(store, verbose=False).get("Yoga").completions) == len(load_info("habits.json", verbose=False).get("Yoga").completions) + 10, "Completions were lost during compaction."
+
+    def test_unreadable_habit_files_are_reported(self, store, capsys):
+        habits = directory_storage.read_manifest(store)["habits"]
+        with open(os.path.join(store, habits[0]["file"]), "w") as file:
+            file.write("{not json")
+        os.remove(os.path.join(store, habits[1]["file"]))
+        habit_list = load_info(store, verbose=False)
+        assert habit_list.get("Read") is None and habit_list.get("Yoga") is None, "Unreadable habits were returned."
+        assert capsys.readouterr().out.count("failed to decode JSON data") == 2, "Unreadable habit files were not reported."
+        assert [habit.name for habit in habit_list] == [habit["name"] for habit in habits[2:]], "Readable habits were not loaded."
+        HabitTrackerCLI(store, quiet=True).edit("Meditation", description="10 minutes")
+        assert directory_storage.read_manifest(store)["habits"] == habits, "Unreadable habits were dropped from the manifest."
+
+
+class TestDueHabits:
+    def brute_force_due(self, habit_list, today, within):
+        due = [(habit.due_ordinal(), index, habit) for index, habit in enumerate(habit_list)]
+        return [(habit, due_ordinal) for due_ordinal, _, habit in sorted(due, key=lambda entry: entry[:2]) if due_ordinal <= today.toordinal() + within]
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_queue_follows_changes(self, seed):
+        rng = random.Random(seed)
+        today = datetime.now().date()
+        habit_list = HabitCollection()
+        for index in range(30):
+            habit = Habit(f"habit {index}", TEST_DESCRIPTION, datetime.now() - timedelta(days=rng.randint(-3, 60)), rng.choice([TEST_PERIODICITY_DAILY, TEST_PERIODICITY_WEEKLY]))
+            for _ in range(rng.randint(0, 5)):
+                habit.complete_habit(datetime.now() - timedelta(days=rng.randint(0, 30)))
+            habit_list.append(habit)
+        for _ in range(20):
+            within = rng.randint(0, 7)
+            assert habit_list.due(today, within) == self.brute_force_due(habit_list, today, within), "Due queue differs from a full scan."
+            habit = rng.choice(list(habit_list))
+            action = rng.randrange(4)
+            if action == 0:
+                habit.complete_habit(datetime.now() - timedelta(days=rng.randint(0, 3)))
+            elif action == 1:
+                edit_habit(habit, periodicity=rng.choice([TEST_PERIODICITY_DAILY, TEST_PERIODICITY_WEEKLY]), habit_list=habit_list)
+            elif action == 2:
+                delete_habit(habit_list, habit)
+            else:
+                habit_list.append(Habit(f"new habit {rng.random()}", TEST_DESCRIPTION, datetime.now() - timedelta(days=rng.randint(0, 10)), TEST_PERIODICITY_DAILY))
+
+    def test_queue_stays_bounded(self):
+        habits = [Habit(f"habit {index}", TEST_DESCRIPTION, datetime(2024, 1, 1), TEST_PERIODICITY_DAILY) for index in range(5)]
+        habit_list = HabitCollection(habits)
+        habit_list.due(date(2024, 2, 1))
+        for day in range(1, 29):
+            for habit in habits:
+                habit.complete_habit(datetime(2024, 1, day, 8))
+        assert len(habit_list._due) <= 2 * len(habit_list), "Due queue grew with every change."
+        delete_habit(habit_list, habits.pop())
+        assert all(entry[3] in habit_list for entry in habit_list._due), "Due queue kept a removed habit."
+        assert habit_list.due(date(2024, 2, 1)) == self.brute_force_due(habit_list, date(2024, 2, 1), 0), "Due queue differs from a full scan."
+
+    def test_clear_resets_the_queue(self):
+        habit = Habit(TEST_HABIT_NAME, TEST_DESCRIPTION, datetime(2024, 1, 1), TEST_PERIODICITY_DAILY)
+        habit_list = HabitCollection([habit])
+        habit_list.due(date(2024, 2, 1))
+        habit_list.clear()
+        habit_list.append(habit)
+        habit.complete_habit(datetime(2024, 1, 2, 8)) # Notifies the change hooks while the queue is not built
+        assert habit_list.due(date(2024, 2, 1)) == [(habit, date(2024, 1, 3).toordinal())], "Due queue was not rebuilt after clear."
+
+    def test_due_statuses(self):
+        today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        kept = Habit("Kept", TEST_DESCRIPTION, today - timedelta(days=10), TEST_PERIODICITY_DAILY)
+        at_risk = Habit("At risk", TEST_DESCRIPTION, today - timedelta(days=10), TEST_PERIODICITY_DAILY)
+        missed = Habit("Missed", TEST_DESCRIPTION, today - timedelta(days=10), TEST_PERIODICITY_WEEKLY)
+        for days_ago in (3, 2, 1, 0):
+            kept.complete_habit(today - timedelta(days=days_ago))
+        for days_ago in (2, 1):
+            at_risk.complete_habit(today - timedelta(days=days_ago))
+        missed.complete_habit(today - timedelta(days=15)) # Two ISO weeks ago at least, whatever the day of the week
+        rows = analytics.due_habits(HabitCollection([kept, at_risk, missed]), today.date())
+        assert [(row["habit_name"], row["status"], row["current_streak"]) for row in rows] == [("Missed", "overdue", 0), ("At risk", "at_risk", 2)], "Incorrect due habits."
+        assert analytics.due_habits([kept, at_risk, missed], today.date(), within=1)[-1]["habit_name"] == "Kept", "Habits due tomorrow were not included."
+
+    def test_due_command_and_endpoint(self, capsys):
+        result = HabitTrackerCLI(quiet=True).due()
+        assert len(result) == 7 and all("overdue since" in line for line in result), "Incorrect due output."
+        assert HabitTrackerCLI(quiet=True).due(within=-1) is None, "Negative number of days was accepted."
+
+        async def scenario():
+            habit_server = HabitServer("habits.json")
+            return await habit_server.handle("GET", "/analytics/due?within=2"), await habit_server.handle("GET", "/analytics/due?within=x")
+
+        due, invalid = asyncio.run(scenario())
+        assert due[0] == 200 and len(json.loads(due[1])) == 7, "Due habits were not served."
+        assert invalid[0] == 400, "Invalid number of days was accepted."
+
+
+class TestParsedStoreCache:
+    @pytest.fixture(autouse=True)
+    def setup_store(self, tmp_path, monkeypatch):
+        self.file_path = str(tmp_path / "habits.json")
+        self.cache_path = data_storage.parsed_cache_path(self.file_path)
+        shutil.copyfile("habits.json", self.file_path)
+        monkeypatch.setattr(data_storage, "PARSED_CACHE_THRESHOLD", 0) # Cache the small test store too
+        self.parses = []
+        monkeypatch.setattr(data_storage, "read_json_snapshot", lambda file: self.parses.append(file) or read_json_snapshot(file))
+
+    def loaded_state(self, habit_list):
+        return [(habit.to_dictionary(), habit.statistics) for habit in habit_list]
+
+    def test_warm_load_matches_json(self):
+        cold = load_info(self.file_path)
+        assert os.path.exists(self.cache_path) and len(self.parses) == 1, "Parsed copy was not written."
+        warm = load_info(self.file_path)
+        assert len(self.parses) == 1, "Snapshot was parsed although the parsed copy was up to date."
+        assert self.loaded_state(warm) == self.loaded_state(cold), "Parsed copy differs from the snapshot."
+        assert analytics.period_report(warm, "week", 8) == analytics.period_report(cold, "week", 8), "Rollups differ."
+
+    def test_completion_log_is_replayed_on_parsed_copy(self):
+        habit_list = load_info(self.file_path)
+        get_habit_by_name(habit_list, "Read").complete_habit(datetime(2023, 8, 1, 7))
+        data_storage.append_completion(habit_list, "Read", datetime(2023, 8, 1, 7), self.file_path)
+        for _ in range(2):
+            assert get_habit_by_name(load_info(self.file_path), "Read").completions[-1] == datetime(2023, 8, 1, 7), "Logged completion was lost."
+        assert len(self.parses) == 1, "Appending to the log invalidated the parsed copy."
+
+    def test_changed_snapshot_invalidates_parsed_copy(self):
+        habit_list = load_info(self.file_path)
+        delete_habit(habit_list, get_habit_by_name(habit_list, "Read"))
+        save_info(habit_list, self.file_path)
+        assert get_habit_by_name(load_info(self.file_path), "Read") is None and len(self.parses) == 2, "Saved changes were not picked up."
+
+        with open(self.file_path, "r") as file: # Same size and modification time, different content
+            content = file.read()
+        status = os.stat(self.file_path)
+        with open(self.file_path, "w") as file:
+            file.write(content.replace('"Yoga"', '"Yogi"'))
+        os.utime(self.file_path, ns=(status.st_atime_ns, status.st_mtime_ns))
+        assert get_habit_by_name(load_info(self.file_path), "Yogi") is not None and len(self.parses) == 3, "Edited snapshot was not detected by its hash."
+
+    def test_warm_load_reports_renamed_habits(self, capsys):
+        habit_list = load_info(self.file_path, verbose=False)
+        save_info(list(habit_list) + [Habit("Read", NEW_DESCRIPTION, datetime(2022, 1, 1), TEST_PERIODICITY_WEEKLY)], self.file_path, verbose=False)
+        capsys.readouterr()
+        for _ in range(2): # Parsed from the snapshot, then loaded from the parsed copy
+            assert get_habit_by_name(load_info(self.file_path, verbose=False), "Read (2)") is not None, "Duplicate habit was not renamed."
+            assert "Several habits are named Read" in capsys.readouterr().out, "Rename was not reported."
+        assert len(self.parses) == 2, "Parsed copy was not used."
+
+    def test_corrupt_parsed_copy_is_rewritten(self):
+        load_info(self.file_path)
+        with open(self.cache_path, "r+b") as file:
+            file.truncate(os.path.getsize(self.cache_path) // 2)
+        assert len(load_info(self.file_path)) == 7 and len(self.parses) == 2, "Truncated parsed copy was used."
+        load_info(self.file_path)
+        assert len(self.parses) == 2, "Parsed copy was not rewritten."